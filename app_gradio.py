@@ -1,5 +1,6 @@
 import gradio as gr
 import os
+import threading
 from rag_agent import RAGAgent
 from config import MODEL_NAME, VECTOR_DB_PATH
 
@@ -19,16 +20,37 @@ def initialize_agent():
 
 # 全局变量存储agent实例
 agent = None
+agent_lock = threading.Lock()
 
-def chat_function(message, history):
+def get_agent():
+    """获取agent实例；预热线程与首次请求共用同一把锁，避免重复初始化"""
     global agent
-    
-    # 第一次调用时初始化
+    with agent_lock:
+        if agent is None:
+            agent_instance, status_msg = initialize_agent()
+            if agent_instance is None:
+                return None, status_msg
+            agent = agent_instance
+        return agent, "系统初始化成功"
+
+def warm_up():
+    """后台预热：初始化agent、加载索引并完成一次查询embedding"""
+    agent_instance, status_msg = get_agent()
+    if agent_instance is None:
+        print(f"预热失败: {status_msg}")
+        return
+    try:
+        agent_instance.vector_store.warm_up()
+        if agent_instance.reranker is not None:
+            agent_instance.reranker.ensure_loading()
+    except Exception as e:
+        print(f"预热索引失败: {str(e)}")
+
+def chat_function(message, history):
+    # 第一次调用时初始化（若预热尚未完成则等待）
+    agent, status_msg = get_agent()
     if agent is None:
-        agent_instance, status_msg = initialize_agent()
-        if agent_instance is None:
-            return f"系统错误: {status_msg}"
-        agent = agent_instance
+        return f"系统错误: {status_msg}"
     
     try:
         # 转换历史格式为 list of dicts
@@ -67,5 +89,6 @@ with gr.Blocks(title="智能课程助教", theme=gr.themes.Soft()) as demo:
     )
 
 if __name__ == "__main__":
+    threading.Thread(target=warm_up, daemon=True).start()
     demo.launch(server_name="0.0.0.0", server_port=7860, share=False)
 
@@ -0,0 +1,351 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from config import (
+    TOP_K,
+    BATCH_QA_CONCURRENCY,
+    BATCH_QA_RETRIES,
+    BATCH_QA_RETRIEVAL_BATCH,
+    BATCH_QA_MAX_TOKENS,
+)
+from courses import ALL_COURSES, CourseRouter
+from faq import sources_from_results
+
+
+_NO_CONTEXT = "（未检索到特别相关的课程材料）"
+
+
+def read_questions(path: str) -> Iterator[Dict[str, Any]]:
+    """读取问题文件：每行 {"id": ..., "question": "...", "course": 可选, "history": 可选}
+
+    没有id时以行号作为id；question 也可写作 query。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            question = (item.get("question") or item.get("query") or "").strip()
+            if not question:
+                print(f"第 {line_no} 行没有问题，跳过")
+                continue
+            item["id"] = str(item.get("id", line_no))
+            item["question"] = question
+            yield item
+
+
+def finished_ids(path: str) -> Set[str]:
+    """输出文件中已成功回答的问题id（出错的条目重新运行，结果追加在后面）"""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue  # 中断时写了一半的行
+            if not row.get("error"):
+                done.add(str(row.get("id")))
+    return done
+
+
+def _terminate_partial_line(path: str) -> None:
+    """上次运行中断时最后一行可能没写完，补一个换行，避免与追加的第一行连在一起"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+class RateLimiter:
+    """每分钟请求数上限（令牌桶，允许 1 秒的突发）"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now - 1.0) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """可重试的错误返回等待秒数，否则返回None
+
+    限流（429）、超时、连接错误和5xx重试；优先使用服务端 Retry-After，否则指数退避加随机抖动。
+    """
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code != 429 and error.status_code < 500:
+            return None
+        retry_after = error.response.headers.get("retry-after")
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), 60.0)
+        except ValueError:
+            pass
+    elif not isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return None
+    return min(30.0, 2.0**attempt) * (0.5 + random.random() / 2)
+
+
+class BatchRunner:
+    """分批检索 + 有界并发生成
+
+    主线程按课程分组，每批问题的embedding一次计算，然后逐个检索；检索完成的问题交给生成线程池，
+    同时在途的问题数有上限，检索不会远远跑在生成前面。每条结果生成完立即追加写入输出文件。
+    批量embedding、每个问题的检索和生成请求都按 _retry_delay 重试；重试用尽时相应的问题写入错误行，
+    其余问题继续，下次运行时重新回答出错的问题。
+    """
+
+    def __init__(
+        self,
+        router: CourseRouter,
+        output_path: str,
+        *,
+        top_k: int = TOP_K,
+        concurrency: int = BATCH_QA_CONCURRENCY,
+        retries: int = BATCH_QA_RETRIES,
+        batch_size: int = BATCH_QA_RETRIEVAL_BATCH,
+        max_tokens: int = BATCH_QA_MAX_TOKENS,
+        rpm: Optional[float] = None,
+        course: Optional[str] = None,
+    ):
+        self.router = router
+        self.output_path = output_path
+        self.top_k = top_k
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.batch_size = max(1, batch_size)
+        self.max_tokens = max_tokens
+        self.limiter = RateLimiter(rpm) if rpm else None
+        self.course = course
+        self._slots = threading.BoundedSemaphore(self.concurrency * 2)
+        self._write_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"answered": 0, "failed": 0, "retries": 0}
+
+    def run(self, items: List[Dict[str, Any]]) -> Dict[str, int]:
+        _terminate_partial_line(self.output_path)
+        with open(self.output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="batch-qa"
+        ) as pool:
+            for batch in self._retrieval_batches(items):
+                for item, results, retrieve_ms in self._retrieve(batch, out):
+                    self._slots.acquire()
+                    future = pool.submit(self._answer, item, results, retrieve_ms)
+                    future.add_done_callback(lambda f: self._finish(f, out))
+        return self.stats
+
+    def _retrieval_batches(self, items: List[Dict[str, Any]]) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for item in items:
+            course = item.get("course") or self.course
+            course = course if course == ALL_COURSES else self.router.resolve(course)
+            groups.setdefault(course, []).append(item)
+        for course, group in groups.items():
+            for start in range(0, len(group), self.batch_size):
+                yield course, group[start : start + self.batch_size]
+
+    def _with_retries(self, call: Callable[[], Any]) -> Tuple[Any, Optional[str], int]:
+        """调用 call，可重试的错误按 _retry_delay 等待后重试，返回 (结果, 错误, 尝试次数)"""
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return call(), None, attempts
+            except Exception as e:
+                delay = _retry_delay(e, attempts) if attempts <= self.retries else None
+                if delay is None:
+                    return None, f"{type(e).__name__}: {e}", attempts
+                with self._write_lock:
+                    self.stats["retries"] += 1
+                time.sleep(delay)
+
+    def _retrieve(
+        self, batch: Tuple[str, List[Dict[str, Any]]], out
+    ) -> Iterator[Tuple[Dict[str, Any], List[Dict], float]]:
+        course, items = batch
+        if course == ALL_COURSES:
+            for item in items:
+                item = dict(item, course=course)
+                retrieved = self._retrieve_item(
+                    out, item, lambda: self.router.retrieve_all(item["question"], top_k=self.top_k)
+                )
+                if retrieved is not None:
+                    yield (item,) + retrieved
+            return
+        agent = self.router.agent(course)
+        t0 = time.perf_counter()
+        embeddings, error, attempts = self._with_retries(
+            lambda: agent.vector_store.get_embeddings([item["question"] for item in items])
+        )
+        # 批量embedding的耗时平摊到每个问题
+        embed_ms = (time.perf_counter() - t0) * 1000 / len(items)
+        if error:
+            for item in items:
+                self._write_row(out, self._row(dict(item, course=course), None, [], embed_ms, 0.0, attempts, error))
+            return
+        for item, embedding in zip(items, embeddings):
+            item = dict(item, course=course)
+            retrieved = self._retrieve_item(
+                out,
+                item,
+                lambda: agent.retrieve_documents(item["question"], top_k=self.top_k, query_embedding=embedding),
+                embed_ms,
+            )
+            if retrieved is not None:
+                yield (item,) + retrieved
+
+    def _retrieve_item(
+        self, out, item: Dict[str, Any], call: Callable[[], List[Dict]], extra_ms: float = 0.0
+    ) -> Optional[Tuple[List[Dict], float]]:
+        """带重试地检索一个问题，返回 (结果, 检索耗时)；重试用尽时写入错误行并返回None，不影响其他问题"""
+        t0 = time.perf_counter()
+        results, error, attempts = self._with_retries(call)
+        retrieve_ms = extra_ms + (time.perf_counter() - t0) * 1000
+        if error:
+            self._write_row(out, self._row(item, None, [], retrieve_ms, 0.0, attempts, error))
+            return None
+        return results, retrieve_ms
+
+    def _answer(self, item: Dict[str, Any], results: List[Dict], retrieve_ms: float) -> Dict[str, Any]:
+        course = item["course"]
+        agent = self.router.agent(None if course == ALL_COURSES else course)
+        context = agent.format_context(results) or _NO_CONTEXT
+        messages = agent.build_messages(item["question"], context, item.get("history"))
+        client = agent.client.with_options(max_retries=0)
+
+        def generate() -> str:
+            if self.limiter is not None:
+                self.limiter.acquire()
+            response = client.chat.completions.create(
+                model=agent.model, messages=messages, temperature=0.7, max_tokens=self.max_tokens
+            )
+            agent.record_usage(response.usage)
+            return response.choices[0].message.content or ""
+
+        t0 = time.perf_counter()
+        answer, error, attempts = self._with_retries(generate)
+        generate_ms = (time.perf_counter() - t0) * 1000
+        return self._row(item, answer, results, retrieve_ms, generate_ms, attempts, error)
+
+    @staticmethod
+    def _row(
+        item: Dict[str, Any],
+        answer: Optional[str],
+        results: List[Dict],
+        retrieve_ms: float,
+        generate_ms: float,
+        attempts: int,
+        error: Optional[str],
+    ) -> Dict[str, Any]:
+        row = {
+            "id": item["id"],
+            "question": item["question"],
+            "course": item["course"],
+            "answer": answer,
+            "sources": sources_from_results(results),
+            "latency_ms": {
+                "retrieve": round(retrieve_ms, 1),
+                "generate": round(generate_ms, 1),
+                "total": round(retrieve_ms + generate_ms, 1),
+            },
+            "attempts": attempts,
+        }
+        if error:
+            row["error"] = error
+        return row
+
+    def _finish(self, future, out) -> None:
+        self._slots.release()
+        try:
+            row = future.result()
+        except Exception as e:  # 检索结果格式化等意外错误：不写入，下次运行时重试
+            print(f"处理失败: {e}")
+            with self._write_lock:
+                self.stats["failed"] += 1
+            return
+        self._write_row(out, row)
+
+    def _write_row(self, out, row: Dict[str, Any]) -> None:
+        with self._write_lock:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+            self.stats["failed" if row.get("error") else "answered"] += 1
+            done = self.stats["answered"] + self.stats["failed"]
+        if row.get("error"):
+            print(f"[{done}] {row['id']} 失败: {row['error']}")
+        elif done % 10 == 0:
+            print(f"[{done}] 已完成")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="批量问答：从JSONL读取问题，分批检索、并发生成回答，把回答、来源和耗时写入JSONL。"
+        "输出文件已存在时跳过其中已成功回答的问题（中断后可继续运行）"
+    )
+    parser.add_argument("input", help='问题文件（JSONL，每行 {"id": ..., "question": "...", "course": 可选}）')
+    parser.add_argument("-o", "--output", default=None, help="输出文件（默认为 <输入文件名>.answers.jsonl）")
+    parser.add_argument("--course", default=None, help=f"未指定课程的问题使用的课程（{ALL_COURSES} 为跨课程检索）")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="每个问题检索的文档块数")
+    parser.add_argument("--concurrency", type=int, default=BATCH_QA_CONCURRENCY, help="同时进行的生成请求数")
+    parser.add_argument("--retries", type=int, default=BATCH_QA_RETRIES, help="可重试错误的最大重试次数")
+    parser.add_argument("--batch-size", type=int, default=BATCH_QA_RETRIEVAL_BATCH, help="每批计算embedding的问题数")
+    parser.add_argument("--max-tokens", type=int, default=BATCH_QA_MAX_TOKENS, help="每个回答的最大token数")
+    parser.add_argument("--rpm", type=float, default=None, help="每分钟生成请求数上限（按接口的限流额度设置）")
+    parser.add_argument("--restart", action="store_true", help="清空输出文件，重新回答所有问题")
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(args.input)[0]}.answers.jsonl"
+    if args.restart and os.path.exists(output):
+        os.remove(output)
+    items = list(read_questions(args.input))
+    done = finished_ids(output)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"共 {len(items)} 个问题，已完成 {len(items) - len(pending)} 个，待回答 {len(pending)} 个")
+    if not pending:
+        return
+
+    router = CourseRouter()
+    runner = BatchRunner(
+        router,
+        output,
+        top_k=args.top_k,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        batch_size=args.batch_size,
+        max_tokens=args.max_tokens,
+        rpm=args.rpm,
+        course=args.course,
+    )
+    t0 = time.perf_counter()
+    stats = runner.run(pending)
+    elapsed = time.perf_counter() - t0
+    prompt_tokens = sum(a.prompt_stats["prompt_tokens"] for a in router.loaded_agents().values())
+    cached_tokens = sum(a.prompt_stats["cached_tokens"] for a in router.loaded_agents().values())
+    print(
+        f"完成 {stats['answered']} 个，失败 {stats['failed']} 个，重试 {stats['retries']} 次，"
+        f"用时 {elapsed:.1f}s（{len(pending) / max(elapsed, 1e-9):.2f} 个/秒），"
+        f"提示词 {prompt_tokens} token（缓存命中 {cached_tokens}）"
+    )
+    print(f"结果已写入: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import gc
+import io
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from typing import Callable, List, Tuple
+
+from ooxml import docx_text, iter_pptx_slides
+
+
+def _legacy_pptx(path: str) -> List[str]:
+    # The previous DocumentLoader.load_pptx: full python-pptx object tree.
+    from pptx import Presentation
+
+    slides = []
+    for slide in Presentation(path).slides:
+        texts = [shape.text for shape in slide.shapes if getattr(shape, "has_text_frame", False) and shape.has_text_frame]
+        slides.append("\n".join(texts))
+    return slides
+
+
+def _legacy_docx(path: str) -> str:
+    # The previous DocumentLoader.load_docx.
+    import docx2txt
+
+    return docx2txt.process(path)
+
+
+def _make_pptx(path: str, slides: int, media_kb: int) -> None:
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    png = _png_bytes(media_kb)
+    prs = Presentation()
+    for i in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = f"第 {i + 1} 讲 随机过程"
+        body = slide.placeholders[1].text_frame
+        body.text = "马尔可夫链的平稳分布"
+        for j in range(4):
+            p = body.add_paragraph()
+            p.text = f"要点 {j}: 转移矩阵 P 的第 {j} 行之和为 1"
+        box = slide.shapes.add_textbox(Inches(1), Inches(5), Inches(4), Inches(1))
+        box.text_frame.text = "备注\vline break"
+        # Unique bytes per slide so python-pptx cannot dedupe the image parts.
+        slide.shapes.add_picture(io.BytesIO(png + i.to_bytes(4, "big")), Inches(5), Inches(1))
+    prs.save(path)
+
+
+def _png_bytes(kb: int) -> bytes:
+    from PIL import Image
+
+    side = max(8, int((kb * 1024 / 3) ** 0.5))
+    image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _make_docx(path: str, paragraphs: int, media_kb: int) -> None:
+    w = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    body = []
+    for i in range(paragraphs):
+        body.append(f"<w:p><w:r><w:t>第 {i} 段：布朗运动的 性质</w:t><w:tab/><w:t>续</w:t><w:br/><w:t>换行</w:t></w:r></w:p>")
+        if i % 50 == 0:
+            body.append("<w:tbl><w:tr><w:tc><w:p><w:r><w:t>表格单元</w:t></w:r></w:p></w:tc></w:tr></w:tbl>")
+    files = {
+        "[Content_Types].xml": '<?xml version="1.0"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>',
+        "word/document.xml": f'<?xml version="1.0"?><w:document {w}><w:body>{"".join(body)}</w:body></w:document>',
+        "word/header1.xml": f'<?xml version="1.0"?><w:hdr {w}><w:p><w:r><w:t>页眉</w:t></w:r></w:p></w:hdr>',
+        "word/footer1.xml": f'<?xml version="1.0"?><w:ftr {w}><w:p><w:r><w:t>页脚</w:t></w:r></w:p></w:ftr>',
+        "word/media/image1.png": _png_bytes(media_kb),
+    }
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+
+
+def _measure(fn: Callable[[], object], repeat: int) -> Tuple[float, float, object]:
+    """Median wall time (ms) and peak Python heap (MB) of fn()."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1024 / 1024, result
+
+
+def _report(label: str, legacy: Callable[[], object], streaming: Callable[[], object], repeat: int) -> None:
+    old_ms, old_mb, old_out = _measure(legacy, repeat)
+    new_ms, new_mb, new_out = _measure(streaming, repeat)
+    same = "identical" if old_out == new_out else "DIFFERENT"
+    print(f"{label:<32}{old_ms:>10.1f}{new_ms:>10.1f}{old_mb:>10.1f}{new_mb:>10.1f}  {same}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark streaming PPTX/DOCX text extraction against python-pptx/docx2txt.")
+    parser.add_argument("files", nargs="*", help="Real .pptx/.docx files to benchmark (default: generated samples)")
+    parser.add_argument("--slides", type=int, default=150, help="Slides in the generated deck")
+    parser.add_argument("--paragraphs", type=int, default=20000, help="Paragraphs in the generated document")
+    parser.add_argument("--media-kb", type=int, default=512, help="Size of each embedded image in the generated files")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = list(args.files)
+        if not files:
+            print("generating sample files ...")
+            files = [os.path.join(tmp, "sample.pptx"), os.path.join(tmp, "sample.docx")]
+            _make_pptx(files[0], args.slides, args.media_kb)
+            _make_docx(files[1], args.paragraphs, args.media_kb)
+
+        print(f"{'file':<32}{'old ms':>10}{'new ms':>10}{'old MB':>10}{'new MB':>10}  output")
+        for path in files:
+            label = f"{os.path.basename(path)} ({os.path.getsize(path) / 1024 / 1024:.1f}MB)"
+            if path.lower().endswith(".pptx"):
+                _report(label, lambda: _legacy_pptx(path), lambda: list(iter_pptx_slides(path)), args.repeat)
+            elif path.lower().endswith(".docx"):
+                _report(label, lambda: _legacy_docx(path), lambda: docx_text(path), args.repeat)
+            else:
+                print(f"{label:<32}skipped (not .pptx/.docx)")
+
+
+if __name__ == "__main__":
+    main()
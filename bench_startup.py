@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_TARGETS = ["config", "vector_store", "rag_agent", "local_app.server", "openai", "chromadb"]
+
+
+def _measure_import(module: str) -> float:
+    # Fresh interpreter per measurement so nothing is already in sys.modules.
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; "
+        "print(time.perf_counter() - t)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _request(url: str, payload: Optional[Dict[str, Any]] = None, timeout: float = 120.0) -> Tuple[int, float]:
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            code = resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        code = e.code
+    return code, time.perf_counter() - t0
+
+
+def _wait_for(url: str, *, want_ok: bool, deadline: float) -> Optional[float]:
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < deadline:
+        try:
+            code, _ = _request(url, timeout=2.0)
+            if not want_ok or code == 200:
+                return time.perf_counter() - t0
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def _bench_server(*, warmup: bool, first_request: str, wait_ready: bool) -> Dict[str, Any]:
+    port = _free_port()
+    cmd = [sys.executable, "run_local_app.py", "--no-browser", "--port", str(port)]
+    if not warmup:
+        cmd.append("--no-warmup")
+    base = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(cmd, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        listen_s = _wait_for(f"{base}/api/ready", want_ok=False, deadline=60)
+        if listen_s is None:
+            raise RuntimeError("server did not start listening")
+        ready_s = None
+        if warmup and wait_ready:
+            ready_s = _wait_for(f"{base}/api/ready", want_ok=True, deadline=120)
+        if first_request == "chat":
+            code, latency = _request(f"{base}/api/chat", {"message": "这门课主要讲了什么？"})
+        else:
+            code, latency = _request(f"{base}/api/status")
+        return {
+            "warmup": warmup,
+            "listen_ms": round(listen_s * 1000, 1),
+            "ready_wait_ms": None if ready_s is None else round(ready_s * 1000, 1),
+            "first_request": first_request,
+            "first_request_code": code,
+            "first_request_ms": round(latency * 1000, 1),
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark import time and first-request latency of the local app.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement")
+    parser.add_argument(
+        "--first-request",
+        choices=["chat", "status"],
+        default="chat",
+        help="Endpoint used for the first-request measurement (chat needs a working API key)",
+    )
+    parser.add_argument(
+        "--no-wait-ready",
+        action="store_true",
+        help="Fire the first request immediately instead of after /api/ready turns 200",
+    )
+    args = parser.parse_args()
+
+    print("== import time (fresh interpreter, median of runs) ==")
+    for module in IMPORT_TARGETS:
+        try:
+            samples: List[float] = [_measure_import(module) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError:
+            print(f"{module:<20} (import failed)")
+            continue
+        print(f"{module:<20} {statistics.median(samples) * 1000:8.1f} ms")
+
+    print(f"\n== server startup / first {args.first_request} request ==")
+    for warmup in (False, True):
+        for _ in range(args.repeat):
+            result = _bench_server(warmup=warmup, first_request=args.first_request, wait_ready=not args.no_wait_ready)
+            print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
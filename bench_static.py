@@ -0,0 +1,131 @@
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# (label, path, extra request headers); "{etag}" is replaced with the ETag of a first response.
+SCENARIOS: List[Tuple[str, str, Dict[str, str]]] = [
+    ("index identity", "/", {}),
+    ("index gzip", "/", {"Accept-Encoding": "gzip"}),
+    ("app.js identity", "/assets/app.js", {}),
+    ("app.js gzip", "/assets/app.js", {"Accept-Encoding": "gzip, br"}),
+    ("app.js revalidate", "/assets/app.js", {"Accept-Encoding": "gzip, br", "If-None-Match": "{etag}"}),
+    ("styles.css gzip", "/assets/styles.css", {"Accept-Encoding": "gzip, br"}),
+    ("app.js range 4KB", "/assets/app.js", {"Range": "bytes=0-4095"}),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(port: int, path: str, headers: Dict[str, str]) -> Tuple[int, int, Optional[str]]:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request("GET", path, headers=headers)
+        resp = conn.getresponse()
+        body = resp.read()
+        return resp.status, len(body), resp.getheader("ETag")
+    finally:
+        conn.close()
+
+
+def _wait_listening(port: int, deadline: float) -> bool:
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < deadline:
+        try:
+            _get(port, "/api/ping", {})
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def _run(port: int, path: str, headers: Dict[str, str], *, requests: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    sizes: List[int] = []
+    lock = threading.Lock()
+    per_worker = max(1, requests // concurrency)
+
+    def _worker() -> None:
+        local_lat, local_sizes, local_status = [], [], {}
+        for _ in range(per_worker):
+            t0 = time.perf_counter()
+            status, size, _etag = _get(port, path, headers)
+            local_lat.append(time.perf_counter() - t0)
+            local_sizes.append(size)
+            local_status[status] = local_status.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_lat)
+            sizes.extend(local_sizes)
+            for k, v in local_status.items():
+                statuses[k] = statuses.get(k, 0) + v
+
+    threads = [threading.Thread(target=_worker) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "bytes": statistics.mean(sizes),
+        "status": ",".join(f"{k}x{v}" for k, v in sorted(statuses.items())),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark static asset serving (/ and /assets/*) of the local app.")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--port", type=int, default=0, help="Benchmark an already running server on this port")
+    args = parser.parse_args()
+
+    proc = None
+    port = args.port
+    if not port:
+        port = _free_port()
+        cmd = [sys.executable, "run_local_app.py", "--no-browser", "--no-warmup", "--no-watch", "--port", str(port)]
+        proc = subprocess.Popen(cmd, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not _wait_listening(port, 60):
+            raise RuntimeError("server did not start listening")
+        print(f"{'scenario':<20}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'bytes':>10}  status")
+        for label, path, headers in SCENARIOS:
+            if "{etag}" in headers.get("If-None-Match", ""):
+                plain = {k: v for k, v in headers.items() if k != "If-None-Match"}
+                _status, _size, etag = _get(port, path, plain)
+                headers = dict(headers, **{"If-None-Match": etag or '"none"'})
+            # Warm up (first request loads the file if the server has no preloaded cache).
+            _get(port, path, headers)
+            r = _run(port, path, headers, requests=args.requests, concurrency=args.concurrency)
+            print(
+                f"{label:<20}{r['rps']:>10.0f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['bytes']:>10.0f}  {r['status']}"
+            )
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
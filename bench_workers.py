@@ -0,0 +1,162 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List
+
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+QUESTIONS = [
+    "马尔可夫链的平稳分布如何求？",
+    "布朗运动有哪些性质？",
+    "泊松过程的到达间隔服从什么分布？",
+    "什么是鞅？",
+    "lec2 第5页讲了什么",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _request(port: int, method: str, path: str, body: bytes = b"") -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        conn.request(method, path, body=body or None, headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status
+    finally:
+        conn.close()
+
+
+def _wait_ready(port: int, deadline: float) -> bool:
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < deadline:
+        try:
+            if _request(port, "GET", "/api/ready") == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def _tree_pids(root: int) -> List[int]:
+    parents: Dict[int, int] = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # "pid (comm) state ppid ..."; comm may contain spaces, so split after the ")".
+                parents[int(name)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    pids = [root]
+    for pid in pids:
+        pids.extend(child for child, parent in parents.items() if parent == pid)
+    return pids
+
+
+def _memory_mb(root: int) -> Dict[str, float]:
+    """RSS counts shared pages once per process; PSS splits them, so its sum is the real footprint."""
+    rss = pss = 0
+    for pid in _tree_pids(root):
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            continue
+    return {"rss": rss / 1024, "pss": pss / 1024}
+
+
+def _run(port: int, *, requests: int, concurrency: int, top_k: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+    per_client = max(1, requests // concurrency)
+
+    def _client(n: int) -> None:
+        local_lat, local_status = [], {}
+        for i in range(per_client):
+            question = QUESTIONS[(n + i) % len(QUESTIONS)]
+            body = json.dumps({"message": question, "top_k": top_k, "max_tokens": 64}).encode("utf-8")
+            t0 = time.perf_counter()
+            status = _request(port, "POST", "/api/chat", body)
+            local_lat.append(time.perf_counter() - t0)
+            local_status[status] = local_status.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_lat)
+            for k, v in local_status.items():
+                statuses[k] = statuses.get(k, 0) + v
+
+    threads = [threading.Thread(target=_client, args=(n,)) for n in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "status": ",".join(f"{k}x{v}" for k, v in sorted(statuses.items())),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark /api/chat throughput and memory of the local app with 1..N worker processes. "
+        "Point OPENAI_API_BASE in config.py at a fast stub to measure the app rather than the LLM."
+    )
+    parser.add_argument("--workers", default="1,2,4", help="Comma separated worker counts to compare")
+    parser.add_argument("--requests", type=int, default=400, help="Chat requests per run")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client threads")
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'RSS MB':>10}{'PSS MB':>10}  status")
+    for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+        port = _free_port()
+        cmd = [
+            sys.executable, "run_local_app.py", "--no-browser", "--no-watch",
+            "--port", str(port), "--workers", str(workers),
+        ]
+        proc = subprocess.Popen(cmd, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not _wait_ready(port, 120):
+                raise RuntimeError("server did not become ready")
+            # Warm every worker (and give the primary time to publish snapshots).
+            _run(port, requests=workers * 8, concurrency=workers * 2, top_k=args.top_k)
+            r = _run(port, requests=args.requests, concurrency=args.concurrency, top_k=args.top_k)
+            mem = _memory_mb(proc.pid)
+            print(
+                f"{workers:>8}{r['rps']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+                f"{mem['rss']:>10.0f}{mem['pss']:>10.0f}  {r['status']}"
+            )
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import argparse
+
+from config import QUERY_LOG_PATH, FAQ_STORE_PATH, FAQ_TOP_CLUSTERS, FAQ_MIN_COUNT, FAQ_WORKERS
+from faq import FAQStore, build_faq_store
+from rag_agent import RAGAgent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从问题日志聚类高频问题，并预先生成回答（本地App会优先使用）")
+    parser.add_argument("--log", default=QUERY_LOG_PATH, help="问题日志路径")
+    parser.add_argument("--store", default=FAQ_STORE_PATH, help="FAQ存储路径")
+    parser.add_argument("--top", type=int, default=FAQ_TOP_CLUSTERS, help="预计算的问题簇数量上限")
+    parser.add_argument("--min-count", type=int, default=FAQ_MIN_COUNT, help="问题簇至少出现的次数")
+    parser.add_argument("--workers", type=int, default=FAQ_WORKERS, help="并发生成回答的请求数")
+    args = parser.parse_args()
+
+    agent = RAGAgent()
+    store = build_faq_store(
+        agent,
+        FAQStore(args.store),
+        log_path=args.log,
+        top_n=args.top,
+        min_count=args.min_count,
+        workers=args.workers,
+    )
+    print(f"已生成 {store.stats()['entries']} 条常见问题回答: {args.store}")
+
+
+if __name__ == "__main__":
+    main()
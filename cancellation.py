@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import Callable, List, Optional
+
+
+class Cancelled(Exception):
+    """请求已被取消（客户端断开）或超过截止时间"""
+
+    def __init__(self, reason: str, stage: str = ""):
+        super().__init__(f"{reason}@{stage}" if stage else reason)
+        self.reason = reason
+        self.stage = stage
+
+
+class CancelToken:
+    """请求级的截止时间与取消标记，从HTTP处理器一路传到检索和生成
+
+    各阶段在开始前调用 check(stage)；耗时调用（embedding、LLM请求）用 remaining() 设置超时，
+    截止时间一到即中止。客户端断开时，流式生成通过 on_cancel 立即关闭；已发出的embedding请求无法中断，
+    最迟在截止时间结束，其结果在下一次 check 时被丢弃。
+    reason 为 "client_disconnected" 或 "deadline"。
+    """
+
+    def __init__(self, timeout_s: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout_s if timeout_s else None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """注册取消时的回调（如关闭正在读取的流式响应）；已取消则立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """距截止时间的秒数（无截止时间返回None）"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self, stage: str = "") -> None:
+        if self.cancelled:
+            raise Cancelled(self.reason or "cancelled", stage)
+
+
+def check(token: Optional[CancelToken], stage: str = "") -> None:
+    """token可以为None（不限时、不可取消），便于在可选参数处直接调用"""
+    if token is not None:
+        token.check(stage)
+
+
+def remaining(token: Optional[CancelToken]) -> Optional[float]:
+    """token距截止时间的秒数，用作耗时调用的超时；token为None或无截止时间时返回None"""
+    return token.remaining() if token is not None else None
@@ -0,0 +1,219 @@
+import json
+import posixpath
+from typing import Any, Dict, List, Optional, Tuple
+
+
+SCHEMA_VERSION = "compact-v1"
+
+# PDF/PPT 的页眉由 DocumentLoader 生成；存储时去掉，渲染时按页码重建
+_PAGE_HEADERS = {
+    ".pdf": "--- 第 {page} 页 ---\n",
+    ".pptx": "--- 幻灯片 {page} ---\n",
+}
+
+
+class DocumentTable:
+    """文件表与块元数据编解码
+
+    紧凑格式（compact-v1）下，filename/filepath/filetype 每个文件只在collection的
+    metadata中存一份（`doc_table`，JSON字符串）。文件按 filepath（相对数据目录的路径）登记，
+    不同子目录下的同名文件是不同的文件。每个块只存：
+        doc   - 整数文件ID
+        page  - 页码（无页码为0）
+        chunk - 块序号
+        dups  - 近重复来源（可选，见 dedup.merge_near_duplicates）
+        images - 图片列表（可选，仅非空时存储）
+        hdr   - 原文没有页眉时为0（可选）
+    对外（检索结果）仍然返回原来的完整元数据格式和带页眉的内容。
+
+    旧版collection（块元数据里直接存filename等字段）以 legacy 模式读写，保持原格式；
+    可用 migrate_vector_db.py 迁移为紧凑格式。
+    """
+
+    def __init__(self, entries: Optional[Dict[int, List[str]]] = None, legacy: bool = False):
+        # {doc_id: [filename, filepath, filetype]}
+        self.entries: Dict[int, List[str]] = dict(entries or {})
+        self.legacy = legacy
+        self._by_path: Dict[str, int] = {self._key(v[1], v[0]): k for k, v in self.entries.items()}
+
+    @staticmethod
+    def _key(filepath: str, filename: str) -> str:
+        return filepath or filename
+
+    @classmethod
+    def from_collection(cls, collection: Any) -> "DocumentTable":
+        meta = collection.metadata or {}
+        if meta.get("schema") == SCHEMA_VERSION:
+            raw = json.loads(meta.get("doc_table") or "{}")
+            return cls({int(k): v for k, v in raw.items()})
+        if collection.count() == 0:
+            return cls()
+        return cls(legacy=True)
+
+    def collection_metadata(self) -> Dict[str, Any]:
+        if self.legacy:
+            return {}
+        return {
+            "schema": SCHEMA_VERSION,
+            "doc_table": json.dumps({str(k): v for k, v in self.entries.items()}, ensure_ascii=False),
+        }
+
+    def save(self, collection: Any) -> None:
+        """把文件表写回collection的metadata（modify会整体替换metadata，因此先合并）"""
+        if self.legacy:
+            return
+        metadata = dict(collection.metadata or {})
+        metadata.update(self.collection_metadata())
+        collection.modify(metadata=metadata)
+
+    # ---- 文件表 ----
+
+    def register(self, filename: str, filepath: str, filetype: str) -> int:
+        key = self._key(filepath, filename)
+        doc_id = self._by_path.get(key)
+        if doc_id is None:
+            # 不复用已删除文件的ID，避免与残留块混淆
+            doc_id = max(self.entries, default=0) + 1
+            self._by_path[key] = doc_id
+        self.entries[doc_id] = [filename, filepath, filetype]
+        return doc_id
+
+    def remove(self, filepath: str) -> None:
+        doc_id = self._by_path.pop(filepath, None)
+        if doc_id is not None:
+            self.entries.pop(doc_id, None)
+
+    def filenames(self) -> List[str]:
+        return sorted({entry[0] for entry in self.entries.values()})
+
+    def where(
+        self,
+        filename: Optional[str] = None,
+        filetype: Optional[str] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        filepath: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """根据过滤条件构造Chroma的where子句，无条件时返回None
+
+        filename 匹配所有同名文件；filepath 只匹配该路径的文件（用于增量更新）。
+        """
+        page_key = "page_number" if self.legacy else "page"
+        conditions: List[Dict[str, Any]] = []
+        if self.legacy:
+            # 旧格式块中的filepath是入库时的原始路径，无法与相对路径对应，按文件名匹配（旧版行为）
+            if filepath and not filename:
+                filename = posixpath.basename(filepath)
+            if filename:
+                conditions.append({"filename": filename})
+            if filetype:
+                conditions.append({"filetype": filetype})
+        elif filename or filetype or filepath:
+            doc_ids = [
+                doc_id for doc_id, (name, path, ftype) in self.entries.items()
+                if (not filename or name == filename)
+                and (not filetype or ftype == filetype)
+                and (not filepath or self._key(path, name) == filepath)
+            ]
+            if not doc_ids:
+                doc_ids = [-1]  # 没有匹配的文件：构造一个不会命中的条件
+            conditions.append({"doc": doc_ids[0]} if len(doc_ids) == 1 else {"doc": {"$in": doc_ids}})
+        if page_range is not None:
+            start, end = page_range
+            if start == end:
+                conditions.append({page_key: start})
+            else:
+                conditions.append({page_key: {"$gte": start}})
+                conditions.append({page_key: {"$lte": end}})
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
+
+    # ---- 块编解码 ----
+
+    def encode_chunks(
+        self, chunks: List[Dict], start: int = 0
+    ) -> Tuple[List[str], List[str], List[Dict], List[str]]:
+        """把文档块转换为 (ids, documents, metadatas, texts)，跳过空内容块
+
+        texts 为用于生成embedding的完整原文（含页眉），与旧格式的向量保持一致；
+        start 用于旧格式ID中的全局序号（分批写入时保证ID唯一）。
+        """
+        ids: List[str] = []
+        documents: List[str] = []
+        metadatas: List[Dict] = []
+        texts: List[str] = []
+        for i, chunk in enumerate(chunks, start):
+            content = chunk.get("content", "")
+            if not content:
+                continue
+            if self.legacy:
+                doc_id, stored, metadata = self._encode_legacy(chunk, i)
+            else:
+                doc_id, stored, metadata = self._encode_compact(chunk)
+            ids.append(doc_id)
+            documents.append(stored)
+            metadatas.append(metadata)
+            texts.append(content)
+        return ids, documents, metadatas, texts
+
+    def _encode_legacy(self, chunk: Dict, i: int) -> Tuple[str, str, Dict]:
+        metadata = chunk.copy()
+        content = metadata.pop("content", "")
+        # Chroma不支持列表类型的metadata
+        if "images" in metadata and isinstance(metadata["images"], list):
+            metadata["images"] = str(metadata["images"])
+        filename = metadata.get("filename", "unknown")
+        chunk_id = metadata.get("chunk_id", i)
+        return f"{filename}_{chunk_id}_{i}", content, metadata
+
+    def _encode_compact(self, chunk: Dict) -> Tuple[str, str, Dict]:
+        filetype = chunk.get("filetype", "")
+        doc = self.register(chunk.get("filename", "unknown"), chunk.get("filepath", ""), filetype)
+        page = int(chunk.get("page_number", 0) or 0)
+        chunk_id = int(chunk.get("chunk_id", 0) or 0)
+
+        metadata: Dict[str, Any] = {"doc": doc, "page": page, "chunk": chunk_id}
+        content = chunk.get("content", "")
+        header = _PAGE_HEADERS.get(filetype)
+        if header and page:
+            header = header.format(page=page)
+            if content.startswith(header):
+                content = content[len(header):]
+            else:
+                metadata["hdr"] = 0  # 原文没有页眉，解码时不补
+        if chunk.get("duplicate_sources"):
+            metadata["dups"] = chunk["duplicate_sources"]
+        images = chunk.get("images")
+        if images and images != "[]":
+            metadata["images"] = str(images)
+        # (文件, 页, 块) 在近重复合并后唯一；文件ID按路径分配，同名文件的块ID不会相同
+        return f"{doc}-{page}-{chunk_id}", content, metadata
+
+    def with_duplicate_sources(self, metadata: Dict, sources: List[str]) -> Dict:
+        """返回替换了近重复来源的块元数据（存储格式），用于更新已入库的块"""
+        key = "duplicate_sources" if self.legacy else "dups"
+        return dict(metadata or {}, **{key: json.dumps(sources, ensure_ascii=False)})
+
+    def decode(self, content: str, metadata: Optional[Dict]) -> Tuple[str, Dict]:
+        """还原为完整元数据格式（filename/filepath/filetype/page_number/chunk_id）和带页眉的内容"""
+        metadata = metadata or {}
+        if "doc" not in metadata:
+            return content, metadata  # 旧格式，原样返回
+        filename, filepath, filetype = self.entries.get(metadata["doc"], ["unknown", "", ""])
+        page = metadata.get("page", 0)
+        full: Dict[str, Any] = {
+            "filename": filename,
+            "filepath": filepath,
+            "filetype": filetype,
+            "page_number": page,
+            "chunk_id": metadata.get("chunk", 0),
+            "images": metadata.get("images", "[]"),
+        }
+        if metadata.get("dups"):
+            full["duplicate_sources"] = metadata["dups"]
+        header = _PAGE_HEADERS.get(filetype)
+        if header and page and metadata.get("hdr", 1):
+            content = header.format(page=page) + (content or "")
+        return content, full
@@ -18,3 +18,109 @@ MAX_TOKENS = 2048
 
 # RAG配置
 TOP_K = 3 
+
+# 目录监听配置（本地App自动增量索引 data/ 下的变更）
+WATCH_DEBOUNCE_SECONDS = 2.0
+WATCH_POLL_INTERVAL = 5.0
+
+# 检索多样性配置：先取 MMR_FETCH_K 个候选，再用MMR选出 top_k 个（MMR_FETCH_K <= top_k 时不启用）
+MMR_FETCH_K = 12
+MMR_LAMBDA = 0.7  # 越大越偏向相关性，越小越偏向多样性
+
+# 入库近重复检测：SimHash指纹汉明距离不超过该值视为重复
+DEDUP_SIMHASH_DISTANCE = 3
+
+# 重排序配置（本地CPU交叉编码器，需要 sentence-transformers）
+RERANK_ENABLED = False
+RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # 多语言小模型，支持中文
+RERANK_CANDIDATES = 12  # 送入重排序的候选数量
+RERANK_BUDGET_MS = 300  # 预计重排序耗时超过该值则跳过
+RERANK_CACHE_SIZE = 4096
+
+# Embedding提供方配置："openai"（OpenAI兼容接口，使用上面的OPENAI_EMBEDDING_MODEL）或 "local"（本地sentence-transformers）
+# 更换提供方/模型后需要重建知识库：collection会记录生成向量所用的模型，不匹配时拒绝加载
+EMBEDDING_PROVIDER = "openai"
+EMBEDDING_BATCH_SIZE = 10  # 每次请求/推理的文本数（DashScope接口单次最多10~25条）
+LOCAL_EMBEDDING_MODEL = "BAAI/bge-small-zh-v1.5"
+LOCAL_EMBEDDING_BACKEND = "torch"  # "torch" 或 "onnx"
+LOCAL_EMBEDDING_ONNX_FILE = None  # ONNX后端可指定量化权重，例如 "onnx/model_qint8_avx512_vnni.onnx"
+LOCAL_EMBEDDING_THREADS = 0  # CPU推理线程数，0表示使用默认值
+
+# 常见问题（FAQ）预计算配置：本地App记录问题日志，离线聚类后为高频问题预先生成回答
+FAQ_ENABLED = True
+QUERY_LOG_PATH = "./query_log.jsonl"
+FAQ_STORE_PATH = "./faq_store.json"
+FAQ_TOP_CLUSTERS = 200  # 预计算回答的问题簇数量上限
+FAQ_MIN_COUNT = 3  # 问题簇至少被问过几次才预计算
+FAQ_SIMHASH_DISTANCE = 3  # 问题SimHash指纹汉明距离不超过该值视为同一问题
+FAQ_WORKERS = 4  # 并发生成回答的请求数
+
+# 多查询检索：用LLM把复杂问题改写/拆分为多个子问题，批量embedding后并发检索，结果用RRF融合
+MULTI_QUERY_ENABLED = False
+MULTI_QUERY_COUNT = 3  # 生成的子问题数量（另加原问题）
+MULTI_QUERY_DEADLINE_MS = 3000  # 整体截止时间（含子问题生成），超时返回已完成的部分结果
+MULTI_QUERY_WORKERS = 4  # 并发检索线程数
+MULTI_QUERY_RRF_K = 60  # RRF融合常数：score = sum(1 / (k + 排名))
+
+# 流式回答时请求接口在最后一个分块返回token用量（含命中提示词缓存的token数，用于统计）；
+# 接口不支持 stream_options 时设为False
+STREAM_INCLUDE_USAGE = True
+
+# 输入时预取：网页端在用户停止输入片刻后把尚未发送的问题发到 /api/prefetch，提前完成embedding和检索；
+# 发送的问题与预取时相同（连续空白视为一个空格，标点必须一致）时直接使用预取结果。启用多查询检索时不预取（每次停顿都会调用LLM改写问题）
+PREFETCH_ENABLED = True
+PREFETCH_TTL_SECONDS = 20  # 预取结果的有效期
+PREFETCH_MIN_CHARS = 4  # 问题（去掉首尾空白、合并连续空白后）少于该长度时不预取
+
+# 单个问答请求的截止时间（秒）：超时或浏览器断开（打断）后停止检索和生成
+CHAT_DEADLINE_SECONDS = 120
+
+# 重建任务：进度检查点与任务历史的存放目录；进程重启后自动从检查点继续未完成的重建
+REBUILD_JOBS_DIR = "./rebuild_jobs"
+REBUILD_AUTO_RESUME = True
+
+# 扫描版PDF的OCR：可提取文字过少的页渲染为图片后用tesseract识别（需要 pymupdf、pytesseract 和 tesseract 程序）
+OCR_ENABLED = True
+OCR_MIN_CHARS = 20  # 页面文字（不计空白）少于该值时进行OCR
+OCR_LANG = "chi_sim+eng"  # tesseract语言包
+OCR_DPI = 200  # 渲染分辨率
+OCR_WORKERS = 0  # OCR进程数，0表示CPU核数-1
+OCR_CACHE_DIR = "./ocr_cache"  # 识别结果缓存（按文件内容哈希和页码），重建时不重复识别
+
+# 向量索引（HNSW）参数：保存在collection中。space / M / construction_ef 在建索引时生效（修改后需重建知识库），
+# search_ef 可随时修改，下次启动时自动应用；可用 sweep_hnsw.py 在现有向量库上比较不同取值的召回率与延迟
+HNSW_SPACE = "l2"  # 距离度量："l2"、"cosine" 或 "ip"
+HNSW_M = 16  # 每个节点的最大邻居数，越大召回越高、索引越大
+HNSW_CONSTRUCTION_EF = 100  # 建索引时的候选队列长度
+HNSW_SEARCH_EF = 100  # 查询时的候选队列长度，越大召回越高、查询越慢
+
+# 多课程：每门课程独立的资料目录和collection（共用同一个向量库目录），一个进程服务多门课程
+# 为空时只有一门课程，使用上面的 DATA_DIR / COLLECTION_NAME。示例：
+# COURSES = {
+#     "stochastic": {"name": "随机过程", "data_dir": "./data/stochastic", "collection": "course_stochastic"},
+#     "algebra": {"name": "线性代数", "data_dir": "./data/algebra", "collection": "course_algebra"},
+# }
+COURSES = {}
+DEFAULT_COURSE = ""  # 请求未指定课程时使用的课程ID，为空时使用COURSES中的第一门
+CROSS_COURSE_WORKERS = 4  # 跨课程检索的并发线程数
+CROSS_COURSE_DEADLINE_MS = 3000  # 跨课程检索的截止时间，超时返回已完成课程的结果
+
+# 批量问答（batch_qa.py）：从JSONL读取问题，分批检索后并发生成回答，可中断后继续
+BATCH_QA_CONCURRENCY = 8  # 同时进行的生成请求数
+BATCH_QA_RETRIES = 4  # 限流/超时/服务端错误时的重试次数（指数退避）
+BATCH_QA_RETRIEVAL_BATCH = 32  # 每批一次计算embedding的问题数
+BATCH_QA_MAX_TOKENS = 1500
+
+# 性能剖析（本地App，默认关闭）：抽样或按请求头 X-Profile 用 cProfile（CPU）或 tracemalloc（内存分配）剖析问答请求
+# 和重建的各阶段，最近的结果保存在内存中，通过 /api/debug/profiles 查看（pstats 和火焰图用的折叠调用栈）
+PROFILING_ENABLED = False
+PROFILE_SAMPLE_EVERY = 0  # 每N个问答请求剖析一个，0为只剖析带 X-Profile 请求头的请求
+PROFILE_MODE = "cpu"  # 抽样时的剖析方式："cpu" 或 "alloc"
+PROFILE_KEEP = 20  # 保留最近的剖析结果数
+PROFILE_STACK_INTERVAL_MS = 5  # CPU剖析时调用栈采样间隔（毫秒），用于生成火焰图
+
+# 多进程服务（run_local_app.py --workers N，需要支持fork的系统）：只读worker从内存映射的索引快照检索，不打开Chroma，
+# 各进程共享同一份页缓存；重建/增量索引只在主worker中进行，完成后原子发布新快照
+SERVE_WORKERS = 1  # 默认worker进程数，1为单进程（不使用快照）
+INDEX_SNAPSHOT_DIR = "./index_snapshots"
+SNAPSHOT_CHECK_INTERVAL = 1.0  # 只读worker检查是否有新快照的最短间隔（秒）
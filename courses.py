@@ -0,0 +1,188 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import (
+    DATA_DIR,
+    COLLECTION_NAME,
+    MODEL_NAME,
+    TOP_K,
+    RERANK_ENABLED,
+    COURSES,
+    DEFAULT_COURSE,
+    CROSS_COURSE_WORKERS,
+    CROSS_COURSE_DEADLINE_MS,
+)
+from cancellation import CancelToken, check, remaining
+from rag_agent import RAGAgent
+from reranker import CrossEncoderReranker
+from vector_store import VectorStore
+
+
+# 跨课程检索的课程ID
+ALL_COURSES = "*"
+
+
+@dataclass
+class Course:
+    """一门课程：独立的资料目录和collection（同一个向量库目录中的不同collection）"""
+
+    id: str
+    name: str
+    data_dir: str
+    collection: str
+
+
+def load_courses() -> Dict[str, Course]:
+    """读取 config.COURSES；未配置时为单一课程（DATA_DIR / COLLECTION_NAME），与单课程部署完全相同"""
+    if not COURSES:
+        return {"default": Course("default", "课程", DATA_DIR, COLLECTION_NAME)}
+    courses = {}
+    for course_id, spec in COURSES.items():
+        courses[course_id] = Course(
+            id=course_id,
+            name=spec.get("name", course_id),
+            data_dir=spec.get("data_dir", f"./data/{course_id}"),
+            collection=spec.get("collection", f"{COLLECTION_NAME}_{course_id}"),
+        )
+    return courses
+
+
+class CourseRouter:
+    """按课程路由检索：每门课程一个RAGAgent（各自的collection），按需创建
+
+    普通问答只检索指定的一门课程；跨课程检索（course="*"）时问题向量只计算一次，
+    各课程的collection并发检索，按向量距离合并出top_k，整体受截止时间约束。
+    """
+
+    def __init__(
+        self,
+        courses: Optional[Dict[str, Course]] = None,
+        model: str = MODEL_NAME,
+        store_factory: Optional[Callable[[Course], Any]] = None,
+    ):
+        """store_factory 为各课程创建向量库（默认为该课程collection的VectorStore；多进程服务的只读worker传入快照）"""
+        self.courses = courses or load_courses()
+        self.model = model
+        self.store_factory = store_factory or (lambda course: VectorStore(collection_name=course.collection))
+        self.default_id = DEFAULT_COURSE if DEFAULT_COURSE in self.courses else next(iter(self.courses))
+        self._agents: Dict[str, RAGAgent] = {}
+        self._lock = threading.Lock()
+        self._reranker: Optional[CrossEncoderReranker] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"cross_calls": 0, "shard_timeouts": 0, "shard_errors": 0}
+
+    def _count(self, counter: str) -> None:
+        # 跨课程检索在多个请求线程中并发进行
+        with self._stats_lock:
+            self.stats[counter] += 1
+
+    def resolve(self, course_id: Optional[str]) -> str:
+        """课程ID为空时返回默认课程；未知课程抛出 ValueError"""
+        if not course_id:
+            return self.default_id
+        if course_id not in self.courses:
+            raise ValueError(f"未知课程: {course_id}")
+        return course_id
+
+    def agent(self, course_id: Optional[str] = None) -> RAGAgent:
+        """指定课程的RAGAgent（首次使用时创建）
+
+        各课程共享重排序模型及其分数缓存：缓存按文档块内容而非块ID（只在collection内唯一）索引，
+        不同课程的同ID块不会互相命中。
+        """
+        course_id = self.resolve(course_id)
+        agent = self._agents.get(course_id)
+        if agent is not None:
+            return agent
+        with self._lock:
+            agent = self._agents.get(course_id)
+            if agent is None:
+                if RERANK_ENABLED and self._reranker is None:
+                    self._reranker = CrossEncoderReranker()
+                course = self.courses[course_id]
+                agent = RAGAgent(
+                    model=self.model,
+                    vector_store=self.store_factory(course),
+                    reranker=self._reranker,
+                )
+                self._agents[course_id] = agent
+        return agent
+
+    def loaded_agents(self) -> Dict[str, RAGAgent]:
+        return dict(self._agents)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=CROSS_COURSE_WORKERS, thread_name_prefix="course-shard")
+            return self._pool
+
+    def retrieve_all(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        course_ids: Optional[List[str]] = None,
+        deadline_ms: float = CROSS_COURSE_DEADLINE_MS,
+        cancel: Optional[CancelToken] = None,
+    ) -> List[Dict]:
+        """跨课程检索：各课程并发检索top_k，按向量距离合并
+
+        各课程用同一个问题向量、同一embedding模型和距离空间检索，距离可以直接比较。
+        按页直接读取的结果（问题指明了文件和页码）没有距离，排在所有向量检索结果之前；
+        它们之间、以及距离相同的结果之间按课程内排名、再按课程顺序排列。
+        每个结果增加 course 字段；截止时间到达时放弃未完成的课程，返回已完成部分的合并结果。
+        """
+        course_ids = [self.resolve(c) for c in (course_ids or list(self.courses))]
+        self._count("cross_calls")
+        if cancel is not None and cancel.remaining() is not None:
+            deadline_ms = min(deadline_ms, cancel.remaining() * 1000)
+        deadline = time.perf_counter() + deadline_ms / 1000
+
+        agents = {course_id: self.agent(course_id) for course_id in course_ids}
+        check(cancel, "embed")
+        # 所有课程使用同一个embedding配置，问题向量只算一次
+        vector_store = next(iter(agents.values())).vector_store
+        try:
+            query_embedding = vector_store.get_embedding(query, timeout=remaining(cancel))
+        except Exception:
+            check(cancel, "embed")  # 因截止时间而超时的调用按取消处理
+            raise
+        check(cancel, "search")
+
+        pool = self._get_pool()
+        futures = {
+            pool.submit(agent.retrieve_documents, query, top_k, query_embedding): course_id
+            for course_id, agent in agents.items()
+        }
+        done, not_done = RAGAgent._wait(list(futures), deadline, cancel)
+        for future in not_done:
+            future.cancel()
+        check(cancel, "search")
+        if not_done:
+            self._count("shard_timeouts")
+
+        merged: List[Dict] = []
+        for future, course_id in futures.items():
+            if future not in done:
+                continue
+            if future.exception() is not None:
+                self._count("shard_errors")
+                print(f"课程 {course_id} 检索失败: {future.exception()}")
+                continue
+            for rank, result in enumerate(future.result()):
+                merged.append(dict(result, course=course_id, _rank=rank))
+
+        def order(result: Dict) -> Tuple[int, float, int]:
+            distance = result.get("distance")
+            if distance is None:
+                return (0, 0.0, result["_rank"])  # 按页读取的结果
+            return (1, distance, result["_rank"])
+
+        merged.sort(key=order)
+        for result in merged:
+            result.pop("_rank", None)
+        return merged[:top_k]
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import DEDUP_SIMHASH_DISTANCE
+
+
+_PAGE_HEADER_RE = re.compile(r"^--- (第 \d+ 页|幻灯片 \d+) ---\n?")
+_WHITESPACE_RE = re.compile(r"\s+")
+_SHINGLE_SIZE = 3
+_FINGERPRINT_BITS = 64
+
+
+def _normalize(text: str) -> str:
+    """去掉页眉标记和空白，避免仅页码不同的相同幻灯片被视为不同内容"""
+    text = _PAGE_HEADER_RE.sub("", text)
+    return _WHITESPACE_RE.sub("", text).lower()
+
+
+def simhash(text: str) -> int:
+    """计算文本的64位SimHash指纹（基于字符3-gram，适用于中英文混排）"""
+    text = _normalize(text)
+    if len(text) < _SHINGLE_SIZE:
+        shingles = [text] if text else []
+    else:
+        # 去重：目录页的 ". . . ." 之类重复片段否则会主导投票，使不同讲义的目录页指纹相同
+        shingles = list({text[i : i + _SHINGLE_SIZE] for i in range(len(text) - _SHINGLE_SIZE + 1)})
+
+    if not shingles:
+        return 0
+    # 使用稳定哈希（内置hash()每次进程启动都会随机化）；按位投票用numpy一次完成
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(-1, 64)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    fingerprint = int("".join("1" if v > 0 else "0" for v in votes), 2)
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """SimHash近重复索引
+
+    64位指纹切成 max_distance+1 段建立倒排表：汉明距离不超过 max_distance 的两个指纹
+    至少有一段完全相同（抽屉原理），因此只需与同段候选比较，而不必与全部已有指纹逐一比较。
+    默认距离3时为4段，每段16位。
+    """
+
+    def __init__(self, max_distance: int = DEDUP_SIMHASH_DISTANCE):
+        if not 0 <= max_distance < _FINGERPRINT_BITS:
+            raise ValueError(f"SimHash汉明距离阈值应在 0~{_FINGERPRINT_BITS - 1} 之间: {max_distance}")
+        self.max_distance = max_distance
+        self.fingerprints: List[int] = []
+        count = max_distance + 1
+        # 各段的 (起始位, 掩码)；64位不能整除时前几段多分一位
+        self._segments: List[Tuple[int, int]] = []
+        shift = 0
+        for i in range(count):
+            width = _FINGERPRINT_BITS // count + (1 if i < _FINGERPRINT_BITS % count else 0)
+            self._segments.append((shift, (1 << width) - 1))
+            shift += width
+        self.bands: List[Dict[int, List[int]]] = [{} for _ in self._segments]
+
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        return [(fingerprint >> shift) & mask for shift, mask in self._segments]
+
+    def find(self, fingerprint: int) -> Optional[int]:
+        """返回与给定指纹近重复的已有条目下标，没有则返回None"""
+        seen = set()
+        for band, key in zip(self.bands, self._band_keys(fingerprint)):
+            for idx in band.get(key, []):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                if hamming_distance(self.fingerprints[idx], fingerprint) <= self.max_distance:
+                    return idx
+        return None
+
+    def add(self, fingerprint: int) -> int:
+        idx = len(self.fingerprints)
+        self.fingerprints.append(fingerprint)
+        for band, key in zip(self.bands, self._band_keys(fingerprint)):
+            band.setdefault(key, []).append(idx)
+        return idx
+
+
+def chunk_fingerprint(content: str) -> Optional[int]:
+    """文档块的SimHash指纹；去掉页眉和空白后没有内容的块不参与去重，返回None"""
+    return simhash(content) if _normalize(content) else None
+
+
+def source_label(chunk: Dict) -> str:
+    """块的来源 "路径#页码"（路径相对数据目录，数据目录下的文件即为文件名）"""
+    path = chunk.get("filepath") or chunk.get("filename", "unknown")
+    return f"{path}#{chunk.get('page_number', 0)}"
+
+
+def source_path(label: str) -> str:
+    """"路径#页码" 中的路径"""
+    return label.rsplit("#", 1)[0]
+
+
+def chunk_sources(chunk: Dict) -> List[str]:
+    """块内容的全部来源：合并过重复内容的块为 `duplicate_sources`，否则为块自身"""
+    return parse_duplicate_sources(chunk) or [source_label(chunk)]
+
+
+def merge_near_duplicates(chunks: List[Dict]) -> List[Dict]:
+    """合并近重复的文档块
+
+    相同的标题页、目录页等在多份讲义中重复出现时只保留第一次出现的块，
+    其余出现位置以 "路径#页码" 的形式记录在保留块的 `duplicate_sources`
+    元数据中（JSON字符串，因为Chroma的metadata不支持列表）。
+    只比较传入的这批块；与库中已有块的比较见 VectorStore.add_documents。
+    """
+    index = NearDuplicateIndex()
+    kept: List[Dict] = []
+    positions: List[int] = []  # index条目下标 -> 在kept中的位置
+    extra_sources: Dict[int, List[str]] = {}
+
+    for chunk in chunks:
+        fingerprint = chunk_fingerprint(chunk.get("content", ""))
+        if fingerprint is None:
+            kept.append(chunk)
+            continue
+        match = index.find(fingerprint)
+        if match is None:
+            index.add(fingerprint)
+            positions.append(len(kept))
+            kept.append(chunk)
+            continue
+        extra_sources.setdefault(match, []).append(source_label(chunk))
+
+    for idx, sources in extra_sources.items():
+        pos = positions[idx]
+        primary = dict(kept[pos])
+        primary["duplicate_sources"] = json.dumps([source_label(primary)] + sources, ensure_ascii=False)
+        kept[pos] = primary
+
+    return kept
+
+
+def parse_duplicate_sources(metadata: Dict) -> List[str]:
+    """解析元数据中的 `duplicate_sources`，返回 "文件名#页码" 列表（无重复时为空）"""
+    raw = (metadata or {}).get("duplicate_sources")
+    if not raw:
+        return []
+    try:
+        sources = json.loads(raw)
+    except (TypeError, ValueError):
+        return []
+    return [str(s) for s in sources] if isinstance(sources, list) else []
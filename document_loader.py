@@ -1,11 +1,25 @@
 import os
 from typing import List, Dict, Optional
 
-import docx2txt
 from PyPDF2 import PdfReader
-from pptx import Presentation
 
 from config import DATA_DIR
+from ocr import needs_ocr, ocr_pdf_pages
+from ooxml import docx_text, iter_pptx_slides
+
+
+def relative_filepath(file_path: str, data_dir: str) -> str:
+    """文件相对数据目录的路径（"/" 分隔），作为文件在向量库中的唯一标识
+
+    不同子目录下的同名文件（如 a/lec1.pdf 与 b/lec1.pdf）由此区分；不在数据目录下的文件保留原路径。
+    """
+    try:
+        rel = os.path.relpath(file_path, data_dir)
+    except ValueError:  # Windows下不在同一盘符
+        return file_path
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return file_path
+    return rel.replace(os.sep, "/")
 
 
 class DocumentLoader:
@@ -17,12 +31,16 @@ class DocumentLoader:
         self.supported_formats = [".pdf", ".pptx", ".docx", ".txt"]
 
     def load_pdf(self, file_path: str) -> List[Dict]:
-        """加载PDF文件，按页返回内容"""
+        """加载PDF文件，按页返回内容；几乎没有文字的页（扫描页）用OCR识别"""
         pdf_content = []
         try:
             reader = PdfReader(file_path)
-            for i, page in enumerate(reader.pages):
-                text = page.extract_text() or ""
+            texts = [page.extract_text() or "" for page in reader.pages]
+            scanned = [i + 1 for i, text in enumerate(texts) if needs_ocr(text)]
+            for page, text in ocr_pdf_pages(file_path, scanned).items():
+                if len(text.strip()) > len(texts[page - 1].strip()):
+                    texts[page - 1] = text
+            for i, text in enumerate(texts):
                 formatted_text = f"--- 第 {i+1} 页 ---\n{text}\n"
                 pdf_content.append({"text": formatted_text})
         except Exception as e:
@@ -30,17 +48,10 @@ class DocumentLoader:
         return pdf_content
 
     def load_pptx(self, file_path: str) -> List[Dict]:
-        """加载PPT文件，按幻灯片返回内容"""
+        """加载PPT文件，按幻灯片返回内容（流式解析幻灯片XML，不读取媒体文件）"""
         pptx_content = []
         try:
-            prs = Presentation(file_path)
-            for i, slide in enumerate(prs.slides):
-                text_runs = []
-                for shape in slide.shapes:
-                    if hasattr(shape, "has_text_frame") and shape.has_text_frame:
-                        text_runs.append(shape.text)
-                
-                text = "\n".join(text_runs)
+            for i, text in enumerate(iter_pptx_slides(file_path)):
                 formatted_text = f"--- 幻灯片 {i+1} ---\n{text}\n"
                 pptx_content.append({"text": formatted_text})
         except Exception as e:
@@ -48,9 +59,9 @@ class DocumentLoader:
         return pptx_content
 
     def load_docx(self, file_path: str) -> str:
-        """加载DOCX文件"""
+        """加载DOCX文件（流式解析，不读取媒体文件）"""
         try:
-            return docx2txt.process(file_path)
+            return docx_text(file_path)
         except Exception as e:
             print(f"Error loading DOCX {file_path}: {e}")
             return ""
@@ -68,6 +79,7 @@ class DocumentLoader:
         """加载单个文档，PDF和PPT按页/幻灯片分割，返回文档块列表"""
         ext = os.path.splitext(file_path)[1].lower()
         filename = os.path.basename(file_path)
+        filepath = relative_filepath(file_path, self.data_dir)
         documents = []
 
         if ext == ".pdf":
@@ -77,7 +89,7 @@ class DocumentLoader:
                     {
                         "content": page_data["text"],
                         "filename": filename,
-                        "filepath": file_path,
+                        "filepath": filepath,
                         "filetype": ext,
                         "page_number": page_idx,
                     }
@@ -89,7 +101,7 @@ class DocumentLoader:
                     {
                         "content": slide_data["text"],
                         "filename": filename,
-                        "filepath": file_path,
+                        "filepath": filepath,
                         "filetype": ext,
                         "page_number": slide_idx,
                     }
@@ -101,7 +113,7 @@ class DocumentLoader:
                     {
                         "content": content,
                         "filename": filename,
-                        "filepath": file_path,
+                        "filepath": filepath,
                         "filetype": ext,
                         "page_number": 0,
                     }
@@ -113,7 +125,7 @@ class DocumentLoader:
                     {
                         "content": content,
                         "filename": filename,
-                        "filepath": file_path,
+                        "filepath": filepath,
                         "filetype": ext,
                         "page_number": 0,
                     }
@@ -0,0 +1,142 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    EMBEDDING_PROVIDER,
+    EMBEDDING_BATCH_SIZE,
+    OPENAI_API_KEY,
+    OPENAI_API_BASE,
+    OPENAI_EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_BACKEND,
+    LOCAL_EMBEDDING_ONNX_FILE,
+    LOCAL_EMBEDDING_THREADS,
+)
+
+
+class EmbeddingProvider(ABC):
+    """Embedding提供方接口
+
+    model_id 用于标记collection：用不同模型生成的向量不能混在同一个collection中检索。
+    """
+
+    model_id: str = ""
+
+    @abstractmethod
+    def embed(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """批量获取文本的向量表示，返回顺序与输入一致
+
+        timeout 为整个调用的超时秒数（None为不限），由请求的截止时间得到。
+        """
+
+    def embed_one(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        return self.embed([text], timeout=timeout)[0]
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI兼容接口（默认DashScope）的远程embedding"""
+
+    def __init__(
+        self,
+        api_key: str = OPENAI_API_KEY,
+        api_base: str = OPENAI_API_BASE,
+        model: str = OPENAI_EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ):
+        from openai import OpenAI
+
+        self.client = OpenAI(api_key=api_key, base_url=api_base)
+        self.model = model
+        self.batch_size = batch_size
+        self.model_id = f"openai:{model}"
+
+    def embed(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        embeddings: List[List[float]] = []
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for start in range(0, len(texts), self.batch_size):
+            batch = [t.replace("\n", " ") for t in texts[start : start + self.batch_size]]
+            client = self.client
+            if deadline is not None:
+                # 有截止时间时不重试：重试只会超出截止时间
+                client = client.with_options(timeout=max(0.01, deadline - time.monotonic()), max_retries=0)
+            response = client.embeddings.create(input=batch, model=self.model)
+            # 按index排序，保证与输入顺序一致
+            embeddings.extend(d.embedding for d in sorted(response.data, key=lambda d: d.index))
+        return embeddings
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """本地sentence-transformers模型，CPU批量推理，可选ONNX（含int8量化权重）后端"""
+
+    def __init__(
+        self,
+        model_name: str = LOCAL_EMBEDDING_MODEL,
+        backend: str = LOCAL_EMBEDDING_BACKEND,
+        onnx_file: Optional[str] = LOCAL_EMBEDDING_ONNX_FILE,
+        threads: int = LOCAL_EMBEDDING_THREADS,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ):
+        # sentence-transformers（及torch）导入很慢，仅在选择本地后端时导入
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads > 0:
+            torch.set_num_threads(threads)
+
+        kwargs = {}
+        if backend == "onnx":
+            kwargs["backend"] = "onnx"
+            if onnx_file:
+                # 例如 "onnx/model_qint8_avx512_vnni.onnx"（int8量化权重）
+                kwargs["model_kwargs"] = {"file_name": onnx_file}
+        self.model = SentenceTransformer(model_name, device="cpu", **kwargs)
+        self.batch_size = batch_size
+        # 量化权重与原始权重的向量不完全一致，因此也计入model_id
+        self.model_id = f"local:{model_name}" + (f":{backend}" if backend != "torch" else "") + (
+            f":{onnx_file}" if backend == "onnx" and onnx_file else ""
+        )
+
+    def embed(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        # 本地推理无法中途停止，忽略timeout（查询只有几个短文本，耗时很短）
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+        return vectors.tolist()
+
+
+_PROVIDERS: Dict[Tuple, EmbeddingProvider] = {}
+_PROVIDERS_LOCK = threading.Lock()
+
+
+def get_embedding_provider(
+    provider: str = EMBEDDING_PROVIDER,
+    api_key: str = OPENAI_API_KEY,
+    api_base: str = OPENAI_API_BASE,
+) -> EmbeddingProvider:
+    """按配置返回embedding提供方
+
+    实例在进程内缓存复用：多个VectorStore（agent、重建任务、目录监听）共享同一份本地模型，
+    不会重复加载权重。
+    """
+    if provider == "local":
+        key: Tuple = ("local", LOCAL_EMBEDDING_MODEL, LOCAL_EMBEDDING_BACKEND, LOCAL_EMBEDDING_ONNX_FILE)
+    elif provider == "openai":
+        key = ("openai", api_key, api_base, OPENAI_EMBEDDING_MODEL)
+    else:
+        raise ValueError(f"不支持的EMBEDDING_PROVIDER: {provider}（可选 openai / local）")
+
+    with _PROVIDERS_LOCK:
+        instance = _PROVIDERS.get(key)
+        if instance is None:
+            if provider == "local":
+                instance = LocalEmbeddingProvider()
+            else:
+                instance = OpenAIEmbeddingProvider(api_key=api_key, api_base=api_base)
+            _PROVIDERS[key] = instance
+        return instance
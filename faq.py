@@ -0,0 +1,299 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    TOP_K,
+    QUERY_LOG_PATH,
+    FAQ_STORE_PATH,
+    FAQ_TOP_CLUSTERS,
+    FAQ_MIN_COUNT,
+    FAQ_SIMHASH_DISTANCE,
+    FAQ_WORKERS,
+)
+from dedup import NearDuplicateIndex, parse_duplicate_sources, simhash
+
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+# 讲次、页码等数字不同的问题不能视为同一个问题（"第5页" 与 "第6页"）
+_NUMBER_RE = re.compile(r"\d+|[零一二两三四五六七八九十]+")
+_NO_CONTEXT = "（未检索到特别相关的课程材料）"
+
+
+def normalize_question(text: str) -> str:
+    """去掉空白和标点并转小写，作为问题的精确匹配键"""
+    return _NON_WORD_RE.sub("", text or "").lower()
+
+
+def _numbers_key(text: str) -> str:
+    return ",".join(_NUMBER_RE.findall(text))
+
+
+def sources_from_results(results: List[Dict]) -> List[Dict[str, Any]]:
+    """把检索结果转换为前端展示的来源列表"""
+    sources = []
+    for r in results or []:
+        meta = r.get("metadata", {}) or {}
+        sources.append(
+            {
+                "filename": meta.get("filename", "未知文件"),
+                "page_number": meta.get("page_number", "N/A"),
+                "snippet": (r.get("content", "") or "")[:500],
+                "duplicate_sources": parse_duplicate_sources(meta),
+            }
+        )
+    return sources
+
+
+class QueryLog:
+    """问题日志（JSON Lines，每行一条），供离线聚类使用"""
+
+    def __init__(self, path: str = QUERY_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, query: str, **fields: Any) -> None:
+        line = json.dumps({"ts": time.time(), "query": query, **fields}, ensure_ascii=False)
+        with self._lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                print(f"写入问题日志失败: {e}")
+
+
+def read_query_log(path: str = QUERY_LOG_PATH) -> Iterator[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 进程中断时可能留下不完整的最后一行
+            if isinstance(record, dict) and record.get("query"):
+                yield record
+
+
+class _QuestionIndex:
+    """问题索引：先按规范化文本精确匹配，再按SimHash近重复匹配（要求问题中的数字完全相同）"""
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        self.exact: Dict[str, int] = {}
+        self.near: Dict[str, Tuple[NearDuplicateIndex, List[int]]] = {}
+
+    def find(self, key: str, numbers: str) -> Optional[int]:
+        if key in self.exact:
+            return self.exact[key]
+        bucket = self.near.get(numbers)
+        if bucket is None:
+            return None
+        index, slots = bucket
+        match = index.find(simhash(key))
+        return None if match is None else slots[match]
+
+    def add(self, key: str, numbers: str, slot: int) -> None:
+        self.exact.setdefault(key, slot)
+        index, slots = self.near.setdefault(numbers, (NearDuplicateIndex(self.max_distance), []))
+        index.add(simhash(key))
+        slots.append(slot)
+
+
+def cluster_queries(queries: List[str], max_distance: int = FAQ_SIMHASH_DISTANCE) -> List[Dict[str, Any]]:
+    """把问题聚成簇，按出现次数从高到低返回
+
+    每个簇：question（簇内最常见的原始问法）、count（总次数）、variants（各规范化问法）。
+    """
+    by_key: Dict[str, Counter] = {}
+    for query in queries:
+        key = normalize_question(query)
+        if key:
+            by_key.setdefault(key, Counter())[query.strip()] += 1
+
+    index = _QuestionIndex(max_distance)
+    clusters: List[Dict[str, Any]] = []
+    # 高频问法先入簇，作为簇的代表
+    for key, raw in sorted(by_key.items(), key=lambda kv: -sum(kv[1].values())):
+        numbers = _numbers_key(key)
+        slot = index.find(key, numbers)
+        if slot is None:
+            slot = len(clusters)
+            clusters.append({"raw": Counter(), "variants": []})
+            index.add(key, numbers, slot)
+        clusters[slot]["raw"].update(raw)
+        clusters[slot]["variants"].append(key)
+
+    result = [
+        {
+            "question": c["raw"].most_common(1)[0][0],
+            "count": sum(c["raw"].values()),
+            "variants": c["variants"],
+        }
+        for c in clusters
+    ]
+    result.sort(key=lambda c: -c["count"])
+    return result
+
+
+class FAQStore:
+    """预计算回答的存储与索引
+
+    文件为JSON（整体原子替换）；内存索引以不可变快照的方式整体替换，查询不加锁。
+    问题的所有问法（variants）都加入索引，未见过的新问法再用SimHash近重复匹配。
+    """
+
+    def __init__(self, path: str = FAQ_STORE_PATH, max_distance: int = FAQ_SIMHASH_DISTANCE):
+        self.path = path
+        self.max_distance = max_distance
+        self._snapshot: Tuple[List[Dict[str, Any]], _QuestionIndex, Dict[str, Any]] = (
+            [], _QuestionIndex(max_distance), {}
+        )
+        self.hits = 0
+        self.misses = 0
+        self._file_sig: Optional[Tuple[int, int]] = None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def load(self) -> "FAQStore":
+        self._file_sig = self._stat()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._publish(data.get("entries", []), data.get("meta", {}))
+            except (OSError, ValueError) as e:
+                print(f"加载FAQ失败: {e}")
+        return self
+
+    def reload_if_changed(self) -> None:
+        """文件被其他进程（多进程服务的主worker）替换或删除后重新加载"""
+        if self._stat() == self._file_sig:
+            return
+        self._snapshot = ([], _QuestionIndex(self.max_distance), {})
+        self.load()
+
+    def _publish(self, entries: List[Dict[str, Any]], meta: Dict[str, Any]) -> None:
+        index = _QuestionIndex(self.max_distance)
+        for slot, entry in enumerate(entries):
+            for key in entry.get("variants") or [normalize_question(entry["question"])]:
+                index.add(key, _numbers_key(key), slot)
+        self._snapshot = (entries, index, meta)
+
+    def _write(self, entries: List[Dict[str, Any]], meta: Dict[str, Any]) -> None:
+        # 先写临时文件再替换，避免读到写了一半的文件
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "entries": entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._publish(entries, meta)
+
+    def replace(self, entries: List[Dict[str, Any]], meta: Optional[Dict[str, Any]] = None) -> None:
+        """写入重新计算的FAQ"""
+        self._write(entries, dict(meta or {}, built_at=time.time()))
+
+    def remove_sources(self, filenames: List[str]) -> int:
+        """删除引用了指定文件的回答（增量索引后这些回答可能过时），返回删除条数"""
+        entries, _index, meta = self._snapshot
+        names = set(filenames)
+        kept = [e for e in entries if not any(src.get("filename") in names for src in e.get("sources", []))]
+        removed = len(entries) - len(kept)
+        if removed:
+            self._write(kept, meta)
+        return removed
+
+    def clear(self) -> None:
+        """知识库变更后旧回答可能过时：清空内存索引并删除文件"""
+        self._snapshot = ([], _QuestionIndex(self.max_distance), {})
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def lookup(self, query: str, top_k: int = TOP_K) -> Optional[Dict[str, Any]]:
+        entries, index, meta = self._snapshot
+        if not entries or meta.get("top_k") != top_k:
+            return None
+        key = normalize_question(query)
+        slot = index.find(key, _numbers_key(key)) if key else None
+        if slot is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entries[slot]
+
+    def stats(self) -> Dict[str, Any]:
+        entries, _index, meta = self._snapshot
+        return {
+            "entries": len(entries),
+            "built_at": meta.get("built_at"),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def build_faq_entries(
+    agent: Any,
+    log_path: str = QUERY_LOG_PATH,
+    top_n: int = FAQ_TOP_CLUSTERS,
+    min_count: int = FAQ_MIN_COUNT,
+    top_k: int = TOP_K,
+    workers: int = FAQ_WORKERS,
+) -> List[Dict[str, Any]]:
+    """从问题日志中找出高频问题簇，批量检索并生成回答
+
+    只统计不带对话历史的问题（追问依赖上下文，不能直接复用回答）。
+    检索：所有问题的embedding一次批量计算；生成：多个请求并发。
+    """
+    queries = [r["query"] for r in read_query_log(log_path) if not r.get("history_len")]
+    clusters = [c for c in cluster_queries(queries) if c["count"] >= min_count][:top_n]
+    if not clusters:
+        return []
+
+    questions = [c["question"] for c in clusters]
+    embeddings = agent.vector_store.get_embeddings(questions)
+    retrieved = [
+        agent.retrieve_documents(q, top_k=top_k, query_embedding=e) for q, e in zip(questions, embeddings)
+    ]
+
+    def _answer(i: int) -> str:
+        context = agent.format_context(retrieved[i]) or _NO_CONTEXT
+        return agent.generate_response(questions[i], context)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        answers = list(pool.map(_answer, range(len(clusters))))
+
+    entries = []
+    for cluster, answer, results in zip(clusters, answers, retrieved):
+        # generate_response 出错时返回错误提示而不是抛异常，这类回答不缓存
+        if not answer or answer.startswith("生成回答时出错"):
+            continue
+        entries.append(
+            {
+                "question": cluster["question"],
+                "count": cluster["count"],
+                "variants": cluster["variants"],
+                "answer": answer,
+                "sources": sources_from_results(results),
+            }
+        )
+    return entries
+
+
+def build_faq_store(agent: Any, store: Optional[FAQStore] = None, **kwargs: Any) -> FAQStore:
+    """重新计算FAQ并写入存储"""
+    store = store or FAQStore()
+    top_k = kwargs.get("top_k", TOP_K)
+    entries = build_faq_entries(agent, **kwargs)
+    store.replace(entries, {"top_k": top_k})
+    return store
@@ -0,0 +1,375 @@
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    COLLECTION_NAME,
+    OPENAI_API_KEY,
+    OPENAI_API_BASE,
+    TOP_K,
+    MMR_LAMBDA,
+    HNSW_SPACE,
+    INDEX_SNAPSHOT_DIR,
+    SNAPSHOT_CHECK_INTERVAL,
+)
+from embeddings import get_embedding_provider
+from vector_store import mmr_select
+
+
+FORMAT_VERSION = 1
+_CURRENT = "CURRENT"
+_export_lock = threading.Lock()
+
+
+class SnapshotUnavailable(RuntimeError):
+    """collection还没有发布过快照"""
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _read_current(base: str) -> Optional[str]:
+    try:
+        with open(os.path.join(base, _CURRENT), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    return version or None
+
+
+def snapshot_available(collection_name: str, root: str = INDEX_SNAPSHOT_DIR) -> bool:
+    return _read_current(os.path.join(root, collection_name)) is not None
+
+
+def export_snapshot(vector_store: Any, root: str = INDEX_SNAPSHOT_DIR, batch_size: int = 1000) -> str:
+    """把 vector_store 的线上collection导出为只读快照并原子发布，返回版本目录（同一进程内串行执行）"""
+    with _export_lock:
+        return _export(vector_store, root, batch_size)
+
+
+def _export(vector_store: Any, root: str, batch_size: int) -> str:
+    """写出一个新的快照版本目录，再切换 CURRENT 指针
+
+    快照按列存储，均可直接内存映射：
+        vectors.npy              - float32 向量矩阵 (n, dim)
+        norms.npy                - 各向量的L2范数
+        texts.bin / texts.idx.npy     - 文档块内容（UTF-8拼接）及偏移
+        records.bin / records.idx.npy - 每块的 {"id", "metadata"}（JSON拼接）及偏移
+        files.npy / pages.npy    - 每块的文件序号和页码，用于按文件/页码过滤
+        manifest.json            - 块数、维度、距离度量、embedding模型、文件列表
+    内容和元数据已按文件表解码为完整格式，读取方不需要Chroma。
+    写完整个版本目录后才更新 CURRENT 指针（先写临时文件再替换），读取方不会看到写了一半的快照。
+    """
+    collection = vector_store.collection
+    base = os.path.join(root, vector_store.collection_name)
+    os.makedirs(base, exist_ok=True)
+    version = str(int(time.time() * 1000))
+    while os.path.exists(os.path.join(base, version)):
+        version = str(int(version) + 1)
+    tmp_dir = os.path.join(base, f"{version}.tmp")
+    os.makedirs(tmp_dir)
+
+    total = collection.count()
+    vectors = None
+    file_index: Dict[str, int] = {}
+    files: List[List[str]] = []
+    file_col = np.zeros(total, dtype=np.int32)
+    page_col = np.zeros(total, dtype=np.int32)
+    text_offsets = [0]
+    record_offsets = [0]
+    row = 0
+    try:
+        with open(os.path.join(tmp_dir, "texts.bin"), "wb") as texts_f, open(
+            os.path.join(tmp_dir, "records.bin"), "wb"
+        ) as records_f:
+            for offset in range(0, total, batch_size):
+                batch = collection.get(
+                    offset=offset, limit=batch_size, include=["documents", "metadatas", "embeddings"]
+                )
+                embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+                if vectors is None and len(embeddings):
+                    vectors = np.lib.format.open_memmap(
+                        os.path.join(tmp_dir, "vectors.npy"), mode="w+", dtype=np.float32,
+                        shape=(total, embeddings.shape[1]),
+                    )
+                for doc_id, doc, meta, embedding in zip(
+                    batch["ids"], batch["documents"], batch["metadatas"], embeddings
+                ):
+                    if row >= total:
+                        break
+                    content, meta = vector_store.doc_table.decode(doc, meta)
+                    filename = meta.get("filename", "unknown")
+                    if filename not in file_index:
+                        file_index[filename] = len(files)
+                        files.append([filename, meta.get("filetype", "")])
+                    file_col[row] = file_index[filename]
+                    page_col[row] = int(meta.get("page_number", 0) or 0)
+                    vectors[row] = embedding
+
+                    text_bytes = (content or "").encode("utf-8")
+                    texts_f.write(text_bytes)
+                    text_offsets.append(text_offsets[-1] + len(text_bytes))
+                    record = json.dumps({"id": doc_id, "metadata": meta}, ensure_ascii=False).encode("utf-8")
+                    records_f.write(record)
+                    record_offsets.append(record_offsets[-1] + len(record))
+                    row += 1
+
+        if vectors is None:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+            np.save(os.path.join(tmp_dir, "vectors.npy"), vectors)
+        else:
+            vectors.flush()
+        dim = vectors.shape[1]
+        # row < total 只在导出期间collection变小时出现；多余的行由读取方按 count 截掉
+        np.save(os.path.join(tmp_dir, "norms.npy"), np.linalg.norm(vectors[:row], axis=1).astype(np.float32))
+        del vectors
+        np.save(os.path.join(tmp_dir, "texts.idx.npy"), np.asarray(text_offsets, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, "records.idx.npy"), np.asarray(record_offsets, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, "files.npy"), file_col[:row])
+        np.save(os.path.join(tmp_dir, "pages.npy"), page_col[:row])
+
+        settings = vector_store.index_settings()
+        manifest = {
+            "format": FORMAT_VERSION,
+            "collection": vector_store.collection_name,
+            "count": row,
+            "dim": dim,
+            "space": settings.get("space") or HNSW_SPACE,
+            "embedding_model": (collection.metadata or {}).get("embedding_model") or vector_store.embedder.model_id,
+            "created_at": time.time(),
+            "files": files,
+        }
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    version_dir = os.path.join(base, version)
+    os.rename(tmp_dir, version_dir)
+    previous = _read_current(base)
+    _write_atomic(os.path.join(base, _CURRENT), version)
+    _prune_versions(base, keep={version, previous})
+    return version_dir
+
+
+def _prune_versions(base: str, keep: set) -> None:
+    """删除旧版本（保留当前和上一个：刚切换时仍可能有进程在读上一个版本）
+
+    已被其他进程映射的文件在POSIX系统上删除后仍可读，直到对方关闭映射。
+    """
+    for name in os.listdir(base):
+        path = os.path.join(base, name)
+        if name in keep or not os.path.isdir(path):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _map_bytes(path: str) -> Any:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""  # 空文件不能mmap
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class IndexSnapshot:
+    """一个快照版本的只读视图
+
+    所有数组都以内存映射方式打开，不拷贝到进程内存：多个worker进程读取同一快照时共享操作系统的页缓存，
+    进程数增加时常驻内存基本不变。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest: Dict[str, Any] = json.load(f)
+        if self.manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"不支持的快照格式: {self.manifest.get('format')}")
+        self.count = int(self.manifest["count"])
+        self.space = self.manifest.get("space") or "l2"
+        self.files: List[List[str]] = self.manifest["files"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")[: self.count]
+        self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode="r")
+        self.file_col = np.load(os.path.join(path, "files.npy"), mmap_mode="r")
+        self.page_col = np.load(os.path.join(path, "pages.npy"), mmap_mode="r")
+        self._text_idx = np.load(os.path.join(path, "texts.idx.npy"), mmap_mode="r")
+        self._record_idx = np.load(os.path.join(path, "records.idx.npy"), mmap_mode="r")
+        self._texts = _map_bytes(os.path.join(path, "texts.bin"))
+        self._records = _map_bytes(os.path.join(path, "records.bin"))
+
+    def select(
+        self,
+        filename: Optional[str] = None,
+        filetype: Optional[str] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+    ) -> Optional[np.ndarray]:
+        """满足过滤条件的行号；无过滤条件时返回None（表示全部）"""
+        if not filename and not filetype and page_range is None:
+            return None
+        mask = np.ones(self.count, dtype=bool)
+        if filename or filetype:
+            wanted = [
+                i for i, (name, ftype) in enumerate(self.files)
+                if (not filename or name == filename) and (not filetype or ftype == filetype)
+            ]
+            mask &= np.isin(self.file_col, wanted)
+        if page_range is not None:
+            start, end = page_range
+            mask &= (self.page_col >= start) & (self.page_col <= end)
+        return np.flatnonzero(mask)
+
+    def distances(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """与Chroma相同的距离定义：l2为平方欧氏距离，cosine为 1-余弦相似度，ip为 1-内积"""
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        norms = self.norms if rows is None else self.norms[rows]
+        dots = vectors @ query
+        if self.space == "cosine":
+            return 1.0 - dots / np.maximum(norms * max(float(np.linalg.norm(query)), 1e-12), 1e-12)
+        if self.space == "ip":
+            return 1.0 - dots
+        return float(query @ query) - 2.0 * dots + norms * norms
+
+    def text(self, row: int) -> str:
+        return bytes(self._texts[int(self._text_idx[row]) : int(self._text_idx[row + 1])]).decode("utf-8")
+
+    def record(self, row: int) -> Dict[str, Any]:
+        return json.loads(bytes(self._records[int(self._record_idx[row]) : int(self._record_idx[row + 1])]))
+
+    def result(self, row: int, distance: Optional[float] = None) -> Dict[str, Any]:
+        """与 VectorStore.search 相同格式的结果"""
+        record = self.record(row)
+        out = {"id": record["id"], "content": self.text(row), "metadata": record["metadata"]}
+        if distance is not None:
+            out["distance"] = float(distance)
+        return out
+
+
+class SnapshotVectorStore:
+    """VectorStore 的只读替代：在已发布的快照上检索，不打开Chroma
+
+    多进程服务时只读worker使用。检索为对内存映射向量矩阵的精确（暴力）计算，结果格式与
+    VectorStore.search 相同（包括MMR和文件/页码过滤）。至多每 SNAPSHOT_CHECK_INTERVAL 秒检查一次
+    CURRENT 指针，主worker发布新快照后自动切换，正在进行的检索继续使用旧版本。
+    """
+
+    def __init__(
+        self,
+        collection_name: str = COLLECTION_NAME,
+        root: str = INDEX_SNAPSHOT_DIR,
+        api_key: str = OPENAI_API_KEY,
+        api_base: str = OPENAI_API_BASE,
+    ):
+        self.collection_name = collection_name
+        self.base = os.path.join(root, collection_name)
+        self.embedder = get_embedding_provider(api_key=api_key, api_base=api_base)
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> IndexSnapshot:
+        """当前快照（有新版本时切换）；从未发布过时抛出 SnapshotUnavailable"""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < SNAPSHOT_CHECK_INTERVAL:
+            return self._snapshot
+        with self._lock:
+            self._checked_at = now
+            version = _read_current(self.base)
+            if version is None:
+                if self._snapshot is None:
+                    raise SnapshotUnavailable(f"collection {self.collection_name} 还没有索引快照")
+                return self._snapshot
+            if version != self._version:
+                snapshot = IndexSnapshot(os.path.join(self.base, version))
+                stored = snapshot.manifest.get("embedding_model")
+                if stored and stored != self.embedder.model_id:
+                    raise ValueError(
+                        f"索引快照 {self.collection_name} 由embedding模型 {stored} 生成，"
+                        f"与当前配置的 {self.embedder.model_id} 不一致，请重建知识库"
+                    )
+                # 单次赋值：正在进行的检索持有旧快照的引用，不受影响
+                self._snapshot, self._version = snapshot, version
+            return self._snapshot
+
+    def get_embedding(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        return self.embedder.embed_one(text, timeout=timeout)
+
+    def get_embeddings(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.embedder.embed(texts, timeout=timeout)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        fetch_k: Optional[int] = None,
+        mmr_lambda: float = MMR_LAMBDA,
+        filename: Optional[str] = None,
+        filetype: Optional[str] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        query_embedding: Optional[List[float]] = None,
+        timeout: Optional[float] = None,
+    ) -> List[Dict]:
+        """参数和返回格式与 VectorStore.search 相同"""
+        snapshot = self.snapshot()
+        if query_embedding is None:
+            query_embedding = self.get_embedding(query, timeout=timeout)
+        rows = snapshot.select(filename=filename, filetype=filetype, page_range=page_range)
+        total = snapshot.count if rows is None else len(rows)
+        use_mmr = fetch_k is not None and fetch_k > top_k
+        n = min(fetch_k if use_mmr else top_k, total)
+        if n <= 0:
+            return []
+
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        distances = snapshot.distances(query_vec, rows)
+        order = np.argpartition(distances, n - 1)[:n] if n < total else np.arange(total)
+        order = order[np.argsort(distances[order], kind="stable")]
+        candidates = order if rows is None else rows[order]
+        candidate_distances = distances[order]
+        if use_mmr:
+            picked = mmr_select(query_embedding, snapshot.vectors[candidates], top_k, mmr_lambda)
+            candidates = candidates[picked]
+            candidate_distances = candidate_distances[picked]
+        return [snapshot.result(row, d) for row, d in zip(candidates, candidate_distances)]
+
+    def get_page(self, filename: str, page_number: int) -> List[Dict]:
+        snapshot = self.snapshot()
+        rows = snapshot.select(filename=filename, page_range=(page_number, page_number))
+        return [snapshot.result(row) for row in rows]
+
+    def list_filenames(self) -> List[str]:
+        return sorted(name for name, _ftype in self.snapshot().files)
+
+    def get_collection_count(self) -> int:
+        return self.snapshot().count
+
+    def get_file_chunk_counts(self) -> Dict[str, int]:
+        snapshot = self.snapshot()
+        counts = np.bincount(snapshot.file_col, minlength=len(snapshot.files))
+        return {name: int(counts[i]) for i, (name, _ftype) in enumerate(snapshot.files)}
+
+    def get_disk_usage(self) -> int:
+        snapshot = self.snapshot()
+        return sum(os.path.getsize(os.path.join(snapshot.path, name)) for name in os.listdir(snapshot.path))
+
+    def warm_up(self) -> None:
+        """预热：把向量矩阵读入页缓存（各进程共享），并完成一次查询embedding"""
+        try:
+            snapshot = self.snapshot()
+        except SnapshotUnavailable:
+            return
+        if snapshot.count:
+            float(snapshot.vectors.sum(dtype=np.float64))
+        self.get_embedding("warm up")
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Entry:
+    def __init__(self) -> None:
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.retrieve_ms = 0.0
+
+
+class PrefetchCache:
+    """Speculative retrieval results, per session, for a short TTL.
+
+    The web UI sends the partial question while the user types; prefetch() runs the retrieval
+    and keeps the result under the normalized text. When /api/chat arrives with the same text,
+    take() hands the result over (once) instead of embedding and searching again. A chat that
+    arrives while the prefetch is still running waits for it rather than starting over.
+
+    Only the newest `per_session` keys of a session are kept: older ones are prefixes of
+    what the user went on to type and will not be asked.
+    """
+
+    def __init__(self, *, ttl_s: float = 20.0, per_session: int = 4, max_sessions: int = 256):
+        self.ttl_s = ttl_s
+        self.per_session = max(1, per_session)
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, OrderedDict[Hashable, _Entry]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {
+            "prefetches": 0,
+            "deduplicated": 0,  # same text already prefetched (or in flight) for the session
+            "errors": 0,
+            "hits": 0,
+            "inflight_hits": 0,  # hits that waited for a prefetch still running
+            "misses": 0,
+            "expired": 0,
+            "saved_ms": 0.0,
+        }
+
+    def _session(self, session: str) -> "OrderedDict[Hashable, _Entry]":
+        entries = self._sessions.get(session)
+        if entries is None:
+            entries = self._sessions[session] = OrderedDict()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session)
+        return entries
+
+    def prefetch(self, session: str, key: Hashable, retrieve: Callable[[], Any]) -> Dict[str, Any]:
+        """Run retrieve() for (session, key) unless a live entry already exists."""
+        now = time.monotonic()
+        with self._lock:
+            entries = self._session(session)
+            entry = entries.get(key)
+            if entry is not None and now - entry.created <= self.ttl_s:
+                self.stats["deduplicated"] += 1
+                return {"prefetched": False, "reason": "duplicate"}
+            entry = entries[key] = _Entry()
+            entries.move_to_end(key)
+            while len(entries) > self.per_session:
+                entries.popitem(last=False)
+            self.stats["prefetches"] += 1
+
+        t0 = time.perf_counter()
+        try:
+            entry.value = retrieve()
+        except BaseException as e:
+            entry.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            entry.retrieve_ms = (time.perf_counter() - t0) * 1000
+            entry.done.set()
+        return {"prefetched": True, "retrieve_ms": round(entry.retrieve_ms, 1)}
+
+    def take(self, session: str, key: Hashable, *, timeout: Optional[float] = None) -> Optional[Any]:
+        """The prefetched value for (session, key), or None (expired, failed, or never prefetched)."""
+        with self._lock:
+            entries = self._sessions.get(session)
+            entry = entries.pop(key, None) if entries is not None else None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if time.monotonic() - entry.created > self.ttl_s:
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+        waited = 0.0
+        if not entry.done.is_set():
+            t0 = time.perf_counter()
+            entry.done.wait(timeout)
+            waited = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            if not entry.done.is_set() or entry.error is not None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            if waited:
+                self.stats["inflight_hits"] += 1
+            self.stats["saved_ms"] += max(0.0, entry.retrieve_ms - waited)
+        return entry.value
+
+    def clear(self) -> None:
+        # After an index swap the cached results point at the old index.
+        with self._lock:
+            self._sessions.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self.stats)
+            out["sessions"] = len(self._sessions)
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 3) if lookups else None
+        out["saved_ms"] = round(out["saved_ms"], 1)
+        out["saved_ms_per_hit"] = round(out["saved_ms"] / out["hits"], 1) if out["hits"] else None
+        return out
@@ -0,0 +1,63 @@
+import os
+import signal
+import time
+import traceback
+from typing import Callable, Dict
+
+
+def fork_supported() -> bool:
+    return hasattr(os, "fork")
+
+
+def run_workers(count: int, child_main: Callable[[int], None], *, restart_delay_s: float = 1.0) -> None:
+    """Fork `count` children running child_main(index) and supervise them until SIGINT/SIGTERM.
+
+    A child that dies is forked again with the same index (after restart_delay_s, so a
+    crash at startup does not spin). Call this before the parent starts any thread:
+    fork() only copies the calling thread, and locks held by other threads stay locked.
+    """
+    children: Dict[int, int] = {}  # pid -> worker index
+    stopping = False
+
+    def _spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                child_main(index)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                # Never return into the parent's stack (or run its atexit handlers).
+                os._exit(code)
+        children[pid] = index
+
+    def _stop(_signum, _frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+    for index in range(count):
+        _spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue  # not a worker (e.g. a browser launcher), or shutting down
+        print(f"worker {index} (pid {pid}) exited with status {status}, restarting")
+        time.sleep(restart_delay_s)
+        if not stopping:
+            _spawn(index)
@@ -0,0 +1,266 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+MODES = ("cpu", "alloc")
+_TRACE_FRAMES = 32
+
+
+def _frame_label(filename: str, name: str, lineno: int) -> str:
+    # Collapsed stacks are "frame;frame;... <count>": ";" separates frames, the count follows the last space.
+    return f"{name} ({os.path.basename(filename)}:{lineno})".replace(";", ",")
+
+
+class _StackSampler:
+    """Samples one thread's Python stack every `interval_s` into collapsed-stack counts.
+
+    cProfile only records caller/callee pairs, so full stacks for a flame graph come from sampling.
+    """
+
+    def __init__(self, thread_id: int, interval_s: float):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(_frame_label(code.co_filename, code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+
+class _Session:
+    def __init__(self, store: "ProfileStore", kind: str, mode: str, meta: Dict[str, Any]):
+        self.store = store
+        self.kind = kind
+        self.mode = mode
+        self.meta = meta
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_StackSampler] = None
+        self._own_tracemalloc = False
+        if mode == "cpu":
+            self._sampler = _StackSampler(threading.get_ident(), store.stack_interval_s)
+            self._sampler.start()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(_TRACE_FRAMES)
+                self._own_tracemalloc = True
+            tracemalloc.reset_peak()
+            self._baseline = tracemalloc.get_traced_memory()[0]
+
+    def finish(self) -> Dict[str, Any]:
+        duration_ms = (time.perf_counter() - self._t0) * 1000
+        record: Dict[str, Any] = {
+            "kind": self.kind,
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "duration_ms": round(duration_ms, 1),
+            "pid": os.getpid(),
+            "meta": self.meta,
+        }
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._sampler.stop()
+            self._finish_cpu(record)
+        else:
+            self._finish_alloc(record)
+        return record
+
+    def _finish_cpu(self, record: Dict[str, Any]) -> None:
+        stats = pstats.Stats(self._profiler)
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats("cumulative").print_stats(60)
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:15]
+        record["summary"] = {
+            "top_cumulative": [
+                {
+                    "function": _frame_label(func[0], func[2], func[1]),
+                    "calls": nc,
+                    "tottime_ms": round(tt * 1000, 2),
+                    "cumtime_ms": round(ct * 1000, 2),
+                }
+                for func, (_cc, nc, tt, ct, _callers) in top
+            ],
+            "stack_samples": sum(self._sampler.counts.values()),
+        }
+        record["_text"] = text.getvalue()
+        # Same bytes as Stats.dump_stats(): loadable with pstats.Stats(path), snakeviz, etc.
+        record["_pstats"] = marshal.dumps(stats.stats)
+        record["_collapsed"] = "".join(f"{stack} {n}\n" for stack, n in self._sampler.counts.most_common())
+
+    def _finish_alloc(self, record: Dict[str, Any]) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        )
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+        by_line = snapshot.statistics("lineno")
+        text = io.StringIO()
+        text.write(f"peak {peak / 1024:.1f} KiB above start, retained {(current - self._baseline) / 1024:.1f} KiB\n")
+        for stat in by_line[:60]:
+            text.write(f"{stat}\n")
+        collapsed = []
+        for stat in snapshot.statistics("traceback"):
+            stack = ";".join(f"{os.path.basename(f.filename)}:{f.lineno}" for f in stat.traceback)
+            collapsed.append(f"{stack} {stat.size}\n")
+        record["summary"] = {
+            # tracemalloc is process-wide: allocations by concurrent requests are included.
+            "peak_kib": round((peak - self._baseline) / 1024, 1),
+            "retained_kib": round((current - self._baseline) / 1024, 1),
+            "top_lines": [
+                {
+                    "line": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "kib": round(stat.size / 1024, 1),
+                    "count": stat.count,
+                }
+                for stat in by_line[:15]
+            ],
+        }
+        record["_text"] = text.getvalue()
+        record["_collapsed"] = "".join(collapsed)
+
+
+class ProfileStore:
+    """Opt-in request profiling with the last `keep` profiles kept in memory.
+
+    At most one profile runs at a time (tracemalloc is process-wide, and one cProfile at a time
+    bounds the overhead); a request sampled while another profile is running is skipped.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: bool = False,
+        sample_every: int = 0,
+        mode: str = "cpu",
+        keep: int = 20,
+        stack_interval_ms: float = 5.0,
+    ):
+        self.enabled = enabled
+        self.sample_every = max(0, int(sample_every))
+        self.mode = mode if mode in MODES else "cpu"
+        self.stack_interval_s = max(0.001, stack_interval_ms / 1000)
+        self._profiles: Deque[Dict[str, Any]] = deque(maxlen=max(1, keep))
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+        self._requests = 0
+        self._seq = 0
+        self.counters: Dict[str, int] = {"recorded": 0, "skipped_busy": 0}
+
+    def choose_mode(self, header: Optional[str], *, sampled: bool = True) -> Optional[str]:
+        """Mode to profile this request with, or None.
+
+        `header` is the X-Profile request header ("cpu", "alloc", or "1" for the configured mode).
+        Without it, every `sample_every`-th sampled request is profiled.
+        """
+        if not self.enabled:
+            return None
+        value = (header or "").strip().lower()
+        if value in MODES:
+            return value
+        if value in ("1", "true", "yes"):
+            return self.mode
+        if not sampled or not self.sample_every:
+            return None
+        with self._lock:
+            self._requests += 1
+            return self.mode if self._requests % self.sample_every == 0 else None
+
+    def begin(self, kind: str, mode: Optional[str], **meta: Any) -> Optional[_Session]:
+        """Start profiling the calling thread; returns None when mode is None or a profile is already running."""
+        if mode is None:
+            return None
+        if not self._active.acquire(blocking=False):
+            with self._lock:
+                self.counters["skipped_busy"] += 1
+            return None
+        try:
+            return _Session(self, kind, mode, meta)
+        except Exception:
+            self._active.release()
+            raise
+
+    def end(self, session: Optional[_Session]) -> None:
+        if session is None:
+            return
+        try:
+            record = session.finish()
+        finally:
+            self._active.release()
+        with self._lock:
+            self._seq += 1
+            record["id"] = f"{os.getpid()}-{self._seq}"
+            self._profiles.append(record)
+            self.counters["recorded"] += 1
+
+    def listing(self) -> Dict[str, Any]:
+        with self._lock:
+            profiles = [{k: v for k, v in p.items() if not k.startswith("_")} for p in reversed(self._profiles)]
+            counters = dict(self.counters, requests=self._requests)
+        return {
+            "enabled": self.enabled,
+            "sample_every": self.sample_every,
+            "mode": self.mode,
+            "pid": os.getpid(),
+            "counters": counters,
+            "profiles": profiles,
+        }
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for profile in self._profiles:
+                if profile["id"] == profile_id:
+                    return profile
+        return None
+
+
+class StageProfiler:
+    """Profiles consecutive stages of one job (e.g. a rebuild) as separate profiles.
+
+    switch(stage) ends the previous stage's profile and starts the next; close() ends the last
+    one and must run in a finally block so a failed job does not keep the profiler busy.
+    """
+
+    def __init__(self, store: ProfileStore, kind: str, mode: Optional[str], **meta: Any):
+        self.store = store
+        self.kind = kind
+        self.mode = mode
+        self.meta = meta
+        self._session: Optional[_Session] = None
+
+    def switch(self, stage: str) -> None:
+        self.close()
+        self._session = self.store.begin(f"{self.kind}:{stage}", self.mode, **self.meta)
+
+    def close(self) -> None:
+        session, self._session = self._session, None
+        self.store.end(session)
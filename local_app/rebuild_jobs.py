@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+# Jobs in these states left a shadow collection and parsed-file cache behind that a new
+# rebuild over the same files can pick up.
+RESUMABLE_STATUSES = ("running", "interrupted", "failed")
+
+
+def _atomic_write_json(path: Path, data: Any) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RebuildJobStore:
+    """Durable state for knowledge-base rebuilds.
+
+    Layout under `root`:
+      current.json        the latest job (status, plan, per-file and per-batch progress, timings)
+      history.jsonl       one line per finished job
+      <job_id>/docs/      parsed documents per source file (per-file checkpoint)
+
+    Embedded batches are checkpointed by the shadow collection itself (Chroma persists it);
+    `batches_done` in current.json records how far that got, so a resumed job skips them.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._current_path = self.root / "current.json"
+        self._history_path = self.root / "history.jsonl"
+
+    @staticmethod
+    def plan_fingerprint(files: List[Path], settings: Dict[str, Any]) -> str:
+        # Same paths, sizes and mtimes, and the same embedding model / chunking / dedup settings
+        # => same chunks in the same order with comparable vectors => batches line up.
+        h = hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        for fp in files:
+            st = fp.stat()
+            h.update(f"{fp}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._current_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, job: Dict[str, Any]) -> None:
+        job["updated_at"] = time.time()
+        _atomic_write_json(self._current_path, job)
+
+    def create(self, files: List[Path], base: Path, settings: Dict[str, Any]) -> Dict[str, Any]:
+        previous = self.current()
+        if previous is not None and previous.get("status") in RESUMABLE_STATUSES:
+            # A different plan replaces the unfinished job: record it and drop its parsed-file cache.
+            self.finish(previous, "superseded", previous.get("error"))
+        job = {
+            "job_id": time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6],
+            "status": "running",
+            "created_at": time.time(),
+            "finished_at": None,
+            "plan": self.plan_fingerprint(files, settings),
+            "settings": settings,
+            "files": {fp.relative_to(base).as_posix(): {"status": "pending"} for fp in files},
+            "stage": "starting",
+            "timings_ms": {},
+            "chunks_total": 0,
+            "batches_total": 0,
+            "batches_done": 0,
+            "batches_resumed": 0,
+            "resumes": 0,
+            "error": None,
+        }
+        self.save(job)
+        return job
+
+    def find_resumable(self, files: List[Path], settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        job = self.current()
+        if job is None or job.get("status") not in RESUMABLE_STATUSES:
+            return None
+        if job.get("plan") != self.plan_fingerprint(files, settings):
+            return None
+        return job
+
+    def mark_interrupted(self) -> Optional[Dict[str, Any]]:
+        """Called at startup: a job still marked running belonged to a process that died."""
+        job = self.current()
+        if job is not None and job.get("status") == "running":
+            job["status"] = "interrupted"
+            self.save(job)
+        return job
+
+    def add_timing(self, job: Dict[str, Any], stage: str, ms: float) -> None:
+        job["timings_ms"][stage] = int(job["timings_ms"].get(stage, 0) + ms)
+
+    def finish(self, job: Dict[str, Any], status: str, error: Optional[str] = None) -> None:
+        job["status"] = status
+        job["error"] = error
+        job["finished_at"] = time.time()
+        self.save(job)
+        summary = {k: v for k, v in job.items() if k != "files"}
+        summary["files_total"] = len(job.get("files", {}))
+        with open(self._history_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        if status not in RESUMABLE_STATUSES:
+            shutil.rmtree(self.root / job["job_id"], ignore_errors=True)
+
+    def history(self, limit: int = 20) -> List[Dict[str, Any]]:
+        try:
+            with open(self._history_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()[-limit:]
+        except OSError:
+            return []
+        out = []
+        for line in reversed(lines):
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue
+        return out
+
+    # Per-file checkpoint: parsed documents, keyed by the file's path, size and mtime.
+
+    def _docs_path(self, job: Dict[str, Any], fp: Path) -> Path:
+        st = fp.stat()
+        key = hashlib.sha1(f"{fp}\0{st.st_size}\0{st.st_mtime_ns}".encode("utf-8")).hexdigest()
+        return self.root / job["job_id"] / "docs" / f"{key}.json"
+
+    def load_docs(self, job: Dict[str, Any], fp: Path) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with open(self._docs_path(job, fp), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_docs(self, job: Dict[str, Any], fp: Path, docs: List[Dict[str, Any]]) -> None:
+        path = self._docs_path(job, fp)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write_json(path, docs)
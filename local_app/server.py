@@ -1,18 +1,34 @@
+import functools
+import http.client
+import itertools
 import json
 import os
+import posixpath
+import select
+import socket
 import sys
 import threading
 import time
 import traceback
 import webbrowser
+from collections import deque
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from local_app.prefetch import PrefetchCache
+from local_app.prefork import fork_supported, run_workers
+from local_app.profiling import ProfileStore, StageProfiler
+from local_app.static_assets import AssetCache, parse_range
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 WEB_ROOT = Path(__file__).resolve().parent / "web"
+SUPPORTED_SUFFIXES = {".pdf", ".pptx", ".docx", ".txt"}
+# In multi-worker mode these are answered by the primary worker, which owns the rebuild state.
+PRIMARY_ONLY_PATHS = ("/api/status", "/api/rebuild")
 
 
 def _json_bytes(data: Any, *, status: int = 200) -> Tuple[int, bytes]:
@@ -32,6 +48,18 @@ def _read_json_body(handler: BaseHTTPRequestHandler, *, limit: int = 2_000_000)
     return json.loads(raw.decode("utf-8"))
 
 
+def _ensure_project_on_path() -> None:
+    # Called on hot paths (status polling); avoid growing sys.path on every call.
+    root = str(PROJECT_ROOT)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+
+def _project_path(path: str) -> Path:
+    # Relative config paths are relative to the project root.
+    return Path(path).resolve() if os.path.isabs(path) else (PROJECT_ROOT / path).resolve()
+
+
 def _safe_join(base: Path, requested_path: str) -> Optional[Path]:
     # Prevent path traversal; return None if the resolved path is outside base.
     requested_path = requested_path.lstrip("/")
@@ -43,41 +71,99 @@ def _safe_join(base: Path, requested_path: str) -> Optional[Path]:
     return resolved
 
 
+def _watch_client_disconnect(conn: socket.socket, token: Any, stop: threading.Event, *, interval: float = 0.2) -> None:
+    # The request body has been read, so the socket only becomes readable again when the
+    # client closes it (EOF) or pipelines another request; only EOF cancels.
+    while not stop.is_set() and not token.cancelled:
+        try:
+            readable, _, _ = select.select([conn], [], [], interval)
+        except (OSError, ValueError):
+            return
+        if not readable or stop.is_set():
+            continue
+        try:
+            data = conn.recv(1, socket.MSG_PEEK)
+        except OSError:
+            data = b""
+        if not data:
+            token.cancel("client_disconnected")
+        return
+
+
 class _RebuildState:
+    # Events are kept in a fixed-size ring buffer; each gets a monotonically increasing
+    # sequence number so pollers can ask for "everything after N" (see events_since).
+    EVENT_BUFFER_SIZE = 5000
+    MAX_EVENTS_PER_POLL = 1000
+
     def __init__(self) -> None:
         self.lock = threading.Lock()
         self.running = False
         self.last_started_at: Optional[float] = None
         self.last_finished_at: Optional[float] = None
         self.last_error: Optional[str] = None
-        self.logs: List[str] = []
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=self.EVENT_BUFFER_SIZE)
+        self.seq = 0  # sequence number of the newest event
         self.stage: str = "idle"
         self.current: int = 0
         self.total: int = 0
 
+    def _progress(self) -> Dict[str, Any]:
+        percent = 0
+        if self.total > 0:
+            percent = int(min(100, max(0, (self.current / self.total) * 100)))
+        return {
+            "running": self.running,
+            "last_started_at": self.last_started_at,
+            "last_finished_at": self.last_finished_at,
+            "last_error": self.last_error,
+            "stage": self.stage,
+            "current": self.current,
+            "total": self.total,
+            "percent": percent,
+        }
+
     def snapshot(self) -> Dict[str, Any]:
         with self.lock:
-            percent = 0
-            if self.total > 0:
-                percent = int(min(100, max(0, (self.current / self.total) * 100)))
-            return {
-                "running": self.running,
-                "last_started_at": self.last_started_at,
-                "last_finished_at": self.last_finished_at,
-                "last_error": self.last_error,
-                "logs_tail": self.logs[-400:],
-                "stage": self.stage,
-                "current": self.current,
-                "total": self.total,
-                "percent": percent,
-            }
+            return dict(self._progress(), last_seq=self.seq)
+
+    def events_since(self, since: int, limit: int = MAX_EVENTS_PER_POLL) -> Dict[str, Any]:
+        """Events with seq > since (oldest first), plus the current progress.
+
+        Seqs in the buffer are contiguous, so the start offset is computed from `since` and
+        at most `limit` events are sliced out from the nearer end of the deque.
 
-    def append_log(self, line: str) -> None:
+        `truncated` is set when events after `since` were already evicted (or the caller's
+        `since` is from before a restart); the client should treat the feed as restarted at
+        `events[0]["seq"]`.
+        """
+        limit = max(1, min(int(limit), self.MAX_EVENTS_PER_POLL))
         with self.lock:
-            self.logs.append(line)
-            # cap memory
-            if len(self.logs) > 5000:
-                self.logs = self.logs[-5000:]
+            since = min(max(0, int(since)), self.seq)
+            wanted = self.seq - since
+            available = min(wanted, len(self.events))
+            take = min(available, limit)
+            start = len(self.events) - available  # deque index of the first event after `since`
+            if start <= len(self.events) - start:
+                events = list(itertools.islice(self.events, start, start + take))
+            else:
+                end_from_right = available - take  # newer events left for the next poll
+                events = list(itertools.islice(reversed(self.events), end_from_right, available))[::-1]
+            return dict(
+                self._progress(),
+                events=events,
+                next_since=events[-1]["seq"] if events else since,
+                last_seq=self.seq,
+                truncated=available < wanted,
+            )
+
+    def append_log(self, line: str, *, level: str = "info") -> None:
+        with self.lock:
+            self.seq += 1
+            # Oldest events fall off the left end; appending never reallocates the buffer.
+            self.events.append(
+                {"seq": self.seq, "ts": time.time(), "level": level, "stage": self.stage, "message": line}
+            )
 
     def set_progress(self, *, stage: str, current: int, total: int) -> None:
         with self.lock:
@@ -86,32 +172,348 @@ class _RebuildState:
             self.total = int(total)
 
 
+class _CollectionStats:
+    """Copy-on-write snapshot of collection statistics.
+
+    Writers build a new dict under ``_write_lock`` and swap the reference; readers
+    just grab ``self._snapshot`` (an atomic attribute load) and never block, so
+    status polling does not contend with the rebuild worker or the vector DB.
+    Published snapshots must be treated as read-only.
+    """
+
+    def __init__(self) -> None:
+        self._write_lock = threading.Lock()
+        self._refreshing = False
+        self._snapshot: Dict[str, Any] = {
+            "loaded": False,
+            "count": None,
+            "files": {},
+            "index_bytes": None,
+            "last_rebuild_at": None,
+            "updated_at": None,
+            "error": None,
+        }
+
+    def get(self) -> Dict[str, Any]:
+        return self._snapshot
+
+    def publish(self, **fields: Any) -> None:
+        with self._write_lock:
+            snap = dict(self._snapshot)
+            snap.update(fields)
+            snap["updated_at"] = time.time()
+            self._snapshot = snap
+
+    def refresh_from(self, vector_store: Any, **extra: Any) -> None:
+        try:
+            files = vector_store.get_file_chunk_counts()
+            self.publish(
+                loaded=True,
+                count=sum(files.values()),
+                files=files,
+                index_bytes=vector_store.get_disk_usage(),
+                error=None,
+                **extra,
+            )
+        except Exception as e:
+            self.publish(loaded=True, error=str(e), **extra)
+
+    def try_begin_refresh(self) -> bool:
+        with self._write_lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+            return True
+
+    def end_refresh(self) -> None:
+        with self._write_lock:
+            self._refreshing = False
+
+
+class _WarmupState:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.started = False
+        self.ready = False
+        self.stage: str = "pending"
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.timings_ms: Dict[str, int] = {}
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "ready": self.ready,
+                "stage": self.stage,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "error": self.error,
+                "timings_ms": dict(self.timings_ms),
+            }
+
+
 class RagWebApp:
     def __init__(self) -> None:
         self._agent = None
         self._agent_lock = threading.Lock()
         self._rebuild = _RebuildState()
+        self._stats = _CollectionStats()
+        self._warmup = _WarmupState()
+        self._router = None
+        self._watchers: Dict[str, Any] = {}
+        self._faq = None
+        self._query_log = None
+        self._faq_lock = threading.Lock()
+        self._faq_building = False
+        self._faq_error: Optional[str] = None
+        self._jobs: Dict[str, Any] = {}
+        self._rebuild_cancel = None
+        self._profiles: Optional[ProfileStore] = None
+        self._prefetch: Optional[PrefetchCache] = None
+        self._prefetch_lock = threading.Lock()
+        self._cancel_lock = threading.Lock()
+        self._cancel_stats: Dict[str, Any] = {"completed": 0, "client_disconnected": 0, "deadline": 0, "by_stage": {}}
+        # "single" (one process), or in multi-worker mode "primary" (owns Chroma, rebuilds and
+        # publishes index snapshots) / "reader" (searches the memory-mapped snapshots only).
+        self.role = "single"
+        self.workers = 1
+        self.primary_port: Optional[int] = None
+
+    def configure_worker(self, role: str, *, workers: int, primary_port: int) -> None:
+        self.role = role
+        self.workers = workers
+        self.primary_port = primary_port
+
+    def profiles(self) -> ProfileStore:
+        # Per process: in multi-worker mode each worker keeps the profiles of the requests it served.
+        if self._profiles is None:
+            _ensure_project_on_path()
+            from config import (  # type: ignore
+                PROFILING_ENABLED,
+                PROFILE_SAMPLE_EVERY,
+                PROFILE_MODE,
+                PROFILE_KEEP,
+                PROFILE_STACK_INTERVAL_MS,
+            )
 
-    def _load_agent(self):
+            self._profiles = ProfileStore(
+                enabled=PROFILING_ENABLED,
+                sample_every=PROFILE_SAMPLE_EVERY,
+                mode=PROFILE_MODE,
+                keep=PROFILE_KEEP,
+                stack_interval_ms=PROFILE_STACK_INTERVAL_MS,
+            )
+        return self._profiles
+
+    def _prefetch_cache(self) -> Optional[PrefetchCache]:
+        # None when PREFETCH_ENABLED is off. Per process: in multi-worker mode a chat only hits
+        # when it lands on the worker that served the prefetch (usually the same keep-alive connection).
+        with self._prefetch_lock:
+            if self._prefetch is None:
+                _ensure_project_on_path()
+                from config import PREFETCH_ENABLED, PREFETCH_TTL_SECONDS  # type: ignore
+
+                if not PREFETCH_ENABLED:
+                    return None
+                self._prefetch = PrefetchCache(ttl_s=PREFETCH_TTL_SECONDS)
+            return self._prefetch
+
+    @staticmethod
+    def _prefetch_key(message: str, course: str, top_k: int) -> Tuple[str, str, int]:
+        # Only whitespace is collapsed: punctuation changes the parsed page scope
+        # ("第5-7页" vs "第57页"), so texts that differ in it must not share a retrieval.
+        return (" ".join(message.split()), course, int(top_k))
+
+    def prefetch(self, message: str, *, session: str, course: Optional[str] = None, top_k: int = 3) -> Dict[str, Any]:
+        """Speculatively run the retrieval for a question that is still being typed.
+
+        The result is kept for PREFETCH_TTL_SECONDS under (session, whitespace-collapsed text, course, top_k);
+        a chat with the same session and text uses it instead of retrieving again.
+        Raises ValueError for an unknown course.
+        """
+        cache = self._prefetch_cache()
+        if cache is None:
+            return {"prefetched": False, "reason": "disabled"}
+        from config import MULTI_QUERY_ENABLED, PREFETCH_MIN_CHARS  # type: ignore
+
+        course = self.resolve_course(course)
+        key = self._prefetch_key(message, course, top_k)
+        if len(key[0]) < PREFETCH_MIN_CHARS:
+            return {"prefetched": False, "reason": "too_short"}
+        if MULTI_QUERY_ENABLED:
+            return {"prefetched": False, "reason": "multi_query"}
+        if not self.serves_chat_locally(course):
+            return {"prefetched": False, "reason": "not_ready"}
+        from courses import ALL_COURSES  # type: ignore
+
+        agent = self._load_agent(None if course == ALL_COURSES else course)
+        return cache.prefetch(session, key, lambda: self._retrieve(agent, message, top_k, False, None, course))
+
+    def prefetch_status(self) -> Dict[str, Any]:
+        cache = self._prefetch_cache()
+        if cache is None:
+            return {"enabled": False}
+        return dict(cache.snapshot(), enabled=True)
+
+    def _course_router(self):
         # Lazy import to keep server import-time lightweight and ensure PROJECT_ROOT is set.
         with self._agent_lock:
-            if self._agent is not None:
-                return self._agent
-            sys.path.insert(0, str(PROJECT_ROOT))
-            from config import MODEL_NAME  # type: ignore
-            from rag_agent import RAGAgent  # type: ignore
+            if self._router is None:
+                _ensure_project_on_path()
+                from config import MODEL_NAME  # type: ignore
+                from courses import CourseRouter  # type: ignore
+
+                store_factory = None
+                if self.role == "reader":
+                    from index_snapshot import SnapshotVectorStore  # type: ignore
+
+                    def store_factory(course):
+                        return SnapshotVectorStore(collection_name=course.collection)
+
+                self._router = CourseRouter(model=MODEL_NAME, store_factory=store_factory)
+            return self._router
+
+    def _load_agent(self, course: Optional[str] = None):
+        # One agent per course (its own collection); self._agent is the default course's,
+        # which status, collection stats and the FAQ keep referring to.
+        router = self._course_router()
+        agent = router.agent(course)
+        if self._agent is None and router.resolve(course) == router.default_id:
+            self._agent = agent
+        return agent
+
+    def resolve_course(self, course: Optional[str]) -> str:
+        """Course id for a request: None means the default course, "*" all courses; ValueError if unknown."""
+        from courses import ALL_COURSES  # type: ignore
+
+        return ALL_COURSES if course == ALL_COURSES else self._course_router().resolve(course)
+
+    def serves_chat_locally(self, course: str) -> bool:
+        """False for a reader worker until the primary has published snapshots of the course(s)."""
+        if self.role != "reader":
+            return True
+        from courses import ALL_COURSES  # type: ignore
+        from index_snapshot import snapshot_available  # type: ignore
+
+        router = self._course_router()
+        course_ids = list(router.courses) if course == ALL_COURSES else [course]
+        return all(snapshot_available(router.courses[c].collection) for c in course_ids)
+
+    def _publish_snapshot(self, vector_store: Any) -> None:
+        # Only the primary of a multi-worker server writes snapshots; the readers map them.
+        if self.role != "primary":
+            return
+        try:
+            from index_snapshot import export_snapshot  # type: ignore
+
+            t0 = time.perf_counter()
+            path = export_snapshot(vector_store)
+            self._rebuild.append_log(
+                f"[{time.strftime('%H:%M:%S')}] 已发布索引快照 {vector_store.collection_name}/{os.path.basename(path)}"
+                f"（{int((time.perf_counter() - t0) * 1000)} ms）"
+            )
+        except Exception:
+            self._rebuild.append_log(traceback.format_exc(), level="error")
+
+    def publish_snapshots_async(self) -> None:
+        """Primary worker startup: snapshot every course so the readers serve the current index."""
+
+        def _worker():
+            for course_id in self._course_router().courses:
+                try:
+                    vector_store = self._load_agent(course_id).vector_store
+                except Exception:
+                    self._rebuild.append_log(traceback.format_exc(), level="error")
+                    continue
+                self._publish_snapshot(vector_store)
+
+        threading.Thread(target=_worker, daemon=True).start()
+
+    def _course(self, course: Optional[str]):
+        router = self._course_router()
+        return router.courses[router.resolve(course)]
+
+    def _is_default_course(self, course: Optional[str]) -> bool:
+        router = self._course_router()
+        return router.resolve(course) == router.default_id
 
-            self._agent = RAGAgent(model=MODEL_NAME)
-            return self._agent
+    def courses(self) -> Dict[str, Any]:
+        from courses import ALL_COURSES  # type: ignore
+
+        router = self._course_router()
+        loaded = router.loaded_agents()
+        return {
+            "default": router.default_id,
+            "all": ALL_COURSES,
+            "courses": [
+                {
+                    "id": course.id,
+                    "name": course.name,
+                    "data_dir": course.data_dir,
+                    "collection": course.collection,
+                    "loaded": course.id in loaded,
+                }
+                for course in router.courses.values()
+            ],
+            "cross_course": dict(router.stats),
+        }
+
+    def warm_up_async(self) -> Dict[str, Any]:
+        # Pay the heavy imports, Chroma startup, HNSW load and first embedding round trip
+        # in the background at boot instead of on the first user request.
+        with self._warmup.lock:
+            if self._warmup.started:
+                return {"started": False}
+            self._warmup.started = True
+            self._warmup.started_at = time.time()
+
+        def _stage(name: str, fn):
+            with self._warmup.lock:
+                self._warmup.stage = name
+            t0 = time.perf_counter()
+            result = fn()
+            with self._warmup.lock:
+                self._warmup.timings_ms[name] = int((time.perf_counter() - t0) * 1000)
+            return result
+
+        def _worker():
+            try:
+                agent = _stage("load_agent", self._load_agent)
+                # The agent can serve requests from here on; the rest only trims first-query latency.
+                with self._warmup.lock:
+                    self._warmup.ready = True
+                _stage("collection_stats", lambda: self._stats.refresh_from(agent.vector_store))
+                _stage("load_index", agent.vector_store.warm_up)
+                if agent.reranker is not None:
+                    # Loads in its own thread; re-ranking is skipped until it is ready.
+                    agent.reranker.ensure_loading()
+                with self._warmup.lock:
+                    self._warmup.stage = "done"
+            except Exception as e:
+                with self._warmup.lock:
+                    self._warmup.error = str(e)
+                    self._warmup.stage = "failed"
+            finally:
+                with self._warmup.lock:
+                    self._warmup.finished_at = time.time()
+
+        threading.Thread(target=_worker, daemon=True).start()
+        return {"started": True}
+
+    def ready(self) -> Dict[str, Any]:
+        return self._warmup.snapshot()
 
     def status(self) -> Dict[str, Any]:
-        sys.path.insert(0, str(PROJECT_ROOT))
+        _ensure_project_on_path()
         from config import (  # type: ignore
             DATA_DIR,
             VECTOR_DB_PATH,
             MODEL_NAME,
             OPENAI_API_BASE,
             OPENAI_EMBEDDING_MODEL,
+            EMBEDDING_PROVIDER,
+            LOCAL_EMBEDDING_MODEL,
             TOP_K,
             CHUNK_SIZE,
             CHUNK_OVERLAP,
@@ -120,13 +522,9 @@ class RagWebApp:
         data_dir = (PROJECT_ROOT / DATA_DIR).resolve() if not os.path.isabs(DATA_DIR) else Path(DATA_DIR)
         vector_db = (PROJECT_ROOT / VECTOR_DB_PATH).resolve() if not os.path.isabs(VECTOR_DB_PATH) else Path(VECTOR_DB_PATH)
 
-        count = None
-        count_error = None
-        try:
-            agent = self._load_agent()
-            count = agent.vector_store.get_collection_count()
-        except Exception as e:
-            count_error = str(e)
+        stats = self._stats.get()
+        if not stats["loaded"]:
+            self.refresh_stats_async()
 
         return {
             "project_root": str(PROJECT_ROOT),
@@ -134,22 +532,142 @@ class RagWebApp:
             "data_dir_exists": data_dir.exists(),
             "vector_db_path": str(vector_db),
             "vector_db_exists": vector_db.exists(),
-            "collection_count": count,
-            "collection_count_error": count_error,
+            "collection_count": stats["count"],
+            "collection_count_error": stats["error"],
+            "collection_stats": stats,
             "model": MODEL_NAME,
-            "embedding_model": OPENAI_EMBEDDING_MODEL,
+            "embedding_provider": EMBEDDING_PROVIDER,
+            "embedding_model": LOCAL_EMBEDDING_MODEL if EMBEDDING_PROVIDER == "local" else OPENAI_EMBEDDING_MODEL,
             "api_base": OPENAI_API_BASE,
             "defaults": {
                 "top_k": TOP_K,
                 "chunk_size": CHUNK_SIZE,
                 "chunk_overlap": CHUNK_OVERLAP,
             },
+            "warmup": self._warmup.snapshot(),
+            "watcher": self.watcher_status(),
+            "rerank": self._reranker_status(),
+            "retrieval": self._retrieval_status(),
+            "prompt_cache": self._prompt_cache_status(),
+            "prefetch": self.prefetch_status(),
+            "faq": self.faq_status(),
+            "cancellation": self.cancellation_status(),
             "rebuild": self._rebuild.snapshot(),
+            # Only once the agent machinery is imported; status must stay cheap before warmup.
+            "courses": self.courses() if self._router is not None else None,
+            "serving": {"role": self.role, "workers": self.workers, "pid": os.getpid()},
         }
 
+    def _reranker_status(self) -> Dict[str, Any]:
+        agent = self._agent
+        reranker = getattr(agent, "reranker", None)
+        if reranker is None:
+            return {"enabled": False}
+        return {"enabled": True, "model": reranker.model_name, "stats": dict(reranker.stats)}
+
+    def _retrieval_status(self) -> Dict[str, Any]:
+        agent = self._agent
+        stats = getattr(agent, "retrieval_stats", None)
+        if stats is None:
+            return {}
+        out: Dict[str, Any] = dict(stats)
+        if stats["single_calls"] and stats["multi_calls"]:
+            # What the sub-query fan-out costs on top of a plain single-query retrieval.
+            out["multi_overhead_ms"] = round(stats["multi_ms"] - stats["single_ms"], 1)
+        return out
+
+    def _prompt_cache_status(self) -> Dict[str, Any]:
+        # Summed over the loaded course agents (cross-course answers use the default agent).
+        router = self._router
+        agents = list(router.loaded_agents().values()) if router is not None else []
+        out: Dict[str, Any] = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "no_usage": 0}
+        for agent in agents:
+            for key in out:
+                out[key] += agent.prompt_stats.get(key, 0)
+        out["cached_ratio"] = round(out["cached_tokens"] / out["prompt_tokens"], 3) if out["prompt_tokens"] else None
+        return out
+
+    def cancellation_status(self) -> Dict[str, Any]:
+        with self._cancel_lock:
+            return dict(self._cancel_stats, by_stage=dict(self._cancel_stats["by_stage"]))
+
+    def record_cancellation(self, reason: str, stage: str) -> None:
+        with self._cancel_lock:
+            self._cancel_stats[reason] = self._cancel_stats.get(reason, 0) + 1
+            by_stage = self._cancel_stats["by_stage"]
+            by_stage[stage] = by_stage.get(stage, 0) + 1
+
     def rebuild_status(self) -> Dict[str, Any]:
         return self._rebuild.snapshot()
 
+    def rebuild_events(self, since: int, limit: int = _RebuildState.MAX_EVENTS_PER_POLL) -> Dict[str, Any]:
+        return self._rebuild.events_since(since, limit)
+
+    def refresh_stats_async(self) -> None:
+        # Populate the stats snapshot off the request path (first load builds the agent).
+        if not self._stats.try_begin_refresh():
+            return
+
+        def _worker():
+            try:
+                agent = self._load_agent()
+                self._stats.refresh_from(agent.vector_store)
+            except Exception as e:
+                self._stats.publish(loaded=True, error=str(e))
+            finally:
+                self._stats.end_refresh()
+
+        threading.Thread(target=_worker, daemon=True).start()
+
+    def _load_faq(self):
+        # Returns (store, query_log), or (None, None) when the FAQ feature is disabled.
+        with self._faq_lock:
+            if self._query_log is not None:
+                return self._faq, self._query_log
+            _ensure_project_on_path()
+            from config import FAQ_ENABLED, FAQ_STORE_PATH, QUERY_LOG_PATH  # type: ignore
+            from faq import FAQStore, QueryLog  # type: ignore
+
+            if not FAQ_ENABLED:
+                return None, None
+            self._query_log = QueryLog(str(PROJECT_ROOT / QUERY_LOG_PATH))
+            self._faq = FAQStore(str(PROJECT_ROOT / FAQ_STORE_PATH)).load()
+            return self._faq, self._query_log
+
+    def faq_status(self) -> Dict[str, Any]:
+        store = self._faq
+        if store is None:
+            return {"enabled": False}
+        with self._faq_lock:
+            building, error = self._faq_building, self._faq_error
+        return {"enabled": True, "building": building, "error": error, **store.stats()}
+
+    def refresh_faq_async(self) -> Dict[str, Any]:
+        """Recompute FAQ answers from the query log in the background (e.g. after a rebuild)."""
+        store, query_log = self._load_faq()
+        if store is None:
+            return {"started": False, "message": "FAQ 未启用"}
+        with self._faq_lock:
+            if self._faq_building:
+                return {"started": False, "message": "FAQ 正在计算中"}
+            self._faq_building = True
+            self._faq_error = None
+
+        def _worker():
+            try:
+                from faq import build_faq_store  # type: ignore
+
+                build_faq_store(self._load_agent(), store, log_path=query_log.path)
+            except Exception as e:
+                with self._faq_lock:
+                    self._faq_error = str(e)
+            finally:
+                with self._faq_lock:
+                    self._faq_building = False
+
+        threading.Thread(target=_worker, daemon=True).start()
+        return {"started": True}
+
     def chat(
         self,
         message: str,
@@ -159,104 +677,425 @@ class RagWebApp:
         temperature: float = 0.7,
         max_tokens: int = 1500,
         include_context: bool = False,
+        multi_query: Optional[bool] = None,
+        cancel: Any = None,
+        course: Optional[str] = None,
+        session: Optional[str] = None,
     ) -> Dict[str, Any]:
-        agent = self._load_agent()
+        """Answer one question.
 
-        t0 = time.time()
-        context, retrieved = agent.retrieve_context(message, top_k=top_k)
-        if not context:
-            context = "（未检索到特别相关的课程材料）"
+        `course` picks the course whose collection is searched (None: the default course);
+        "*" searches every course concurrently and merges the top_k by vector distance.
+        Raises ValueError for an unknown course.
+
+        `cancel` is a cancellation.CancelToken: every stage checks it, and the completion is
+        streamed so generation stops at the next chunk once the client leaves or the deadline
+        passes. Raises cancellation.Cancelled in that case (recorded in the metrics).
 
-        messages: List[Dict[str, Any]] = [{"role": "system", "content": agent.system_prompt}]
-        if history:
-            # history comes as [{"role":"user|assistant","content":"..."}]
-            for item in history:
-                role = item.get("role")
-                content = item.get("content")
-                if role in ("user", "assistant") and isinstance(content, str):
-                    messages.append({"role": role, "content": content})
+        `session` identifies the browser tab for /api/prefetch: retrieval already done for the
+        same text in that session is reused.
+        """
+        from cancellation import Cancelled  # type: ignore
+        from courses import ALL_COURSES  # type: ignore
 
-        user_text = f"""请根据以下【课程内容】回答【学生问题】。
-【课程内容】
-{context}
-【学生问题】
-{message}"""
+        course = self.resolve_course(course)
+        # Cross-course answers are generated by the default course's agent (same model and prompt).
+        agent = self._load_agent(None if course == ALL_COURSES else course)
 
-        messages.append({"role": "user", "content": user_text})
+        try:
+            out = self._chat(
+                agent,
+                message,
+                history,
+                top_k,
+                temperature,
+                max_tokens,
+                include_context,
+                multi_query,
+                cancel,
+                course,
+                session,
+            )
+        except Cancelled as e:
+            self.record_cancellation(e.reason, e.stage)
+            raise
+        with self._cancel_lock:
+            self._cancel_stats["completed"] += 1
+        return out
 
-        answer = agent.client.chat.completions.create(
+    def _chat(
+        self,
+        agent: Any,
+        message: str,
+        history: Optional[List[Dict[str, str]]],
+        top_k: int,
+        temperature: float,
+        max_tokens: int,
+        include_context: bool,
+        multi_query: Optional[bool],
+        cancel: Any,
+        course: str,
+        session: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        from cancellation import check  # type: ignore
+        from config import MULTI_QUERY_ENABLED  # type: ignore
+        from courses import ALL_COURSES  # type: ignore
+        from faq import sources_from_results  # type: ignore
+
+        t0 = time.time()
+        router = self._course_router()
+        cross_course = course == ALL_COURSES
+        faq_store, query_log = self._load_faq()
+        if faq_store is not None and self.role == "reader":
+            # The primary rewrites the FAQ file after rebuilds; pick up its version.
+            faq_store.reload_if_changed()
+        # Follow-ups depend on the conversation, so only standalone questions use the FAQ;
+        # the FAQ answers come from the default course's index.
+        use_faq = faq_store is not None and not history and course == router.default_id
+        faq_entry = faq_store.lookup(message, top_k=top_k) if use_faq else None
+        if faq_entry is not None:
+            out = {
+                "answer": faq_entry["answer"],
+                "sources": faq_entry["sources"],
+                "latency_ms": int((time.time() - t0) * 1000),
+                "faq": True,
+            }
+            query_log.record(message, history_len=0, latency_ms=out["latency_ms"], faq=True)
+            return out
+
+        prefetched = None
+        cache = self._prefetch
+        # Prefetches are single-query retrievals, so they only stand in for one.
+        if cache is not None and session and not (MULTI_QUERY_ENABLED if multi_query is None else multi_query):
+            remaining = cancel.remaining() if cancel is not None else None
+            prefetched = cache.take(session, self._prefetch_key(message, course, top_k), timeout=remaining)
+        if prefetched is not None:
+            context, retrieved = prefetched
+        else:
+            context, retrieved = self._retrieve(agent, message, top_k, multi_query, cancel, course)
+        check(cancel, "retrieve")
+        if not context:
+            context = "（未检索到特别相关的课程材料）"
+
+        # Stable parts first (system prompt, sorted sources), then history and the question,
+        # so the provider's prompt cache can reuse the prefix across requests.
+        messages = agent.build_messages(message, context, history)
+
+        check(cancel, "generate")
+        client = agent.client
+        remaining = cancel.remaining() if cancel is not None else None
+        if remaining is not None:
+            client = client.with_options(timeout=remaining)
+        extra: Dict[str, Any] = {}
+        stream_options = agent.chat_stream_options()
+        if stream_options:
+            extra["stream_options"] = stream_options
+        stream = client.chat.completions.create(
             model=agent.model,
             messages=messages,
             temperature=float(temperature),
             max_tokens=int(max_tokens),
-        ).choices[0].message.content
-
-        sources = []
-        for r in retrieved or []:
-            meta = r.get("metadata", {}) or {}
-            filename = meta.get("filename", "未知文件")
-            page = meta.get("page_number", "N/A")
-            sources.append(
-                {
-                    "filename": filename,
-                    "page_number": page,
-                    "snippet": (r.get("content", "") or "")[:500],
-                }
-            )
-
+            stream=True,
+            **extra,
+        )
+        usage = None
+        parts: List[str] = []
+        if cancel is not None:
+            # A disconnect closes the stream right away, even while waiting for the next chunk.
+            cancel.on_cancel(stream.close)
+        try:
+            for chunk in stream:
+                # Closing the stream drops the upstream connection, so the provider stops
+                # generating (and billing) tokens nobody will read.
+                check(cancel, "generate")
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage  # final chunk when include_usage is requested
+        except Exception:
+            # A stream closed by the cancel callback surfaces as a transport error here.
+            check(cancel, "generate")
+            raise
+        finally:
+            stream.close()
+        agent.record_usage(usage)
+        answer = "".join(parts)
+
+        sources = sources_from_results(retrieved)
+        if cross_course:
+            for source, result in zip(sources, retrieved):
+                source["course"] = result.get("course")
         out: Dict[str, Any] = {
             "answer": answer,
             "sources": sources,
             "latency_ms": int((time.time() - t0) * 1000),
+            "course": course,
         }
+        if query_log is not None:
+            query_log.record(
+                message, history_len=len(history or []), latency_ms=out["latency_ms"], faq=False, course=course
+            )
         if include_context:
             out["context"] = context
         return out
 
-    def rebuild_async(self) -> Dict[str, Any]:
-        return self.rebuild_async_with_files(None)
+    def _retrieve(
+        self, agent: Any, message: str, top_k: int, multi_query: Optional[bool], cancel: Any, course: str
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        from courses import ALL_COURSES  # type: ignore
+
+        if course == ALL_COURSES:
+            retrieved = self._course_router().retrieve_all(message, top_k=top_k, cancel=cancel)
+            return agent.format_context(retrieved), retrieved
+        return agent.retrieve_context(message, top_k=top_k, multi_query=multi_query, cancel=cancel)
+
+    def _publish_vector_store(self, vector_store: Any, course: Optional[str] = None) -> None:
+        # Single attribute assignment: in-flight requests finish on the old store,
+        # new requests see the new one.
+        router = self._course_router()
+        agent = router.loaded_agents().get(router.resolve(course))
+        if agent is not None:
+            agent.vector_store = vector_store
+        if self._prefetch is not None:
+            self._prefetch.clear()
+
+    def _retire_collection_later(self, vector_store: Any, name: str, *, grace_s: float = 30.0) -> None:
+        # Give searches that still hold the old collection time to finish before dropping it.
+        def _worker():
+            time.sleep(grace_s)
+            vector_store.drop_collection(name)
+
+        threading.Thread(target=_worker, daemon=True).start()
+
+    def start_watcher(self) -> None:
+        # One watcher per course data directory, each feeding that course's collection.
+        _ensure_project_on_path()
+        from config import WATCH_DEBOUNCE_SECONDS, WATCH_POLL_INTERVAL  # type: ignore
+        from local_app.watcher import DataDirWatcher
+
+        for course in self._course_router().courses.values():
+            base = _project_path(course.data_dir)
+            if not base.exists() or course.id in self._watchers:
+                continue
+            watcher = DataDirWatcher(
+                base,
+                functools.partial(self.apply_file_changes, course=course.id),
+                suffixes=SUPPORTED_SUFFIXES,
+                debounce_s=WATCH_DEBOUNCE_SECONDS,
+                poll_interval_s=WATCH_POLL_INTERVAL,
+            )
+            watcher.start()
+            self._watchers[course.id] = watcher
+
+    def watcher_status(self) -> Dict[str, Any]:
+        watchers = dict(self._watchers)
+        if not watchers:
+            return {"enabled": False, "backend": None}
+        first = next(iter(watchers.values()))
+        return {
+            "enabled": True,
+            "backend": first.backend,
+            "root": str(first.root),
+            "roots": {course_id: str(watcher.root) for course_id, watcher in watchers.items()},
+        }
+
+    def apply_file_changes(self, changed: List[Path], deleted: List[Path], course: Optional[str] = None) -> bool:
+        """Incrementally (re)index changed files and drop deleted ones in the course's live collection.
+
+        Shares the rebuild state so the UI shows progress the same way, and so it never
+        runs concurrently with a full rebuild; returns False (retry later) if one is running.
+        """
+        with self._rebuild.lock:
+            if self._rebuild.running:
+                return False
+            self._rebuild.running = True
+            self._rebuild.last_started_at = time.time()
+            self._rebuild.last_error = None
+            self._rebuild.stage = "增量索引"
+            self._rebuild.current = 0
+            self._rebuild.total = len(changed) + len(deleted)
+        self._rebuild.append_log(
+            f"== 检测到 data/ 变更：{len(changed)} 个新增/修改，{len(deleted)} 个删除，开始增量索引 =="
+        )
+
+        try:
+            from config import CHUNK_SIZE, CHUNK_OVERLAP  # type: ignore
+            from document_loader import DocumentLoader, relative_filepath  # type: ignore
+            from text_splitter import TextSplitter  # type: ignore
+
+            vector_store = self._load_agent(course).vector_store
+            base = _project_path(self._course(course).data_dir)
+            loader = DocumentLoader(data_dir=str(base))
+            splitter = TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+            done = 0
+
+            # Drop the old chunks of every touched file first. Near-duplicate content is stored
+            # once, in the first file it was seen in; removing that file's chunks also removes the
+            # other files' copy, so those files are dropped and re-indexed too (transitively).
+            to_remove = [relative_filepath(str(fp), str(base)) for fp in list(deleted) + list(changed)]
+            to_index = [relative_filepath(str(fp), str(base)) for fp in changed]
+            removed: Set[str] = set()
+            total = len(to_remove) + len(to_index)
+            while to_remove:
+                rel = to_remove.pop(0)
+                if rel in removed:
+                    continue
+                removed.add(rel)
+                self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 删除: {rel}")
+                for orphan in vector_store.delete_documents_by_path(rel):
+                    if orphan in removed or orphan in to_remove or not (base / orphan).is_file():
+                        continue
+                    self._rebuild.append_log(
+                        f"[{time.strftime('%H:%M:%S')}] {orphan} 的重复内容存于 {rel}，一并重新索引"
+                    )
+                    to_remove.append(orphan)
+                    to_index.append(orphan)
+                    total += 2
+                done += 1
+                self._rebuild.set_progress(stage="增量索引", current=done, total=total)
+
+            # Then add them back in one call, so they are deduplicated against each other
+            # as well as against the chunks already in the collection.
+            chunks: List[Dict[str, Any]] = []
+            for rel in to_index:
+                self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 索引: {rel}")
+                documents = loader.load_document(str(base / rel))
+                if documents:
+                    chunks.extend(splitter.split_documents(documents))
+                done += 1
+                self._rebuild.set_progress(stage="增量索引", current=done, total=total)
+            if chunks:
+                vector_store.add_documents(chunks)
+
+            self._publish_snapshot(vector_store)
+            if self._is_default_course(course):
+                self._stats.refresh_from(vector_store)
+                faq_store, _ = self._load_faq()
+                if faq_store is not None:
+                    # Answers citing the touched files may be stale; the rest stay valid.
+                    faq_store.remove_sources(sorted({posixpath.basename(rel) for rel in removed}))
+            self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 增量索引完成 ✅")
+        except Exception:
+            err = traceback.format_exc()
+            self._rebuild.append_log(err, level="error")
+            with self._rebuild.lock:
+                self._rebuild.last_error = err
+        finally:
+            with self._rebuild.lock:
+                self._rebuild.running = False
+                self._rebuild.last_finished_at = time.time()
+                self._rebuild.stage = "idle"
+        return True
+
+    def rebuild_async(self, course: Optional[str] = None, profile: Optional[str] = None) -> Dict[str, Any]:
+        return self.rebuild_async_with_files(None, course=course, profile=profile)
+
+    def _job_store(self, course: Optional[str] = None):
+        # The default course keeps the original jobs directory; other courses get a subdirectory.
+        course_id = self._course_router().resolve(course)
+        jobs = self._jobs.get(course_id)
+        if jobs is None:
+            _ensure_project_on_path()
+            from config import REBUILD_JOBS_DIR  # type: ignore
+            from local_app.rebuild_jobs import RebuildJobStore
+
+            root = PROJECT_ROOT / REBUILD_JOBS_DIR
+            if not self._is_default_course(course_id):
+                root = root / course_id
+            jobs = self._jobs[course_id] = RebuildJobStore(root)
+        return jobs
+
+    def rebuild_jobs(self, limit: int = 20, course: Optional[str] = None) -> Dict[str, Any]:
+        jobs = self._job_store(course)
+        return {"current": jobs.current(), "history": jobs.history(limit)}
+
+    def cancel_rebuild(self) -> Dict[str, Any]:
+        with self._rebuild.lock:
+            running = self._rebuild.running
+        token = self._rebuild_cancel
+        if not running or token is None:
+            return {"cancelled": False, "message": "没有正在运行的重建任务"}
+        token.cancel("cancelled")
+        return {"cancelled": True, "message": "已请求取消重建"}
+
+    def resume_interrupted_rebuild(self) -> Dict[str, Any]:
+        """At startup: continue a rebuild whose process died, from its last checkpoint.
+
+        Only one rebuild runs at a time, so with several courses the first interrupted one resumes.
+        """
+        for course_id in self._course_router().courses:
+            job = self._job_store(course_id).mark_interrupted()
+            if job is None or job.get("status") != "interrupted":
+                continue
+            self._rebuild.append_log(f"== 检测到未完成的重建任务 {job['job_id']}，从检查点继续 ==")
+            return self.rebuild_async_with_files(None, course=course_id)
+        return {"started": False}
+
+    def rebuild_async_with_files(
+        self, files: Optional[List[str]], course: Optional[str] = None, profile: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Start a full rebuild in the background.
 
-    def rebuild_async_with_files(self, files: Optional[List[str]]) -> Dict[str, Any]:
+        `profile` is the X-Profile header value: when set (and profiling is enabled) each stage
+        (load / split / embed / verify / swap) is recorded as a separate profile.
+        """
+        course_info = self._course(course)  # ValueError for an unknown course, before any state changes
+        multi_course = len(self._course_router().courses) > 1
         with self._rebuild.lock:
             if self._rebuild.running:
                 return {"started": False, "message": "重建任务正在运行中"}
             self._rebuild.running = True
             self._rebuild.last_started_at = time.time()
             self._rebuild.last_error = None
-            self._rebuild.append_log("== 开始重建知识库 ==")
             self._rebuild.stage = "starting"
             self._rebuild.current = 0
             self._rebuild.total = 0
+            since = self._rebuild.seq
+        # append_log takes the (non-reentrant) lock itself
+        if multi_course:
+            self._rebuild.append_log(f"== 开始重建知识库：{course_info.name} ==")
+        else:
+            self._rebuild.append_log("== 开始重建知识库 ==")
+
+        _ensure_project_on_path()
+        from cancellation import CancelToken, Cancelled  # type: ignore
+
+        cancel = CancelToken()
+        self._rebuild_cancel = cancel
+        # Rebuilds are rare and long, so they are never sampled: only profiled on request.
+        profiler = StageProfiler(
+            self.profiles(), "rebuild", self.profiles().choose_mode(profile, sampled=False), course=course_info.id
+        )
 
         def _worker():
+            vector_store = None
+            shadow = None
+            job = None
+            jobs = self._job_store(course_info.id)
             try:
-                sys.path.insert(0, str(PROJECT_ROOT))
                 # Ensure relative paths in config work as expected
                 os.chdir(str(PROJECT_ROOT))
 
                 from config import (  # type: ignore
-                    DATA_DIR,
                     CHUNK_SIZE,
                     CHUNK_OVERLAP,
+                    DEDUP_SIMHASH_DISTANCE,
                     VECTOR_DB_PATH,
                 )
+                from chunk_schema import DocumentTable  # type: ignore
+                from dedup import merge_near_duplicates  # type: ignore
                 from document_loader import DocumentLoader  # type: ignore
                 from text_splitter import TextSplitter  # type: ignore
                 from vector_store import VectorStore  # type: ignore
 
-                from config import (  # type: ignore
-                    COLLECTION_NAME,
-                )
-
-                base = (PROJECT_ROOT / DATA_DIR).resolve() if not os.path.isabs(DATA_DIR) else Path(DATA_DIR).resolve()
+                base = _project_path(course_info.data_dir)
                 if not base.exists():
                     raise RuntimeError(f"data_dir not found: {base}")
 
-                supported = {".pdf", ".pptx", ".docx", ".txt"}
                 resolved_files: List[Path] = []
                 if files is None:
                     self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 扫描 data/ 文件 ...")
-                    all_files = [p for p in sorted(base.rglob("*")) if p.is_file() and p.suffix.lower() in supported]
+                    all_files = [p for p in sorted(base.rglob("*")) if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES]
                     resolved_files = all_files
                 else:
                     raise RuntimeError("已移除“选择文档重建”功能：请直接重建 data/ 全部文档")
@@ -264,29 +1103,81 @@ class RagWebApp:
                 if not resolved_files:
                     raise RuntimeError("未找到任何可用文档（data/ 为空或未选择文件）")
 
+                # The live collection is replaced wholesale, so a changed embedding model is fine here.
+                vector_store = VectorStore(
+                    db_path=VECTOR_DB_PATH, collection_name=course_info.collection, verify_embedding_model=False
+                )
+                # Everything that decides which chunks and vectors a batch holds: a job resumes only
+                # when these match, otherwise its shadow would mix chunkings or embedding models.
+                settings = {
+                    "embedding_model": vector_store.embedder.model_id,
+                    "chunk_size": CHUNK_SIZE,
+                    "chunk_overlap": CHUNK_OVERLAP,
+                    "dedup_simhash_distance": DEDUP_SIMHASH_DISTANCE,
+                }
+
+                # Same files and settings as an unfinished job: continue it instead of starting from zero.
+                job = jobs.find_resumable(resolved_files, settings)
+                resume = job is not None
+                if resume:
+                    job["status"] = "running"
+                    job["resumes"] += 1
+                    job["error"] = None
+                    jobs.save(job)
+                    self._rebuild.append_log(
+                        f"[{time.strftime('%H:%M:%S')}] 从检查点继续任务 {job['job_id']}："
+                        f"已写入 {job['batches_done']}/{job['batches_total']} 批"
+                    )
+                else:
+                    job = jobs.create(resolved_files, base, settings)
+                    self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 新建重建任务 {job['job_id']}")
+
                 loader = DocumentLoader(data_dir=str(base))
                 splitter = TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-                vector_store = VectorStore(db_path=VECTOR_DB_PATH, collection_name=COLLECTION_NAME)
-
-                self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 清空向量库 ...")
-                self._rebuild.set_progress(stage="清空向量库", current=0, total=1)
-                vector_store.clear_collection()
-                self._rebuild.set_progress(stage="清空向量库", current=1, total=1)
 
+                # Build into a shadow collection; the live collection keeps serving /api/chat
+                # until the atomic swap at the end, and is left untouched if the rebuild fails.
+                # The shadow persists in Chroma, which is what makes embedded batches resumable.
+                self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 创建影子集合 ...")
+                self._rebuild.set_progress(stage="创建影子集合", current=0, total=1)
+                vector_store.drop_retired_collections()
+                shadow = vector_store.create_shadow_collection(resume=resume)
+                if resume and job["batches_done"] and shadow.count() == 0:
+                    self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 影子集合已丢失或不可沿用，重新生成 embedding")
+                    job["batches_done"] = 0
+                self._rebuild.set_progress(stage="创建影子集合", current=1, total=1)
+
+                t_stage = time.perf_counter()
+                job["stage"] = "load"
+                profiler.switch("load")
                 self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 加载文档 ...")
                 documents = []
                 self._rebuild.set_progress(stage="加载文档", current=0, total=len(resolved_files))
                 for idx, fp in enumerate(resolved_files, 1):
-                    self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 加载: {fp.relative_to(base).as_posix()}")
-                    docs = loader.load_document(str(fp))
-                    if docs:
-                        documents.extend(docs)
+                    cancel.check("load")
+                    rel = fp.relative_to(base).as_posix()
+                    # Per-file checkpoint: parsed output survives a crash, so resumes skip parsing.
+                    docs = jobs.load_docs(job, fp)
+                    cached = docs is not None
+                    if cached:
+                        self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 加载（检查点）: {rel}")
+                    else:
+                        self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 加载: {rel}")
+                        docs = loader.load_document(str(fp)) or []
+                        jobs.save_docs(job, fp, docs)
+                    documents.extend(docs)
+                    job["files"][rel] = {"status": "loaded", "documents": len(docs), "cached": cached}
+                    jobs.save(job)
                     self._rebuild.set_progress(stage="加载文档", current=idx, total=len(resolved_files))
+                jobs.add_timing(job, "load", (time.perf_counter() - t_stage) * 1000)
 
                 if not documents:
                     raise RuntimeError("未找到任何可用文档内容（可能解析失败）")
 
                 # Split with progress (avoid tqdm inside split_documents for better UI progress)
+                t_stage = time.perf_counter()
+                job["stage"] = "split"
+                profiler.switch("split")
                 self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 切分文档 ...")
                 self._rebuild.set_progress(stage="切分文档", current=0, total=len(documents))
                 chunks: List[Dict[str, Any]] = []
@@ -322,96 +1213,141 @@ class RagWebApp:
                     self._rebuild.set_progress(stage="切分文档", current=i, total=len(documents))
                 self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 切分完成：共 {len(chunks)} 个块")
 
+                deduped = merge_near_duplicates(chunks)
+                if len(deduped) < len(chunks):
+                    self._rebuild.append_log(
+                        f"[{time.strftime('%H:%M:%S')}] 合并近重复块：{len(chunks)} -> {len(deduped)}"
+                    )
+                chunks = deduped
+                jobs.add_timing(job, "split", (time.perf_counter() - t_stage) * 1000)
+
                 self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 生成 embedding 并写入向量库 ...")
                 self._rebuild.set_progress(stage="生成 embedding", current=0, total=len(chunks))
 
-                # Build and add in batches to reduce overhead
+                # Build and add in batches to reduce overhead. The shadow always uses the
+                # compact schema; its document table is saved with every batch so a resumed
+                # job assigns the same file ids. Loading, splitting and dedup are
+                # deterministic for an unchanged plan, so batch b is the same chunks on resume.
+                t_stage = time.perf_counter()
                 batch_size = 32
-                ids: List[str] = []
-                documents_text: List[str] = []
-                metadatas: List[Dict[str, Any]] = []
-                embeddings: List[List[float]] = []
-
-                def _flush():
-                    if not ids:
-                        return
-                    vector_store.collection.add(
-                        ids=ids,
-                        documents=documents_text,
-                        metadatas=metadatas,
-                        embeddings=embeddings,
-                    )
-                    ids.clear()
-                    documents_text.clear()
-                    metadatas.clear()
-                    embeddings.clear()
-
-                for idx, chunk in enumerate(chunks, 1):
-                    content = chunk.get("content", "")
-                    if not content:
-                        self._rebuild.set_progress(stage="生成 embedding", current=idx, total=len(chunks))
+                job["stage"] = "embed"
+                profiler.switch("embed")
+                job["chunks_total"] = len(chunks)
+                job["batches_total"] = (len(chunks) + batch_size - 1) // batch_size
+                jobs.save(job)
+                doc_table = DocumentTable.from_collection(shadow)
+
+                for b, start in enumerate(range(0, len(chunks), batch_size)):
+                    cancel.check("embed")
+                    batch = chunks[start : start + batch_size]
+                    ids, documents_text, metadatas, texts = doc_table.encode_chunks(batch, start=start)
+                    done = start + len(batch)
+                    if b < job["batches_done"]:
+                        job["batches_resumed"] += 1
+                        self._rebuild.set_progress(stage="生成 embedding", current=done, total=len(chunks))
                         continue
+                    if ids:
+                        # One batched embedding call per batch instead of one round trip per chunk.
+                        # upsert: a crash between the write and the checkpoint repeats this batch.
+                        shadow.upsert(
+                            ids=ids,
+                            documents=documents_text,
+                            metadatas=metadatas,
+                            embeddings=vector_store.get_embeddings(texts),
+                        )
+                        doc_table.save(shadow)
+                    job["batches_done"] = b + 1
+                    jobs.save(job)
+                    self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] embedding: {done}/{len(chunks)}")
+                    self._rebuild.set_progress(stage="生成 embedding", current=done, total=len(chunks))
+
+                doc_table.save(shadow)
+                jobs.add_timing(job, "embed", (time.perf_counter() - t_stage) * 1000)
+                if job["batches_resumed"]:
+                    self._rebuild.append_log(
+                        f"[{time.strftime('%H:%M:%S')}] 跳过检查点中已完成的 {job['batches_resumed']} 批"
+                    )
 
-                    metadata = chunk.copy()
-                    metadata.pop("content", None)
-                    if "images" in metadata and isinstance(metadata["images"], list):
-                        metadata["images"] = str(metadata["images"])
-
-                    filename = metadata.get("filename", "unknown")
-                    chunk_id = metadata.get("chunk_id", idx)
-                    doc_id = f"{filename}_{chunk_id}_{idx}"
-
-                    emb = vector_store.get_embedding(content)
-                    ids.append(doc_id)
-                    documents_text.append(content)
-                    metadatas.append(metadata)
-                    embeddings.append(emb)
-
-                    if len(ids) >= batch_size:
-                        _flush()
-
-                    if idx % 10 == 0 or idx == len(chunks):
-                        self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] embedding: {idx}/{len(chunks)}")
-                    self._rebuild.set_progress(stage="生成 embedding", current=idx, total=len(chunks))
-
-                _flush()
-
-                try:
-                    self._rebuild.set_progress(stage="校验结果", current=0, total=1)
-                    count = vector_store.get_collection_count()
-                    self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 向量库文档块数: {count}")
-                    if count == 0:
-                        raise RuntimeError("写入完成但向量库仍为空（Docs=0）")
-                except Exception:
-                    raise
+                t_stage = time.perf_counter()
+                job["stage"] = "verify"
+                profiler.switch("verify")
+                self._rebuild.set_progress(stage="校验结果", current=0, total=1)
+                count = shadow.count()
+                self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 向量库文档块数: {count}")
+                if count == 0:
+                    raise RuntimeError("写入完成但向量库仍为空（Docs=0）")
                 self._rebuild.set_progress(stage="校验结果", current=1, total=1)
+                jobs.add_timing(job, "verify", (time.perf_counter() - t_stage) * 1000)
+
+                cancel.check("swap")
+                t_stage = time.perf_counter()
+                job["stage"] = "swap"
+                profiler.switch("swap")
+                self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 切换到新索引 ...")
+                retired = vector_store.swap_in(shadow)
+                shadow = None
+                self._publish_vector_store(vector_store, course_info.id)
+                self._publish_snapshot(vector_store)
+                if self._is_default_course(course_info.id):
+                    self._stats.refresh_from(vector_store, last_rebuild_at=time.time())
+                if retired:
+                    self._retire_collection_later(vector_store, retired)
+                jobs.add_timing(job, "swap", (time.perf_counter() - t_stage) * 1000)
+                profiler.close()
+                jobs.finish(job, "completed")
                 self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 重建完成 ✅")
+                faq_store, _ = self._load_faq() if self._is_default_course(course_info.id) else (None, None)
+                if faq_store is not None:
+                    # Precomputed answers refer to the old index: drop them and recompute.
+                    faq_store.clear()
+                    self.refresh_faq_async()
+                    self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 后台重新计算常见问题回答 ...")
+            except Cancelled as e:
+                self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 重建已取消（{e.stage}）", level="warning")
+                if job is not None:
+                    jobs.finish(job, "cancelled")
+                # A cancelled job is not resumed, so its partial shadow is of no further use.
+                if vector_store is not None and shadow is not None:
+                    vector_store.drop_collection(shadow.name)
             except Exception:
                 err = traceback.format_exc()
-                self._rebuild.append_log(err)
+                self._rebuild.append_log(err, level="error")
                 with self._rebuild.lock:
                     self._rebuild.last_error = err
+                if job is not None:
+                    # Keep the shadow and per-file cache: the next rebuild of the same files resumes.
+                    jobs.finish(job, "failed", error=err.strip().splitlines()[-1])
+                    self._rebuild.append_log(f"[{time.strftime('%H:%M:%S')}] 已保存检查点，重新点击“重建知识库”可从断点继续")
+                elif vector_store is not None and shadow is not None:
+                    vector_store.drop_collection(shadow.name)
             finally:
+                profiler.close()
+                self._rebuild_cancel = None
                 with self._rebuild.lock:
                     self._rebuild.running = False
                     self._rebuild.last_finished_at = time.time()
                     self._rebuild.stage = "idle"
 
         threading.Thread(target=_worker, daemon=True).start()
-        return {"started": True, "message": "已开始重建（后台执行）"}
+        return {"started": True, "message": "已开始重建（后台执行）", "since": since, "course": course_info.id}
 
 
 APP = RagWebApp()
+ASSETS = AssetCache(WEB_ROOT)
 
 
 class Handler(BaseHTTPRequestHandler):
     server_version = "RagLocalApp/1.0"
 
-    def _send(self, status: int, body: bytes, content_type: str) -> None:
+    def _send(
+        self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None
+    ) -> None:
         try:
             self.send_response(status)
             self.send_header("Content-Type", content_type)
             self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
             # same-origin by default; no CORS header needed
             self.end_headers()
             self.wfile.write(body)
@@ -424,6 +1360,23 @@ class Handler(BaseHTTPRequestHandler):
                 return
             raise
 
+    def _proxy_to_primary(self, method: str, body: Optional[bytes] = None) -> None:
+        # Reader workers forward rebuild control and status to the primary worker over loopback.
+        conn = http.client.HTTPConnection("127.0.0.1", APP.primary_port, timeout=600)
+        try:
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            if self.headers.get("X-Profile"):
+                headers["X-Profile"] = self.headers["X-Profile"]
+            conn.request(method, self.path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except OSError as e:
+            self._send_json({"error": f"primary worker unavailable: {e}"}, status=503)
+            return
+        finally:
+            conn.close()
+        self._send(resp.status, data, resp.getheader("Content-Type", "application/octet-stream"))
+
     def _send_json(self, data: Any, *, status: int = 200) -> None:
         code, payload = _json_bytes(data, status=status)
         self._send(code, payload, "application/json; charset=utf-8")
@@ -432,23 +1385,83 @@ class Handler(BaseHTTPRequestHandler):
         self._send(status, text.encode("utf-8"), "text/plain; charset=utf-8")
 
     def _send_file(self, path: Path) -> None:
-        if not path.exists() or not path.is_file():
+        asset = ASSETS.get(path)
+        if asset is None:
+            self._send_text("Not found", status=404)
+            return
+        encoding = asset.negotiate(self.headers.get("Accept-Encoding", ""))
+        byte_range = None
+        range_header = self.headers.get("Range")
+        if range_header:
+            # Ranges are served from the uncompressed bytes; If-Range with a stale ETag means "send it all".
+            if_range = self.headers.get("If-Range")
+            if not if_range or if_range.strip() == asset.variants["identity"][1]:
+                byte_range = parse_range(range_header, asset.size)
+            if byte_range is not None:
+                encoding = "identity"
+        body, etag = asset.variants[encoding]
+        headers = {
+            "ETag": etag,
+            # Asset URLs are not content-hashed, so browsers revalidate (cheap 304) instead of caching blindly.
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+            "Accept-Ranges": "bytes",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match and asset.matches(if_none_match):
+            try:
+                self.send_response(304)
+                for name, value in headers.items():
+                    if name != "Content-Encoding":
+                        self.send_header(name, value)
+                self.end_headers()
+            except OSError:
+                pass
+            return
+
+        if byte_range is None:
+            self._send(200, body, asset.content_type, headers)
+            return
+        start, end = byte_range
+        if start < 0:
+            headers["Content-Range"] = f"bytes */{asset.size}"
+            self._send(416, b"", asset.content_type, headers)
+            return
+        headers["Content-Range"] = f"bytes {start}-{end}/{asset.size}"
+        self._send(206, body[start : end + 1], asset.content_type, headers)
+
+    def _send_profiles(self, url) -> None:
+        # /api/debug/profiles lists this worker's profiles; /api/debug/profiles/<id>?format=
+        # text (pstats report) | pstats (binary, for pstats.Stats / snakeviz) | collapsed (flamegraph.pl, speedscope)
+        profiles = APP.profiles()
+        if not profiles.enabled:
             self._send_text("Not found", status=404)
             return
-        ext = path.suffix.lower()
-        content_type = {
-            ".html": "text/html; charset=utf-8",
-            ".css": "text/css; charset=utf-8",
-            ".js": "application/javascript; charset=utf-8",
-            ".svg": "image/svg+xml",
-            ".png": "image/png",
-            ".jpg": "image/jpeg",
-            ".jpeg": "image/jpeg",
-            ".ico": "image/x-icon",
-            ".webp": "image/webp",
-        }.get(ext, "application/octet-stream")
-        data = path.read_bytes()
-        self._send(200, data, content_type)
+        profile_id = url.path[len("/api/debug/profiles") :].strip("/")
+        if not profile_id:
+            self._send_json(profiles.listing())
+            return
+        profile = profiles.get(profile_id)
+        if profile is None:
+            self._send_json({"error": "profile not found (kept in memory per worker process)"}, status=404)
+            return
+        fmt = parse_qs(url.query).get("format", ["text"])[0]
+        if fmt == "text":
+            self._send_text(profile["_text"])
+        elif fmt == "collapsed":
+            self._send_text(profile["_collapsed"])
+        elif fmt == "pstats" and "_pstats" in profile:
+            self._send(
+                200,
+                profile["_pstats"],
+                "application/octet-stream",
+                {"Content-Disposition": f'attachment; filename="profile-{profile_id}.pstats"'},
+            )
+        else:
+            self._send_json({"error": f"format {fmt!r} not available for a {profile['mode']} profile"}, status=400)
 
     def log_message(self, fmt: str, *args) -> None:
         # keep console quiet; comment out if you want full logs
@@ -456,6 +1469,10 @@ class Handler(BaseHTTPRequestHandler):
 
     def do_GET(self) -> None:
         try:
+            if APP.role == "reader" and self.path.startswith(PRIMARY_ONLY_PATHS):
+                self._proxy_to_primary("GET")
+                return
+
             if self.path == "/" or self.path.startswith("/?"):
                 self._send_file(WEB_ROOT / "index.html")
                 return
@@ -472,17 +1489,56 @@ class Handler(BaseHTTPRequestHandler):
                 self._send_json(APP.status())
                 return
 
+            if self.path == "/api/ready":
+                ready = APP.ready()
+                self._send_json(ready, status=200 if ready["ready"] else 503)
+                return
+
             if self.path == "/api/rebuild/status":
-                # Important: do NOT call APP.status() here, to avoid blocking on vector DB locks
+                # Rebuild-only view; cheaper than APP.status() for the 1.5s progress poll
                 self._send_json(APP.rebuild_status())
                 return
 
+            url = urlparse(self.path)
+            if url.path == "/api/rebuild/jobs":
+                course = parse_qs(url.query).get("course", [None])[0]
+                try:
+                    self._send_json(APP.rebuild_jobs(course=course))
+                except ValueError as e:
+                    self._send_json({"error": str(e)}, status=400)
+                return
+
+            if self.path == "/api/courses":
+                self._send_json(APP.courses())
+                return
+
+            if url.path.startswith("/api/debug/profiles"):
+                self._send_profiles(url)
+                return
+
+            if url.path == "/api/rebuild/events":
+                # Incremental log feed: only events with seq > since (plus progress fields)
+                query = parse_qs(url.query)
+                try:
+                    since = int(query.get("since", ["0"])[0])
+                    limit = int(query.get("limit", [str(_RebuildState.MAX_EVENTS_PER_POLL)])[0])
+                except ValueError:
+                    self._send_json({"error": "since/limit must be integers"}, status=400)
+                    return
+                self._send_json(APP.rebuild_events(since, limit))
+                return
+
             self._send_text("Not found", status=404)
         except Exception as e:
             self._send_json({"error": str(e)}, status=500)
 
     def do_POST(self) -> None:
         try:
+            if APP.role == "reader" and self.path.startswith(PRIMARY_ONLY_PATHS):
+                length = int(self.headers.get("Content-Length", "0") or "0")
+                self._proxy_to_primary("POST", self.rfile.read(length) if length > 0 else b"")
+                return
+
             if self.path == "/api/chat":
                 body = _read_json_body(self)
                 if not isinstance(body, dict):
@@ -499,20 +1555,92 @@ class Handler(BaseHTTPRequestHandler):
                     self._send_json({"error": "history must be a list"}, status=400)
                     return
 
-                resp = APP.chat(
-                    message.strip(),
-                    history=history,
-                    top_k=int(body.get("top_k", 3)),
-                    temperature=float(body.get("temperature", 0.7)),
-                    max_tokens=int(body.get("max_tokens", 1500)),
-                    include_context=bool(body.get("include_context", False)),
-                )
+                try:
+                    course = APP.resolve_course(body.get("course") or None)
+                except ValueError as e:
+                    self._send_json({"error": str(e)}, status=400)
+                    return
+                if not APP.serves_chat_locally(course):
+                    # No snapshot published yet (primary still starting): let the primary answer.
+                    self._proxy_to_primary("POST", json.dumps(body).encode("utf-8"))
+                    return
+
+                _ensure_project_on_path()
+                from cancellation import CancelToken, Cancelled  # type: ignore
+                from config import CHAT_DEADLINE_SECONDS  # type: ignore
+
+                timeout_s = float(CHAT_DEADLINE_SECONDS)
+                if body.get("deadline_ms") is not None:
+                    timeout_s = min(timeout_s, float(body["deadline_ms"]) / 1000)
+                cancel = CancelToken(timeout_s)
+                stop_watch = threading.Event()
+                threading.Thread(
+                    target=_watch_client_disconnect, args=(self.connection, cancel, stop_watch), daemon=True
+                ).start()
+                profiles = APP.profiles()
+                session = profiles.begin("chat", profiles.choose_mode(self.headers.get("X-Profile")), course=course)
+                try:
+                    resp = APP.chat(
+                        message.strip(),
+                        history=history,
+                        top_k=int(body.get("top_k", 3)),
+                        temperature=float(body.get("temperature", 0.7)),
+                        max_tokens=int(body.get("max_tokens", 1500)),
+                        include_context=bool(body.get("include_context", False)),
+                        multi_query=None if body.get("multi_query") is None else bool(body["multi_query"]),
+                        cancel=cancel,
+                        course=course,
+                        session=body.get("session") if isinstance(body.get("session"), str) else None,
+                    )
+                except Cancelled as e:
+                    if e.reason == "client_disconnected":
+                        self.close_connection = True
+                        return  # nobody is listening any more
+                    self._send_json({"error": "请求超时", "reason": e.reason, "stage": e.stage}, status=504)
+                    return
+                finally:
+                    stop_watch.set()
+                    profiles.end(session)
                 self._send_json(resp)
                 return
 
+            if self.path == "/api/prefetch":
+                body = _read_json_body(self)
+                if not isinstance(body, dict):
+                    self._send_json({"error": "invalid json body"}, status=400)
+                    return
+                message = body.get("message", "")
+                session = body.get("session")
+                if not isinstance(message, str) or not isinstance(session, str) or not session:
+                    self._send_json({"error": "message and session required"}, status=400)
+                    return
+                try:
+                    self._send_json(
+                        APP.prefetch(
+                            message.strip(),
+                            session=session,
+                            course=body.get("course") or None,
+                            top_k=int(body.get("top_k", 3)),
+                        )
+                    )
+                except ValueError as e:
+                    self._send_json({"error": str(e)}, status=400)
+                return
+
             if self.path == "/api/rebuild":
-                # Rebuild all documents under data/
-                self._send_json(APP.rebuild_async_with_files(None))
+                # Rebuild all documents under the course's data directory (default course if omitted)
+                body = _read_json_body(self)
+                course = body.get("course") if isinstance(body, dict) else None
+                try:
+                    self._send_json(
+                        APP.rebuild_async_with_files(None, course=course or None, profile=self.headers.get("X-Profile"))
+                    )
+                except ValueError as e:
+                    self._send_json({"error": str(e)}, status=400)
+                return
+
+            if self.path == "/api/rebuild/cancel":
+                self._send_json(APP.cancel_rebuild())
                 return
 
             if self.path == "/api/ping":
@@ -524,17 +1652,99 @@ class Handler(BaseHTTPRequestHandler):
             self._send_json({"error": str(e), "trace": traceback.format_exc()}, status=500)
 
 
-def serve(*, host: str = "127.0.0.1", port: int = 8848, open_browser: bool = True) -> None:
+def _start_background(*, warmup: bool, watch: bool) -> None:
+    if warmup:
+        APP.warm_up_async()
+    if watch:
+        APP.start_watcher()
+    _ensure_project_on_path()
+    from config import REBUILD_AUTO_RESUME  # type: ignore
+
+    if REBUILD_AUTO_RESUME:
+        APP.resume_interrupted_rebuild()
+
+
+def _http_server(sock: socket.socket) -> ThreadingHTTPServer:
+    # Serve on a socket that is already bound and listening (shared by the forked workers).
+    httpd = ThreadingHTTPServer(sock.getsockname()[:2], Handler, bind_and_activate=False)
+    httpd.socket.close()
+    httpd.socket = sock
+    httpd.server_address = sock.getsockname()[:2]
+    httpd.server_name, httpd.server_port = httpd.server_address
+    return httpd
+
+
+def _open_browser(url: str) -> None:
+    try:
+        webbrowser.open(url)
+    except Exception:
+        pass
+
+
+def _serve_prefork(*, host: str, port: int, open_browser: bool, warmup: bool, watch: bool, workers: int) -> None:
+    # All workers accept on one listening socket. Worker 0 is the primary: the only process
+    # that opens Chroma, rebuilds, watches data/ and publishes index snapshots. The others
+    # answer /api/chat from the memory-mapped snapshots and forward the rest to the primary
+    # over a loopback socket. Nothing below may start a thread before run_workers() forks.
+    public = socket.create_server((host, port), backlog=128)
+    # Every worker wakes up on a new connection; the ones that lose the accept() race get
+    # EAGAIN and go back to waiting instead of blocking inside accept().
+    public.setblocking(False)
+    internal = socket.create_server(("127.0.0.1", 0))
+    primary_port = internal.getsockname()[1]
+    # Import the request-path modules once here so the workers share those pages copy-on-write
+    # (importing creates no threads; Chroma is left to the primary).
+    _ensure_project_on_path()
+    import courses  # type: ignore  # noqa: F401
+    import index_snapshot  # type: ignore  # noqa: F401
+    import openai  # noqa: F401
+
+    def _child(index: int) -> None:
+        if index == 0:
+            APP.configure_worker("primary", workers=workers, primary_port=primary_port)
+            threading.Thread(target=_http_server(internal).serve_forever, daemon=True).start()
+            _start_background(warmup=warmup, watch=watch)
+            APP.publish_snapshots_async()
+        else:
+            internal.close()
+            APP.configure_worker("reader", workers=workers, primary_port=primary_port)
+            if warmup:
+                APP.warm_up_async()
+        _http_server(public).serve_forever()
+
+    url = f"http://{host}:{port}/"
+    print(f"Local RAG App running at: {url} ({workers} workers)")
+    print(f"Project root: {PROJECT_ROOT}")
+    if open_browser:
+        _open_browser(url)
+    run_workers(workers, _child)
+
+
+def serve(
+    *,
+    host: str = "127.0.0.1",
+    port: int = 8848,
+    open_browser: bool = True,
+    warmup: bool = True,
+    watch: bool = True,
+    workers: int = 1,
+) -> None:
     os.chdir(str(PROJECT_ROOT))
+    if workers > 1 and not fork_supported():
+        print("Multi-worker mode needs fork(); running a single process instead")
+        workers = 1
+    if workers > 1:
+        # Preloaded before forking, so the workers share these pages copy-on-write.
+        ASSETS.preload()
+        _serve_prefork(host=host, port=port, open_browser=open_browser, warmup=warmup, watch=watch, workers=workers)
+        return
     httpd = ThreadingHTTPServer((host, port), Handler)
+    # Read and compress the UI once up front instead of on the first page load.
+    ASSETS.preload()
+    _start_background(warmup=warmup, watch=watch)
     url = f"http://{host}:{port}/"
     print(f"Local RAG App running at: {url}")
     print(f"Project root: {PROJECT_ROOT}")
     if open_browser:
-        try:
-            webbrowser.open(url)
-        except Exception:
-            pass
+        _open_browser(url)
     httpd.serve_forever()
-
-
@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import os
+import stat
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".json": "application/json; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".ico": "image/x-icon",
+    ".webp": "image/webp",
+}
+# Images are already compressed; only text formats are worth gzip/brotli.
+_COMPRESSIBLE = {".html", ".css", ".js", ".json", ".svg"}
+_MIN_COMPRESS_BYTES = 512
+
+
+def _brotli_compress(data: bytes) -> Optional[bytes]:
+    # brotli is optional: without it only gzip is offered.
+    try:
+        import brotli  # type: ignore
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+class Asset:
+    """One static file, loaded once with its precompressed variants."""
+
+    def __init__(self, path: Path, data: bytes, mtime_ns: int):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = len(data)
+        self.content_type = CONTENT_TYPES.get(path.suffix.lower(), "application/octet-stream")
+        digest = hashlib.sha1(data).hexdigest()[:20]
+        # Strong ETags differ per representation (RFC 9110 8.8.3), so each encoding gets its own.
+        self.variants: Dict[str, Tuple[bytes, str]] = {"identity": (data, f'"{digest}"')}
+        if path.suffix.lower() in _COMPRESSIBLE and len(data) >= _MIN_COMPRESS_BYTES:
+            for encoding, compressed in (
+                ("br", _brotli_compress(data)),
+                ("gzip", gzip.compress(data, compresslevel=9, mtime=0)),
+            ):
+                if compressed is not None and len(compressed) < len(data):
+                    self.variants[encoding] = (compressed, f'"{digest}-{encoding}"')
+
+    @property
+    def etags(self) -> List[str]:
+        return [etag for _body, etag in self.variants.values()]
+
+    def negotiate(self, accept_encoding: str) -> str:
+        """Pick the smallest variant the client accepts (q=0 excludes an encoding)."""
+        accepted = set()
+        for part in (accept_encoding or "").split(","):
+            token, _, params = part.strip().partition(";")
+            token = token.strip().lower()
+            q = params.strip()
+            if q.startswith("q="):
+                try:
+                    if float(q[2:]) <= 0:
+                        continue
+                except ValueError:
+                    continue
+            if token:
+                accepted.add(token)
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and (encoding in accepted or "*" in accepted):
+                return encoding
+        return "identity"
+
+    def matches(self, if_none_match: str) -> bool:
+        """If-None-Match uses weak comparison: any representation of this content matches."""
+        tags = [t.strip() for t in if_none_match.split(",") if t.strip()]
+        if "*" in tags:
+            return True
+        ours = set(self.etags)
+        return any((t[2:] if t.startswith("W/") else t) in ours for t in tags)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into an inclusive (start, end).
+
+    Returns None when the header should be ignored (not bytes, multiple ranges, malformed),
+    and (-1, -1) when the range is unsatisfiable (416).
+    """
+    unit, _, spec = (header or "").partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "":
+            # Suffix range: the last N bytes.
+            length = int(last)
+            if length <= 0:
+                return -1, -1
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return -1, -1
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class AssetCache:
+    """In-memory cache of the web UI files under `root`.
+
+    Files are read and compressed once (preload at startup, or on first request); each
+    lookup only stats the file, and reloads it if its mtime or size changed, so edits to
+    the UI still show up without a restart.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root).resolve()
+        self._assets: Dict[Path, Asset] = {}
+        self._lock = threading.Lock()
+
+    def preload(self) -> int:
+        count = 0
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            for name in filenames:
+                if self.get(Path(dirpath) / name) is not None:
+                    count += 1
+        return count
+
+    def get(self, path: Path) -> Optional[Asset]:
+        path = Path(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._assets.pop(path, None)
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        asset = self._assets.get(path)
+        if asset is not None and asset.mtime_ns == st.st_mtime_ns and asset.size == st.st_size:
+            return asset
+        with self._lock:
+            asset = self._assets.get(path)
+            if asset is None or asset.mtime_ns != st.st_mtime_ns or asset.size != st.st_size:
+                try:
+                    asset = Asset(path, path.read_bytes(), st.st_mtime_ns)
+                except OSError:
+                    return None
+                self._assets[path] = asset
+        return asset
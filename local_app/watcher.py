@@ -0,0 +1,212 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+# {path: (mtime_ns, size)}
+Snapshot = Dict[Path, Tuple[int, int]]
+
+
+class _PollingBackend:
+    name = "polling"
+    needs_rescan = True
+
+    def watch_dirs(self, dirs: List[Path]) -> None:
+        return
+
+    def wait(self, stop: threading.Event, timeout: float) -> bool:
+        # No event source: sleep and let the caller rescan.
+        stop.wait(timeout)
+        return False
+
+    def close(self) -> None:
+        return
+
+
+class _InotifyBackend:
+    """Wake-up source only: events tell the watcher *that* something changed under
+    the tree; the actual added/modified/deleted set comes from a directory rescan,
+    which also covers directory moves that inotify reports as a single event."""
+
+    name = "inotify"
+    needs_rescan = False
+
+    def __init__(self) -> None:
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify not available")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+        self._watched: Set[Path] = set()
+
+    def watch_dirs(self, dirs: List[Path]) -> None:
+        for d in dirs:
+            if d in self._watched:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(d)), _WATCH_MASK)
+            if wd >= 0:
+                self._watched.add(d)
+        # Directories that disappeared are dropped by the kernel (IN_IGNORED); forget them here.
+        self._watched = {d for d in self._watched if d.exists()}
+
+    def wait(self, stop: threading.Event, timeout: float) -> bool:
+        deadline = timeout
+        fired = False
+        while deadline > 0 and not stop.is_set():
+            step = min(deadline, 0.5)
+            readable, _, _ = select.select([self._fd], [], [], step)
+            deadline -= step
+            if readable:
+                fired = self._drain() or fired
+                break
+        return fired
+
+    def _drain(self) -> bool:
+        fired = False
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return fired
+            if not buf:
+                return fired
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buf):
+                _wd, _mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size + name_len
+                fired = True
+
+    def close(self) -> None:
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+
+
+class DataDirWatcher:
+    """Watch a directory tree and report debounced batches of changed files.
+
+    ``on_batch(changed, deleted)`` receives absolute paths of files that were added or
+    modified, and of files that were removed. It returns False when it cannot apply the
+    batch right now (e.g. a full rebuild is running); the batch is then retried later.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        on_batch: Callable[[List[Path], List[Path]], bool],
+        *,
+        suffixes: Set[str],
+        debounce_s: float = 2.0,
+        poll_interval_s: float = 5.0,
+        force_polling: bool = False,
+    ) -> None:
+        self.root = root
+        self.on_batch = on_batch
+        self.suffixes = {s.lower() for s in suffixes}
+        self.debounce_s = debounce_s
+        self.poll_interval_s = poll_interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._backend = _PollingBackend()
+        if not force_polling:
+            try:
+                self._backend = _InotifyBackend()
+            except OSError:
+                pass
+
+    @property
+    def backend(self) -> str:
+        return self._backend.name
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        # Baseline scan happens here, not in the thread, so changes made right after
+        # start() returns are never folded into the baseline.
+        known = self._scan()
+        self._thread = threading.Thread(target=self._run, args=(known,), name="data-dir-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._backend.close()
+
+    def _scan(self) -> Snapshot:
+        snapshot: Snapshot = {}
+        dirs: List[Path] = [self.root]
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            base = Path(dirpath)
+            dirs.extend(base / d for d in dirnames)
+            for name in filenames:
+                p = base / name
+                if p.suffix.lower() not in self.suffixes:
+                    continue
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                snapshot[p] = (st.st_mtime_ns, st.st_size)
+        self._backend.watch_dirs(dirs)
+        return snapshot
+
+    def _settle(self) -> Snapshot:
+        # Debounce: rescan until no events arrived and nothing changed for one debounce window,
+        # so half-copied files are not indexed.
+        current = self._scan()
+        while not self._stop.is_set():
+            fired = self._backend.wait(self._stop, self.debounce_s)
+            latest = self._scan()
+            if not fired and latest == current:
+                return latest
+            current = latest
+        return current
+
+    def _run(self, known: Snapshot) -> None:
+        retry = False
+        while not self._stop.is_set():
+            timeout = self.debounce_s if retry else self.poll_interval_s
+            fired = self._backend.wait(self._stop, timeout)
+            if self._stop.is_set():
+                break
+            if not (fired or retry or self._backend.needs_rescan):
+                continue
+            current = self._settle()
+            changed = sorted(p for p, sig in current.items() if known.get(p) != sig)
+            deleted = sorted(p for p in known if p not in current)
+            if not changed and not deleted:
+                retry = False
+                continue
+            try:
+                applied = self.on_batch(changed, deleted)
+            except Exception:
+                applied = True  # the callback reports its own errors; don't loop on a bad file
+            retry = not applied
+            if applied:
+                known = current
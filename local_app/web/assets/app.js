@@ -452,11 +452,17 @@ function setSources(sources, context) {
     const item = document.createElement("div");
     item.className = "sourceItem";
     const page = (s.page_number === 0 || s.page_number === "N/A") ? "—" : `p.${s.page_number}`;
+    const dups = Array.isArray(s.duplicate_sources) ? s.duplicate_sources.slice(1) : [];
+    const dupLine = dups.length
+      ? `<div class="sourceDups">同样内容还出现在：${escapeHtml(dups.join("、"))}</div>`
+      : "";
+    const course = s.course ? `[${s.course}] ` : "";
     item.innerHTML = `
       <div class="sourceTop">
-        <div class="sourceName">${escapeHtml(String(s.filename || "未知文件"))}</div>
+        <div class="sourceName">${escapeHtml(course + String(s.filename || "未知文件"))}</div>
         <div class="sourcePage">${escapeHtml(page)}</div>
       </div>
+      ${dupLine}
       <div class="sourceSnippet">${escapeHtml(String(s.snippet || ""))}</div>
     `;
     list.appendChild(item);
@@ -543,12 +549,40 @@ async function refreshStatus() {
   return s;
 }
 
+// Course picker: only shown when more than one course is configured.
+async function loadCourses() {
+  const r = await apiJson("/api/courses", {}, { timeoutMs: 15000 });
+  const courses = r.courses || [];
+  if (courses.length < 2) return;
+  const select = $("#course");
+  select.innerHTML = "";
+  for (const c of courses) {
+    const opt = document.createElement("option");
+    opt.value = c.id;
+    opt.textContent = c.name;
+    opt.selected = c.id === r.default;
+    select.appendChild(opt);
+  }
+  const all = document.createElement("option");
+  all.value = r.all;
+  all.textContent = "全部课程";
+  select.appendChild(all);
+  $("#courseField").classList.remove("hidden");
+}
+
+function selectedCourse() {
+  const field = $("#courseField");
+  return field.classList.contains("hidden") ? null : $("#course").value;
+}
+
 async function rebuild(payload = {}) {
   const logBox = $("#rebuildLog");
   logBox.classList.remove("hidden");
   logBox.textContent = `[${nowHHMMSS()}] 请求重建…\n`;
   const r = await apiJson("/api/rebuild", { method: "POST", body: JSON.stringify(payload) }, { timeoutMs: 8000 });
   logBox.textContent += `${r.message}\n`;
+  // Incremental feed: only events newer than `since` come back on each poll
+  let since = Number(r.since ?? 0);
 
   if (polling) clearInterval(polling);
   let failures = 0;
@@ -561,11 +595,17 @@ async function rebuild(payload = {}) {
   if (progPct) progPct.textContent = "0%";
   if (progFill) progFill.style.width = "0%";
 
+  let inFlight = false;
   const tick = async () => {
+    // Overlapping polls would both read from the same `since` and print events twice
+    if (inFlight) return;
+    inFlight = true;
     try {
-      const rebuild = await apiJson("/api/rebuild/status", {}, { timeoutMs: 5000 });
-      const tail = rebuild.logs_tail || [];
-      if (tail.length) logBox.textContent = tail.join("\n");
+      const rebuild = await apiJson(`/api/rebuild/events?since=${since}`, {}, { timeoutMs: 5000 });
+      const events = rebuild.events || [];
+      if (rebuild.truncated) logBox.textContent += `[${nowHHMMSS()}] …（部分较早的日志已被覆盖）\n`;
+      if (events.length) logBox.textContent += events.map((ev) => ev.message).join("\n") + "\n";
+      since = Number(rebuild.next_since ?? since);
       if (progLabel && progPct && progFill) {
         const stage = rebuild.stage || "处理中";
         const cur = Number(rebuild.current ?? 0);
@@ -577,10 +617,10 @@ async function rebuild(payload = {}) {
       }
       failures = 0;
 
-      if (!rebuild.running) {
+      if (!rebuild.running && since >= Number(rebuild.last_seq ?? 0)) {
         clearInterval(polling);
         polling = null;
-        // Now refresh full status once to show Docs count (may block briefly but rebuild is finished)
+        // Now refresh full status once to show Docs count (served from the stats snapshot)
         let docs = "?";
         try {
           const st = await apiJson("/api/status", {}, { timeoutMs: 12000 });
@@ -602,6 +642,8 @@ async function rebuild(payload = {}) {
         logBox.textContent += `\n[${nowHHMMSS()}] 已停止轮询（连续失败过多）`;
         if (progWrap) progWrap.classList.add("hidden");
       }
+    } finally {
+      inFlight = false;
     }
   };
 
@@ -631,6 +673,41 @@ function setBusy(isBusy) {
   }
 }
 
+// -------------------------
+// Speculative retrieval while typing
+// -------------------------
+// Identifies this tab to the server's prefetch cache (not the chat session: the cache only
+// needs to pair a prefetch with the send that follows it).
+const PREFETCH_SESSION = newId();
+const PREFETCH_DEBOUNCE_MS = 350;
+let prefetchTimer = null;
+let prefetchDisabled = false;
+let lastPrefetched = "";
+
+function schedulePrefetch() {
+  if (prefetchDisabled) return;
+  if (prefetchTimer) clearTimeout(prefetchTimer);
+  prefetchTimer = setTimeout(() => {
+    prefetchTimer = null;
+    const message = $("#input").value.trim();
+    if (busy || !message || message === lastPrefetched) return;
+    lastPrefetched = message;
+    apiJson("/api/prefetch", {
+      method: "POST",
+      body: JSON.stringify({
+        message,
+        session: PREFETCH_SESSION,
+        top_k: Number($("#topK").value || 3),
+        course: selectedCourse(),
+      }),
+    })
+      .then((r) => {
+        if (r && r.reason === "disabled") prefetchDisabled = true;
+      })
+      .catch(() => {}); // best effort: the send retrieves normally
+  }, PREFETCH_DEBOUNCE_MS);
+}
+
 function stopCurrent() {
   if (!busy) return;
   if (currentAbort) {
@@ -646,6 +723,11 @@ async function send() {
   if (!msg) return;
 
   setBusy(true);
+  if (prefetchTimer) {
+    clearTimeout(prefetchTimer);
+    prefetchTimer = null;
+  }
+  lastPrefetched = "";
 
   addMessage("user", msg, `sent ${nowHHMMSS()}`);
   input.value = "";
@@ -658,6 +740,7 @@ async function send() {
   const temperature = Number($("#temperature").value || 0.7);
   const max_tokens = Number($("#maxTokens").value || 1500);
   const include_context = $("#includeContext").checked;
+  const course = selectedCourse();
   currentAbort = new AbortController();
   currentToken = { cancelled: false };
 
@@ -671,6 +754,8 @@ async function send() {
         temperature,
         max_tokens,
         include_context,
+        course,
+        session: PREFETCH_SESSION,
       }),
       signal: currentAbort.signal,
     });
@@ -713,7 +798,10 @@ async function send() {
 
 function init() {
   const input = $("#input");
-  input.addEventListener("input", () => autosizeTextarea(input));
+  input.addEventListener("input", () => {
+    autosizeTextarea(input);
+    schedulePrefetch();
+  });
   autosizeTextarea(input);
 
   $("#btnAction").addEventListener("click", () => {
@@ -725,11 +813,15 @@ function init() {
   $("#btnHideSources").addEventListener("click", () => $("#sources").classList.add("hidden"));
 
   $("#btnRefresh").addEventListener("click", () => refreshStatus().catch(() => {}));
-  $("#btnRebuild").addEventListener("click", () => rebuild({}).catch((e) => {
+  $("#btnRebuild").addEventListener("click", () => {
+    // "All courses" is a search mode; rebuilding it means the default course.
+    const course = selectedCourse();
+    return rebuild(course && course !== "*" ? { course } : {}).catch((e) => {
     const logBox = $("#rebuildLog");
     logBox.classList.remove("hidden");
     logBox.textContent = `重建失败：${e.message}`;
-  }));
+    });
+  });
 
   // rename modal
   $("#btnRenameCancel").addEventListener("click", closeRenameModal);
@@ -752,6 +844,7 @@ function init() {
   refreshStatus().catch((e) => {
     addMessage("assistant", `无法连接后端：${e.message}\n请确认已运行 run_local_app.py`, `boot · ${nowHHMMSS()}`);
   });
+  loadCourses().catch(() => {});
 
   // restore sessions
   const data = loadSessions();
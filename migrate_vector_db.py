@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import time
+from typing import Any, Dict, List
+
+from chunk_schema import DocumentTable
+from config import VECTOR_DB_PATH, COLLECTION_NAME, TOP_K, DATA_DIR
+from document_loader import relative_filepath
+from vector_store import VectorStore
+
+
+def _payload_bytes(collection: Any) -> int:
+    """所有块的文本与元数据序列化后的字节数（与向量无关的存储部分）"""
+    result = collection.get(include=["documents", "metadatas"])
+    total = 0
+    for doc, meta in zip(result["documents"], result["metadatas"]):
+        total += len((doc or "").encode("utf-8"))
+        total += len(json.dumps(meta or {}, ensure_ascii=False).encode("utf-8"))
+    return total
+
+
+def _query_latency(store: VectorStore, samples: List[List[float]], top_k: int) -> Dict[str, float]:
+    """用库中已有的向量作为查询向量（不需要embedding服务），测量检索+元数据还原的耗时（毫秒）"""
+    timings = []
+    for embedding in samples:
+        t0 = time.perf_counter()
+        results = store.collection.query(
+            query_embeddings=[embedding], n_results=top_k, include=["documents", "metadatas"]
+        )
+        for doc, meta in zip(results["documents"][0], results["metadatas"][0]):
+            store.doc_table.decode(doc, meta)
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+    }
+
+
+def _measure(store: VectorStore, samples: List[List[float]], top_k: int) -> Dict[str, Any]:
+    # 首次查询会加载HNSW索引，先查询一次再计时
+    store.collection.query(query_embeddings=[samples[0]], n_results=1)
+    return {
+        "chunks": store.collection.count(),
+        "disk_bytes": store.get_disk_usage(),
+        "payload_bytes": _payload_bytes(store.collection),
+        **_query_latency(store, samples, top_k),
+    }
+
+
+def migrate(store: VectorStore, page_size: int = 256) -> int:
+    """把旧格式collection逐批复制到紧凑格式的影子collection（沿用已有向量），校验后切换
+
+    返回迁移的块数。旧collection在切换后删除。
+    """
+    source = store.collection
+    total = source.count()
+    shadow = store.create_shadow_collection()
+    table = DocumentTable()
+    seen = set()
+    migrated = 0
+    try:
+        for offset in range(0, total, page_size):
+            batch = source.get(
+                offset=offset, limit=page_size, include=["documents", "metadatas", "embeddings"]
+            )
+            chunks = []
+            embeddings = []
+            for doc, meta, embedding in zip(batch["documents"], batch["metadatas"], batch["embeddings"]):
+                if not doc:
+                    continue
+                chunk = dict(meta or {}, content=doc)
+                # 旧格式记录的是入库时的原始路径（如 ./data/lec1.pdf）；文件表按相对数据目录的路径登记
+                if chunk.get("filepath"):
+                    chunk["filepath"] = relative_filepath(chunk["filepath"], DATA_DIR)
+                chunks.append(chunk)
+                embeddings.append(embedding)
+
+            ids, documents, metadatas, _texts = table.encode_chunks(chunks)
+            keep = []
+            for i, chunk_id in enumerate(ids):
+                # 旧格式下同名文件可能产生相同的 (文件, 页, 块)，只保留第一份
+                if chunk_id not in seen:
+                    seen.add(chunk_id)
+                    keep.append(i)
+            if keep:
+                shadow.add(
+                    ids=[ids[i] for i in keep],
+                    documents=[documents[i] for i in keep],
+                    metadatas=[metadatas[i] for i in keep],
+                    embeddings=[embeddings[i] for i in keep],
+                )
+                migrated += len(keep)
+            print(f"迁移进度: {min(offset + page_size, total)}/{total}")
+
+        table.save(shadow)
+        if shadow.count() != migrated:
+            raise RuntimeError(f"校验失败：写入 {migrated} 个块，影子collection中为 {shadow.count()} 个")
+    except Exception:
+        store.drop_collection(shadow.name)
+        raise
+
+    retired = store.swap_in(shadow)
+    if retired:
+        store.drop_collection(retired)
+    return migrated
+
+
+def compact_storage(db_path: str) -> None:
+    """回收旧collection占用的空间
+
+    Chroma删除collection后，sqlite中的空闲页和全文索引（FTS5）的已删除段不会自动回收，
+    旧collection的HNSW索引目录也可能残留，这里合并全文索引、VACUUM并删除无主的索引目录。
+    """
+    sqlite_path = os.path.join(db_path, "chroma.sqlite3")
+    conn = sqlite3.connect(sqlite_path)
+    try:
+        try:
+            conn.execute("INSERT INTO embedding_fulltext_search(embedding_fulltext_search) VALUES('optimize')")
+            conn.commit()
+        except sqlite3.Error:
+            pass  # 不同Chroma版本的表结构可能不同，跳过
+        conn.execute("VACUUM")
+        live_segments = {row[0] for row in conn.execute("SELECT id FROM segments")}
+    finally:
+        conn.close()
+
+    for name in os.listdir(db_path):
+        path = os.path.join(db_path, name)
+        # 索引目录以segment的UUID命名
+        if os.path.isdir(path) and len(name) == 36 and name.count("-") == 4 and name not in live_segments:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _print_comparison(before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    rows = [
+        ("文档块数", "chunks", "{:d}"),
+        ("目录大小 (KB)", "disk_bytes", "{:.1f}"),
+        ("文本+元数据 (KB)", "payload_bytes", "{:.1f}"),
+        ("检索延迟 p50 (ms)", "p50", "{:.2f}"),
+        ("检索延迟 p95 (ms)", "p95", "{:.2f}"),
+    ]
+    print(f"\n{'':<20}{'迁移前':>12}{'迁移后':>12}{'变化':>10}")
+    for label, key, fmt in rows:
+        b, a = before[key], after[key]
+        if key.endswith("_bytes"):
+            b, a = b / 1024, a / 1024
+        change = f"{(a - b) / b * 100:+.1f}%" if b else "-"
+        print(f"{label:<20}{fmt.format(b):>12}{fmt.format(a):>12}{change:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="将旧格式向量库迁移为紧凑元数据格式，并对比迁移前后的大小和检索延迟")
+    parser.add_argument("--db-path", default=VECTOR_DB_PATH, help="向量库目录")
+    parser.add_argument("--collection", default=COLLECTION_NAME, help="collection名称")
+    parser.add_argument("--queries", type=int, default=50, help="延迟测试的查询次数")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="每次查询返回的块数")
+    parser.add_argument("--dry-run", action="store_true", help="只测量当前向量库，不迁移")
+    args = parser.parse_args()
+
+    # 迁移沿用已有向量，不调用embedding，也不需要校验当前embedding配置
+    store = VectorStore(db_path=args.db_path, collection_name=args.collection, verify_embedding_model=False)
+    if store.collection.count() == 0:
+        print("向量库为空，无需迁移")
+        return
+
+    sample = store.collection.get(limit=args.queries, include=["embeddings"])
+    samples = [list(e) for e in sample["embeddings"]]
+
+    before = _measure(store, samples, args.top_k)
+    if not store.doc_table.legacy:
+        print("向量库已经是紧凑格式，无需迁移")
+        _print_comparison(before, before)
+        return
+    if args.dry_run:
+        _print_comparison(before, before)
+        return
+
+    migrated = migrate(store)
+    compact_storage(args.db_path)
+    print(f"迁移完成：{migrated} 个文档块，{len(store.doc_table.entries)} 个文件")
+    after = _measure(store, samples, args.top_k)
+    _print_comparison(before, after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    OCR_ENABLED,
+    OCR_MIN_CHARS,
+    OCR_LANG,
+    OCR_DPI,
+    OCR_WORKERS,
+    OCR_CACHE_DIR,
+)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_available: Optional[bool] = None
+
+
+def _import_pymupdf():
+    # PyMuPDF 1.24+ 的模块名为 pymupdf，旧版本只有 fitz
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    return pymupdf
+
+
+def needs_ocr(text: str) -> bool:
+    """页面可提取的文字少于 OCR_MIN_CHARS 个（不计空白）时，视为扫描页"""
+    return len("".join((text or "").split())) < OCR_MIN_CHARS
+
+
+def ocr_available() -> bool:
+    """OCR依赖（PyMuPDF渲染页面、pytesseract + tesseract程序识别）是否可用，只检测一次"""
+    global _available
+    if _available is None:
+        try:
+            import pytesseract
+            from PIL import Image  # noqa: F401
+
+            _import_pymupdf()
+            pytesseract.get_tesseract_version()
+            _available = True
+        except Exception as e:
+            print(f"OCR不可用，扫描页将保持为空（需要 pymupdf、pytesseract 和 tesseract 程序）: {e}")
+            _available = False
+    return _available
+
+
+def file_sha1(file_path: str) -> str:
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class OCRCache:
+    """OCR结果的磁盘缓存，键为 (文件内容哈希, 页码)
+
+    每个文件一个JSON（页码 -> 文字），识别语言和分辨率也计入文件名，修改配置后会重新识别。
+    文件改名或移动不影响命中；内容变化则哈希变化，旧结果不再使用。
+    """
+
+    def __init__(self, cache_dir: str = OCR_CACHE_DIR, lang: str = OCR_LANG, dpi: int = OCR_DPI):
+        self.cache_dir = cache_dir
+        self.lang = lang
+        self.dpi = dpi
+        self._lock = threading.Lock()
+
+    def _path(self, file_hash: str) -> str:
+        lang = self.lang.replace("+", "_")
+        return os.path.join(self.cache_dir, f"{file_hash}-{lang}-{self.dpi}.json")
+
+    def load(self, file_hash: str) -> Dict[int, str]:
+        try:
+            with open(self._path(file_hash), "r", encoding="utf-8") as f:
+                return {int(page): text for page, text in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def update(self, file_hash: str, pages: Dict[int, str]) -> None:
+        with self._lock:
+            merged = self.load(file_hash)
+            merged.update(pages)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(file_hash)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({str(page): text for page, text in sorted(merged.items())}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+
+
+def _ocr_page(task: Tuple[str, int, int, str]) -> Tuple[int, str]:
+    """在子进程中渲染并识别一页（page为从1开始的页码）"""
+    import pytesseract
+    from PIL import Image
+
+    pymupdf = _import_pymupdf()
+    file_path, page, dpi, lang = task
+    with pymupdf.open(file_path) as doc:
+        pix = doc[page - 1].get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY)
+        image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    return page, pytesseract.image_to_string(image, lang=lang).strip()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = OCR_WORKERS or max(1, (os.cpu_count() or 2) - 1)
+            # 本地App是多线程服务，fork会复制其他线程持有的锁，使用spawn启动子进程
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def ocr_pdf_pages(file_path: str, pages: List[int], cache: Optional[OCRCache] = None) -> Dict[int, str]:
+    """识别PDF中的指定页（从1开始），返回 {页码: 文字}
+
+    已缓存的页直接返回，其余页在进程池中并行识别并写入缓存；OCR不可用时返回空字典。
+    """
+    if not OCR_ENABLED or not pages or not ocr_available():
+        return {}
+    cache = cache or OCRCache()
+    file_hash = file_sha1(file_path)
+    cached = cache.load(file_hash)
+    results = {page: cached[page] for page in pages if page in cached}
+    missing = [page for page in pages if page not in cached]
+    if not missing:
+        return results
+
+    print(f"OCR识别 {os.path.basename(file_path)} 的 {len(missing)} 页（已缓存 {len(results)} 页）")
+    tasks = [(file_path, page, cache.dpi, cache.lang) for page in missing]
+    recognized: Dict[int, str] = {}
+    try:
+        for page, text in _get_pool().map(_ocr_page, tasks):
+            recognized[page] = text
+    except BrokenProcessPool as e:
+        # 子进程异常退出后进程池不可再用，丢弃它，下次调用时重新创建
+        print(f"OCR识别失败 {file_path}: {e}")
+        _reset_pool()
+    except Exception as e:
+        print(f"OCR识别失败 {file_path}: {e}")
+    if recognized:
+        # 识别为空的页也缓存，避免每次重建都重新识别空白页
+        cache.update(file_hash, recognized)
+    results.update(recognized)
+    return results
@@ -0,0 +1,154 @@
+import posixpath
+import re
+import zipfile
+from typing import IO, Iterator, List
+from xml.etree.ElementTree import iterparse
+
+
+_NS_P = "http://schemas.openxmlformats.org/presentationml/2006/main"
+_NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+_NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_P_SLD_ID = f"{{{_NS_P}}}sldId"
+_P_SP_TREE = f"{{{_NS_P}}}spTree"
+_P_SP = f"{{{_NS_P}}}sp"
+_P_TX_BODY = f"{{{_NS_P}}}txBody"
+_A_P = f"{{{_NS_A}}}p"
+_A_T = f"{{{_NS_A}}}t"
+_A_BR = f"{{{_NS_A}}}br"
+_R_ID = f"{{{_NS_R}}}id"
+_REL = f"{{{_NS_PKG_REL}}}Relationship"
+_W_P = f"{{{_NS_W}}}p"
+_W_T = f"{{{_NS_W}}}t"
+_W_TAB = f"{{{_NS_W}}}tab"
+_W_BR = f"{{{_NS_W}}}br"
+_W_CR = f"{{{_NS_W}}}cr"
+_W_TBL = f"{{{_NS_W}}}tbl"
+
+_HEADER_RE = re.compile(r"word/header[0-9]*.xml")
+_FOOTER_RE = re.compile(r"word/footer[0-9]*.xml")
+
+
+def _slide_paths(zf: zipfile.ZipFile) -> List[str]:
+    """按演示文稿中的放映顺序返回幻灯片XML在压缩包中的路径"""
+    targets = {}
+    with zf.open("ppt/_rels/presentation.xml.rels") as f:
+        for _event, elem in iterparse(f):
+            if elem.tag == _REL:
+                target = elem.get("Target", "")
+                if target.startswith("/"):
+                    path = target.lstrip("/")
+                else:
+                    path = posixpath.normpath(posixpath.join("ppt", target))
+                targets[elem.get("Id")] = path
+    paths = []
+    with zf.open("ppt/presentation.xml") as f:
+        for _event, elem in iterparse(f):
+            if elem.tag == _P_SLD_ID:
+                path = targets.get(elem.get(_R_ID))
+                if path:
+                    paths.append(path)
+    return paths
+
+
+def _slide_text(f: IO[bytes]) -> str:
+    """流式解析一张幻灯片，提取形状树顶层文本框的文字
+
+    与 python-pptx 的 `shape.text` 一致：段落之间用换行分隔，段内换行（a:br）为 \\v；
+    组合形状、表格、图片中的文字不提取（与原实现相同）。
+    """
+    shape_texts: List[str] = []
+    stack: List[str] = []
+    in_shape = False  # 位于形状树顶层的 p:sp 内
+    has_body = False
+    paragraphs: List[str] = []
+    runs: List[str] = []
+    for event, elem in iterparse(f, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == _P_SP and len(stack) >= 1 and stack[-1] == _P_SP_TREE:
+                in_shape = True
+                paragraphs = []
+                has_body = False
+            elif in_shape and tag == _P_TX_BODY:
+                has_body = True
+            elif in_shape and tag == _A_BR:
+                runs.append("\v")
+            stack.append(tag)
+            continue
+
+        stack.pop()
+        if not in_shape:
+            # 图片、组合形状等顶层元素解析完即释放
+            if stack and stack[-1] == _P_SP_TREE:
+                elem.clear()
+            continue
+        if tag == _A_T:
+            runs.append(elem.text or "")
+        elif tag == _A_P:
+            paragraphs.append("".join(runs))
+            runs = []
+        elif tag == _P_SP and stack and stack[-1] == _P_SP_TREE:
+            in_shape = False
+            if has_body:
+                shape_texts.append("\n".join(paragraphs))
+            elem.clear()
+    return "\n".join(shape_texts)
+
+
+def iter_pptx_slides(file_path: str) -> Iterator[str]:
+    """逐张幻灯片返回文字（顺序与放映顺序一致）
+
+    只解压并流式解析幻灯片XML，不读取图片、视频等媒体文件，也不构建完整的对象树。
+    """
+    with zipfile.ZipFile(file_path) as zf:
+        for path in _slide_paths(zf):
+            with zf.open(path) as f:
+                yield _slide_text(f)
+
+
+def _iter_wordml_text(f: IO[bytes]) -> Iterator[str]:
+    """流式解析 WordprocessingML，按段落返回文字片段
+
+    片段依次拼接的结果与 docx2txt 对同一XML的输出相同：每个段落（w:p）前加一个空行，
+    w:tab 为制表符，w:br / w:cr 为换行。
+    """
+    pieces: List[str] = []
+    for event, elem in iterparse(f, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == _W_P:
+                if pieces:
+                    yield "".join(pieces)
+                    pieces = []
+                pieces.append("\n\n")
+            elif tag == _W_TAB:
+                pieces.append("\t")
+            elif tag in (_W_BR, _W_CR):
+                pieces.append("\n")
+        elif tag == _W_T:
+            pieces.append(elem.text or "")
+        elif tag in (_W_P, _W_TBL):
+            # 已处理完的段落/表格释放子节点，内存占用不随文档长度增长
+            elem.clear()
+    if pieces:
+        yield "".join(pieces)
+
+
+def iter_docx_paragraphs(file_path: str) -> Iterator[str]:
+    """逐段返回DOCX的文字（页眉、正文、页脚，顺序与 docx2txt 相同），不读取媒体文件"""
+    with zipfile.ZipFile(file_path) as zf:
+        names = zf.namelist()
+        parts = [n for n in names if _HEADER_RE.match(n)]
+        parts.append("word/document.xml")
+        parts.extend(n for n in names if _FOOTER_RE.match(n))
+        for name in parts:
+            with zf.open(name) as f:
+                yield from _iter_wordml_text(f)
+
+
+def docx_text(file_path: str) -> str:
+    """DOCX全文（与 docx2txt.process 的结果相同）"""
+    return "".join(iter_docx_paragraphs(file_path)).strip()
@@ -0,0 +1,390 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    VECTOR_DB_PATH,
+    COLLECTION_NAME,
+    OPENAI_EMBEDDING_MODEL,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    DEDUP_SIMHASH_DISTANCE,
+    HNSW_SPACE,
+)
+from chunk_schema import SCHEMA_VERSION, DocumentTable
+
+
+FORMAT_VERSION = 1
+MAGIC = b"RAGSNAP\x00"
+# 文件末尾：清单长度（8字节）+ MAGIC
+_FOOTER = struct.Struct("<Q8s")
+_ALIGN = 64
+VECTOR_DTYPES = ("float16", "int8")
+
+
+class _SectionWriter:
+    """按顺序写出各数据段，记录偏移、长度和SHA-256（写入清单，导入时校验）"""
+
+    def __init__(self, f: Any):
+        self.f = f
+        self.sections: Dict[str, Dict[str, Any]] = {}
+        self._name: Optional[str] = None
+        self._hash = None
+        self._start = 0
+
+    def begin(self, name: str, **info: Any) -> None:
+        pad = (-self.f.tell()) % _ALIGN  # 各段按64字节对齐，向量段可以直接内存映射
+        self.f.write(b"\0" * pad)
+        self._name, self._hash, self._start = name, hashlib.sha256(), self.f.tell()
+        self.sections[name] = dict(info)
+
+    def write(self, data: bytes) -> None:
+        self.f.write(data)
+        self._hash.update(data)
+
+    def end(self) -> None:
+        self.sections[self._name].update(
+            offset=self._start, length=self.f.tell() - self._start, sha256=self._hash.hexdigest()
+        )
+        self._name = None
+
+    def add(self, name: str, data: bytes, **info: Any) -> None:
+        self.begin(name, **info)
+        self.write(data)
+        self.end()
+
+
+def _quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """float16 直接转换；int8 按行对称量化：q = round(v / max|v| * 127)，另存每行的 max|v|"""
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1).astype(np.float32)
+    safe = np.where(scales > 0, scales, 1.0)[:, None]
+    return np.round(vectors / safe * 127).astype(np.int8), scales
+
+
+def _dequantize(values: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    if scales is None:
+        return values.astype(np.float32)
+    return values.astype(np.float32) * (scales[:, None] / 127)
+
+
+def _pack_strings(items: List[bytes], level: int = 6) -> Tuple[bytes, bytes]:
+    """字符串列：拼接后整体zlib压缩，另存 n+1 个偏移（解压后的字节位置）"""
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in items], out=offsets[1:])
+    return zlib.compress(b"".join(items), level), offsets.tobytes()
+
+
+def export_portable(vector_store: Any, path: str, vector_dtype: str = "float16", batch_size: int = 1000) -> Dict[str, Any]:
+    """把 vector_store 的collection导出为单个快照文件，返回清单
+
+    文件布局：MAGIC | 各数据段（64字节对齐）| 清单JSON | 清单长度 | MAGIC
+        vectors          - (n, dim) float16 或 int8，连续存放
+        scales           - int8 时每行的缩放系数（float32）
+        texts / text_offsets     - 块内容（存储格式，zlib压缩）及偏移
+        extras / extra_offsets   - 每块的可选元数据 hdr/dups/images（JSON，zlib压缩）及偏移
+        doc / page / chunk       - 每块的文件ID、页码、块序号（int32列）
+    清单记录块数、维度、向量格式、embedding模型、切分参数、HNSW参数、文件表和各段的偏移与SHA-256。
+    块按紧凑格式重新编码（旧格式collection也一样，重复的 (文件, 页, 块) 只保留第一份，同 migrate_vector_db.py），
+    块ID由 (doc, page, chunk) 推出，不单独存储。先写临时文件再替换，不会留下写了一半的快照。
+    """
+    if vector_dtype not in VECTOR_DTYPES:
+        raise ValueError(f"不支持的向量格式: {vector_dtype}（可选 {', '.join(VECTOR_DTYPES)}）")
+
+    collection = vector_store.collection
+    table = DocumentTable()
+    seen = set()
+    total = collection.count()
+    doc_col = np.zeros(total, dtype=np.int32)
+    page_col = np.zeros(total, dtype=np.int32)
+    chunk_col = np.zeros(total, dtype=np.int32)
+    texts: List[bytes] = []
+    extras: List[bytes] = []
+    scales: List[np.ndarray] = []
+    dim = 0
+    row = 0
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            writer = _SectionWriter(f)
+            writer.begin("vectors", dtype=vector_dtype)
+            for offset in range(0, total, batch_size):
+                batch = collection.get(
+                    offset=offset, limit=batch_size, include=["documents", "metadatas", "embeddings"]
+                )
+                keep = []
+                for i, (doc, meta) in enumerate(zip(batch["documents"], batch["metadatas"])):
+                    if row + len(keep) >= total:
+                        break  # 导出期间collection变大时多出的块不导出
+                    content, meta = vector_store.doc_table.decode(doc, meta)
+                    ids, stored, metadatas, _texts = table.encode_chunks([dict(meta, content=content)])
+                    if not ids or ids[0] in seen:
+                        continue
+                    seen.add(ids[0])
+                    keep.append(i)
+                    r = row + len(keep) - 1
+                    meta = metadatas[0]
+                    doc_col[r], page_col[r], chunk_col[r] = meta.pop("doc"), meta.pop("page"), meta.pop("chunk")
+                    texts.append(stored[0].encode("utf-8"))
+                    extras.append(json.dumps(meta, ensure_ascii=False).encode("utf-8") if meta else b"")
+                if not keep:
+                    continue
+                vectors = np.asarray(batch["embeddings"], dtype=np.float32)[keep]
+                dim = vectors.shape[1]
+                values, batch_scales = _quantize(vectors, vector_dtype)
+                writer.write(values.tobytes())
+                if batch_scales is not None:
+                    scales.append(batch_scales)
+                row += len(keep)
+            writer.end()
+            writer.sections["vectors"]["shape"] = [row, dim]
+
+            if scales:
+                writer.add("scales", np.concatenate(scales).tobytes(), dtype="float32")
+            data, offsets = _pack_strings(texts)
+            writer.add("texts", data, compression="zlib")
+            writer.add("text_offsets", offsets, dtype="int64")
+            data, offsets = _pack_strings(extras)
+            writer.add("extras", data, compression="zlib")
+            writer.add("extra_offsets", offsets, dtype="int64")
+            for name, column in (("doc", doc_col), ("page", page_col), ("chunk", chunk_col)):
+                writer.add(name, column[:row].tobytes(), dtype="int32")
+
+            # 旧版本建立的collection没有记录模型，均由OpenAI兼容接口生成（同 VectorStore._check_embedding_model）
+            embedding_model = (collection.metadata or {}).get("embedding_model") or f"openai:{OPENAI_EMBEDDING_MODEL}"
+            manifest = {
+                "format": FORMAT_VERSION,
+                "created_at": time.time(),
+                "collection": vector_store.collection_name,
+                "count": row,
+                "dim": dim,
+                "vector_dtype": vector_dtype,
+                "embedding_model": embedding_model,
+                "schema": SCHEMA_VERSION,
+                "doc_table": {str(k): v for k, v in table.entries.items()},
+                # collection不记录切分参数，这里记录导出时的配置
+                "chunking": {
+                    "chunk_size": CHUNK_SIZE,
+                    "chunk_overlap": CHUNK_OVERLAP,
+                    "dedup_simhash_distance": DEDUP_SIMHASH_DISTANCE,
+                },
+                "hnsw": vector_store.index_settings(),
+                "sections": writer.sections,
+            }
+            header = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+            f.write(header)
+            f.write(_FOOTER.pack(len(header), MAGIC))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return manifest
+
+
+class PortableSnapshot:
+    """快照文件的只读视图（整个文件内存映射，读取各段时校验SHA-256）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._map)
+        if size < len(MAGIC) + _FOOTER.size or self._map[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} 不是快照文件")
+        header_len, magic = _FOOTER.unpack_from(self._map, size - _FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} 不完整（缺少文件尾）")
+        header_start = size - _FOOTER.size - header_len
+        self.manifest: Dict[str, Any] = json.loads(bytes(self._map[header_start : size - _FOOTER.size]))
+        if self.manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"不支持的快照格式: {self.manifest.get('format')}")
+        self.count = int(self.manifest["count"])
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def _section(self, name: str, verify: bool = True) -> memoryview:
+        info = self.manifest["sections"][name]
+        view = memoryview(self._map)[info["offset"] : info["offset"] + info["length"]]
+        if verify and hashlib.sha256(view).hexdigest() != info["sha256"]:
+            raise ValueError(f"快照文件已损坏：{name} 段校验失败")
+        return view
+
+    def _array(self, name: str) -> np.ndarray:
+        return np.frombuffer(self._section(name), dtype=self.manifest["sections"][name]["dtype"])
+
+    def _strings(self, name: str, offsets_name: str) -> Tuple[bytes, np.ndarray]:
+        return zlib.decompress(self._section(name)), self._array(offsets_name)
+
+    def vectors(self) -> np.ndarray:
+        """float32 向量矩阵 (n, dim)（量化格式在这里还原）"""
+        values = np.frombuffer(self._section("vectors"), dtype=self.manifest["vector_dtype"])
+        values = values.reshape(self.count, int(self.manifest["dim"]))
+        scales = self._array("scales") if "scales" in self.manifest["sections"] else None
+        return _dequantize(values, scales)
+
+    def chunks(self) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        """(ids, documents, metadatas)，与collection中的存储格式相同"""
+        texts, text_offsets = self._strings("texts", "text_offsets")
+        extras, extra_offsets = self._strings("extras", "extra_offsets")
+        docs, pages, chunks = (self._array(name).tolist() for name in ("doc", "page", "chunk"))
+        ids, documents, metadatas = [], [], []
+        for i in range(self.count):
+            ids.append(f"{docs[i]}-{pages[i]}-{chunks[i]}")
+            documents.append(texts[text_offsets[i] : text_offsets[i + 1]].decode("utf-8"))
+            extra = extras[extra_offsets[i] : extra_offsets[i + 1]]
+            metadata: Dict[str, Any] = {"doc": docs[i], "page": pages[i], "chunk": chunks[i]}
+            if extra:
+                metadata.update(json.loads(extra))
+            metadatas.append(metadata)
+        return ids, documents, metadatas
+
+
+def check_compatibility(manifest: Dict[str, Any], embedding_model: str) -> List[str]:
+    """与当前配置不一致的地方（embedding模型不一致时无法检索，其余只影响之后的增量索引）"""
+    problems = []
+    if manifest["embedding_model"] != embedding_model:
+        problems.append(f"embedding模型 {manifest['embedding_model']}，当前配置为 {embedding_model}")
+    chunking = manifest.get("chunking") or {}
+    current = {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "dedup_simhash_distance": DEDUP_SIMHASH_DISTANCE}
+    for key, value in current.items():
+        if key in chunking and chunking[key] != value:
+            problems.append(f"{key}={chunking[key]}，当前配置为 {value}")
+    space = (manifest.get("hnsw") or {}).get("space")
+    if space and space != HNSW_SPACE:
+        problems.append(f"距离度量 {space}，当前配置为 {HNSW_SPACE}")
+    return problems
+
+
+def import_portable(vector_store: Any, path: str) -> Dict[str, Any]:
+    """把快照文件批量写入影子collection（直接使用其中的向量，不调用embedding），校验后切换为线上collection
+
+    返回 {"count", "seconds"}。导入期间线上collection照常提供检索；失败时删除影子collection，线上不受影响。
+    """
+    t0 = time.perf_counter()
+    snapshot = PortableSnapshot(path)
+    try:
+        manifest = snapshot.manifest
+        vectors = snapshot.vectors()
+        ids, documents, metadatas = snapshot.chunks()
+    finally:
+        snapshot.close()
+
+    shadow = vector_store.create_shadow_collection()
+    try:
+        table = DocumentTable({int(k): v for k, v in manifest["doc_table"].items()})
+        metadata = dict(shadow.metadata or {})
+        metadata.update(table.collection_metadata())
+        metadata["embedding_model"] = manifest["embedding_model"]
+        shadow.modify(metadata=metadata)
+        batch_size = vector_store.chroma_client.get_max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            shadow.add(
+                ids=ids[start:end],
+                documents=documents[start:end],
+                metadatas=metadatas[start:end],
+                embeddings=vectors[start:end],
+            )
+        if shadow.count() != len(ids):
+            raise RuntimeError(f"校验失败：快照中有 {len(ids)} 个块，影子collection中为 {shadow.count()} 个")
+    except BaseException:
+        vector_store.drop_collection(shadow.name)
+        raise
+
+    retired = vector_store.swap_in(shadow)
+    if retired:
+        vector_store.drop_collection(retired)
+    return {"count": len(ids), "seconds": time.perf_counter() - t0}
+
+
+def _print_manifest(manifest: Dict[str, Any], path: str) -> None:
+    chunking = manifest.get("chunking") or {}
+    print(f"快照文件: {path}（{os.path.getsize(path) / 1024:.1f} KB）")
+    print(f"  collection: {manifest['collection']}，{manifest['count']} 个块，{len(manifest['doc_table'])} 个文件")
+    print(f"  向量: {manifest['dim']} 维 {manifest['vector_dtype']}，embedding模型 {manifest['embedding_model']}")
+    print(f"  切分参数: chunk_size={chunking.get('chunk_size')} chunk_overlap={chunking.get('chunk_overlap')}")
+    print(f"  导出时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest['created_at']))}")
+    for name, info in manifest["sections"].items():
+        print(f"    {name:<14}{info['length'] / 1024:>12.1f} KB")
+
+
+def _resolve_collection(args: argparse.Namespace) -> str:
+    if args.course:
+        from courses import load_courses
+
+        courses = load_courses()
+        if args.course not in courses:
+            raise SystemExit(f"未知课程: {args.course}")
+        return courses[args.course].collection
+    return args.collection
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="把知识库导出为单个便携快照文件（半精度/量化向量 + 按列存储的文本和元数据），"
+        "或从快照文件导入（直接使用其中的向量，不调用embedding）"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("export", "导出快照文件"), ("import", "从快照文件导入（替换现有collection）")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("path", help="快照文件路径")
+        p.add_argument("--db-path", default=VECTOR_DB_PATH, help="向量库目录")
+        p.add_argument("--collection", default=COLLECTION_NAME, help="collection名称")
+        p.add_argument("--course", default=None, help="课程ID（多课程时代替 --collection）")
+    sub.choices["export"].add_argument(
+        "--dtype", choices=VECTOR_DTYPES, default="float16", help="向量存储格式：float16（半精度）或 int8（按行量化，约1/4大小）"
+    )
+    sub.choices["import"].add_argument(
+        "--force", action="store_true", help="embedding模型与当前配置不一致时仍然导入"
+    )
+    info = sub.add_parser("info", help="查看快照文件的清单")
+    info.add_argument("path", help="快照文件路径")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        snapshot = PortableSnapshot(args.path)
+        _print_manifest(snapshot.manifest, args.path)
+        snapshot.close()
+        return
+
+    from vector_store import VectorStore
+
+    collection = _resolve_collection(args)
+    # 导出沿用已有向量；导入替换整个collection：都不需要校验collection现有的embedding模型
+    store = VectorStore(db_path=args.db_path, collection_name=collection, verify_embedding_model=False)
+
+    if args.command == "export":
+        t0 = time.perf_counter()
+        manifest = export_portable(store, args.path, vector_dtype=args.dtype)
+        print(f"导出完成，用时 {time.perf_counter() - t0:.1f}s（向量库目录 {store.get_disk_usage() / 1024:.1f} KB）")
+        _print_manifest(manifest, args.path)
+        return
+
+    snapshot = PortableSnapshot(args.path)
+    manifest = snapshot.manifest
+    snapshot.close()
+    problems = check_compatibility(manifest, store.embedder.model_id)
+    for problem in problems:
+        print(f"注意：快照的{problem}")
+    if manifest["embedding_model"] != store.embedder.model_id and not args.force:
+        raise SystemExit("embedding模型不一致，导入后无法用当前配置检索；确认后加 --force 导入，或修改 config.py")
+    result = import_portable(store, args.path)
+    print(f"导入完成：{result['count']} 个块，用时 {result['seconds']:.1f}s（collection {collection}）")
+
+
+if __name__ == "__main__":
+    main()
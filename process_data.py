@@ -17,7 +17,8 @@ def main():
         data_dir=DATA_DIR,
     )
     splitter = TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    vector_store = VectorStore(db_path=VECTOR_DB_PATH)
+    # 整体重建，不校验旧collection的embedding模型（换模型后正是需要重建）
+    vector_store = VectorStore(db_path=VECTOR_DB_PATH, verify_embedding_model=False)
     vector_store.clear_collection()
 
     # 加载文档
@@ -0,0 +1,115 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_NUM = r"(\d+|[零一二两三四五六七八九十]+)"
+
+# 注意：中文字符属于\w，"讲lec2" 中间没有 \b，因此用 (?<![a-z]) 代替单词边界
+# 讲次引用：lec2 / lecture 2 / 第2讲 / 第二讲 / 第二课
+_LECTURE_PATTERNS = [
+    re.compile(r"(?<![a-z])(?:lec|lecture)\s*[-_]?\s*(\d+)", re.IGNORECASE),
+    re.compile(rf"第\s*{_NUM}\s*[讲课章]"),
+]
+# 页码引用：第5页 / 第5-7页 / 第5到7页 / p5 / p.5 / page 5 / 第5张幻灯片
+_PAGE_RANGE_PATTERNS = [
+    re.compile(rf"第\s*{_NUM}\s*(?:-|~|—|到|至)\s*(?:第\s*)?{_NUM}\s*[页张]"),
+    re.compile(r"(?<![a-z])(?:pages?|pp?\.?)\s*(\d+)\s*(?:-|~|to)\s*(\d+)", re.IGNORECASE),
+]
+_PAGE_PATTERNS = [
+    re.compile(rf"第\s*{_NUM}\s*[页张]"),
+    re.compile(r"(?<![a-z])(?:page|p\.?)\s*(\d+)(?!\d)", re.IGNORECASE),
+]
+
+
+def _to_int(token: str) -> Optional[int]:
+    """解析阿拉伯数字或中文数字（支持到九十九）"""
+    if token.isdigit():
+        return int(token)
+    if not token or any(ch not in _CN_DIGITS and ch != "十" for ch in token):
+        return None
+    if "十" not in token:
+        value = 0
+        for ch in token:
+            value = value * 10 + _CN_DIGITS[ch]
+        return value
+    tens, _, ones = token.partition("十")
+    tens_value = _CN_DIGITS.get(tens, 0) if tens else 1
+    ones_value = _CN_DIGITS.get(ones, 0) if ones else 0
+    return tens_value * 10 + ones_value
+
+
+@dataclass
+class QueryScope:
+    """从问题中解析出的检索范围；都为None表示不限定"""
+
+    filename: Optional[str] = None
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+
+    @property
+    def single_page(self) -> Optional[int]:
+        if self.page_start is not None and self.page_start == self.page_end:
+            return self.page_start
+        return None
+
+
+def _match_lecture(number: int, filenames: List[str]) -> Optional[str]:
+    """把讲次编号映射到文件名：优先 lec/lecture 前缀，其次文件名中唯一出现该数字的文件"""
+    number_re = re.compile(rf"(?<!\d)0*{number}(?!\d)")
+    prefixed = []
+    loose = []
+    for name in filenames:
+        stem = os.path.splitext(name)[0].lower()
+        if not number_re.search(stem):
+            continue
+        loose.append(name)
+        if re.search(rf"(?:lec|lecture|第)\D{{0,3}}0*{number}(?!\d)", stem):
+            prefixed.append(name)
+    for group in (prefixed, loose):
+        if len(group) == 1:
+            return group[0]
+    return None
+
+
+def parse_query_scope(query: str, filenames: List[str]) -> QueryScope:
+    """解析问题中的讲次/文件名和页码引用，例如 "lec2 第5页讲了什么"
+
+    只有能唯一对应到已入库文件时才限定文件，避免误判导致检索不到内容。
+    """
+    scope = QueryScope()
+
+    lowered = query.lower()
+    # 直接提到文件名（含或不含扩展名），取最长的匹配
+    mentioned = [
+        name for name in filenames
+        if name.lower() in lowered or os.path.splitext(name)[0].lower() in lowered
+    ]
+    if mentioned:
+        scope.filename = max(mentioned, key=len)
+    else:
+        for pattern in _LECTURE_PATTERNS:
+            m = pattern.search(query)
+            if m:
+                number = _to_int(m.group(1))
+                if number is not None:
+                    scope.filename = _match_lecture(number, filenames)
+                break
+
+    for pattern in _PAGE_RANGE_PATTERNS:
+        m = pattern.search(query)
+        if m:
+            start, end = _to_int(m.group(1)), _to_int(m.group(2))
+            if start is not None and end is not None:
+                scope.page_start, scope.page_end = min(start, end), max(start, end)
+                return scope
+    for pattern in _PAGE_PATTERNS:
+        m = pattern.search(query)
+        if m:
+            page = _to_int(m.group(1))
+            if page is not None:
+                scope.page_start = scope.page_end = page
+            break
+    return scope
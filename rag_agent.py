@@ -1,13 +1,27 @@
-from typing import List, Dict, Optional, Tuple
-
-from openai import OpenAI
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, List, Dict, Optional, Set, Tuple
 
 from config import (
     OPENAI_API_KEY,
     OPENAI_API_BASE,
     MODEL_NAME,
     TOP_K,
+    MMR_FETCH_K,
+    RERANK_ENABLED,
+    RERANK_CANDIDATES,
+    MULTI_QUERY_ENABLED,
+    MULTI_QUERY_COUNT,
+    MULTI_QUERY_DEADLINE_MS,
+    MULTI_QUERY_WORKERS,
+    MULTI_QUERY_RRF_K,
+    STREAM_INCLUDE_USAGE,
 )
+from cancellation import CancelToken, check, remaining
+from dedup import parse_duplicate_sources
+from query_scope import parse_query_scope
+from reranker import CrossEncoderReranker
 from vector_store import VectorStore
 
 
@@ -15,12 +29,44 @@ class RAGAgent:
     def __init__(
         self,
         model: str = MODEL_NAME,
+        vector_store: Optional[VectorStore] = None,
+        reranker: Optional[CrossEncoderReranker] = None,
     ):
+        """vector_store / reranker 可由调用方传入（多课程时每门课程一个collection，共享同一个重排序模型）"""
         self.model = model
 
+        # 延迟导入openai，使 `import rag_agent` 不承担重量级依赖的导入开销
+        from openai import OpenAI
+
         self.client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
 
-        self.vector_store = VectorStore()
+        self.vector_store = vector_store if vector_store is not None else VectorStore()
+
+        # 可选的交叉编码器重排序：先取更多候选，再精排出top_k个
+        if reranker is None and RERANK_ENABLED:
+            reranker = CrossEncoderReranker()
+        self.reranker = reranker
+
+        # 多查询检索的并发检索线程池（首次使用时创建）及耗时统计
+        self._search_pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        # 统计在多个请求线程中更新，读-改-写需要加锁
+        self._stats_lock = threading.Lock()
+        self.retrieval_stats: Dict[str, float] = {
+            "single_calls": 0,
+            "multi_calls": 0,
+            "multi_timeouts": 0,  # 截止时间到达时仍有子检索未完成
+            "multi_fallbacks": 0,  # 子问题生成失败/超时，只用原问题检索
+            "subqueries": 0,
+            # 各阶段耗时（毫秒），指数滑动平均
+            "single_ms": 0.0,
+            "multi_ms": 0.0,
+            "rewrite_ms": 0.0,
+            "embed_ms": 0.0,
+            "search_ms": 0.0,
+        }
+        # 生成回答的提示词token用量；cached_tokens 为提供方前缀缓存命中的部分（计费和首字延迟都更低）
+        self.prompt_stats: Dict[str, int] = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "no_usage": 0}
 
         """
         TODO: 实现并调整系统提示词，使其符合课程助教的角色和回答策略
@@ -34,20 +80,264 @@ class RAGAgent:
 """
 
     def retrieve_context(
-        self, query: str, top_k: int = TOP_K
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        multi_query: Optional[bool] = None,
+        cancel: Optional[CancelToken] = None,
     ) -> Tuple[str, List[Dict]]:
-        """检索相关上下文
-        TODO: 实现检索相关上下文
-        要求：
-        1. 使用向量数据库检索相关文档
-        2. 格式化检索结果，构建上下文字符串
-        3. 每个检索结果需要包含来源信息（文件名和页码）
-        4. 返回格式化的上下文字符串和原始检索结果列表
+        """检索相关上下文，返回 (带来源标注的上下文字符串, 检索结果列表)
+
+        检索见 retrieve_documents / retrieve_multi_query，上下文格式见 format_context。
+        multi_query 为None时按配置 MULTI_QUERY_ENABLED 决定是否使用多查询检索。
+        cancel 为请求的取消标记：已取消或超过截止时间时抛出 cancellation.Cancelled。
+        """
+        if multi_query is None:
+            multi_query = MULTI_QUERY_ENABLED
+        check(cancel, "retrieve")
+        t0 = time.perf_counter()
+        if multi_query:
+            results = self.retrieve_multi_query(query, top_k=top_k, cancel=cancel)
+        else:
+            results = self.retrieve_documents(query, top_k=top_k, cancel=cancel)
+            self._record("single_calls", "single_ms", t0)
+        check(cancel, "retrieve")
+        return self.format_context(results), results
+
+    def _record(self, counter: str, timing: str, t0: float) -> None:
+        self._count(counter)
+        self._record_ms(timing, (time.perf_counter() - t0) * 1000)
+
+    def _count(self, counter: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.retrieval_stats[counter] += n
+
+    def _record_ms(self, timing: str, ms: float) -> None:
+        with self._stats_lock:
+            prev = self.retrieval_stats[timing]
+            self.retrieval_stats[timing] = ms if not prev else 0.8 * prev + 0.2 * ms
+
+    def generate_sub_queries(self, query: str, count: int = MULTI_QUERY_COUNT, timeout: float = 2.0) -> List[str]:
+        """用LLM把问题改写/拆分为若干个可以独立检索的子问题（失败或超时返回空列表）"""
+        prompt = (
+            f"请把下面的学生问题改写或拆分为最多 {count} 个可以独立检索课程资料的子问题，"
+            "涉及多个讲次/概念时每个子问题只针对其中一个。每行一个子问题，不要编号，不要解释。\n"
+            f"学生问题：{query}"
+        )
+        try:
+            response = self.client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                max_tokens=200,
+            )
+        except Exception as e:
+            print(f"生成子问题失败: {e}")
+            return []
+        lines = (response.choices[0].message.content or "").splitlines()
+        sub_queries = []
+        for line in lines:
+            line = line.strip().lstrip("-*•0123456789.、) ").strip()
+            if line and line != query and line not in sub_queries:
+                sub_queries.append(line)
+        return sub_queries[:count]
+
+    def _get_search_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._search_pool is None:
+                self._search_pool = ThreadPoolExecutor(
+                    max_workers=MULTI_QUERY_WORKERS, thread_name_prefix="multi-query"
+                )
+            return self._search_pool
+
+    def retrieve_multi_query(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        count: int = MULTI_QUERY_COUNT,
+        deadline_ms: float = MULTI_QUERY_DEADLINE_MS,
+        cancel: Optional[CancelToken] = None,
+    ) -> List[Dict]:
+        """多查询检索：原问题 + LLM生成的子问题
+
+        1. 生成子问题（超时则只用原问题）
+        2. 所有问题的embedding一次批量计算
+        3. 各问题在线程池中并发检索（各自解析讲次/页码范围）
+        4. 用RRF（倒数排名融合）合并结果
+        整个过程有硬性截止时间：到时仍未完成的子检索被放弃，返回已完成部分的融合结果；
+        批量embedding在截止时间前没有完成时，退回只用原问题检索。
+        请求的截止时间更早时以请求为准；请求被取消时抛出 cancellation.Cancelled。
+        """
+        t0 = time.perf_counter()
+        if cancel is not None and cancel.remaining() is not None:
+            deadline_ms = min(deadline_ms, cancel.remaining() * 1000)
+        deadline = t0 + deadline_ms / 1000
+
+        # 子问题生成最多占用一半的时间预算，剩余时间留给embedding和检索
+        sub_queries = self.generate_sub_queries(query, count, timeout=deadline_ms / 2000)
+        t_rewrite = time.perf_counter()
+        self._record_ms("rewrite_ms", (t_rewrite - t0) * 1000)
+        if not sub_queries:
+            self._count("multi_fallbacks")
+        queries = [query] + sub_queries
+        self._count("subqueries", len(sub_queries))
+        check(cancel, "rewrite")
+
+        pool = self._get_search_pool()
+        embed_future = pool.submit(
+            self.vector_store.get_embeddings, queries, max(0.0, deadline - time.perf_counter())
+        )
+        done, _ = self._wait([embed_future], deadline, cancel)
+        check(cancel, "embed")
+        if not done or embed_future.exception() is not None:
+            # 批量embedding超时或失败：没有任何子检索可以融合，退回只用原问题检索
+            self._count("multi_timeouts")
+            results = self.retrieve_documents(query, top_k=top_k, cancel=cancel)
+            self._record("multi_calls", "multi_ms", t0)
+            return results
+        embeddings = embed_future.result()
+        t_embed = time.perf_counter()
+        self._record_ms("embed_ms", (t_embed - t_rewrite) * 1000)
+
+        futures = [
+            pool.submit(self.retrieve_documents, q, top_k, e) for q, e in zip(queries, embeddings)
+        ]
+        done, not_done = self._wait(futures, deadline, cancel)
+        if cancel is not None and cancel.cancelled:
+            for future in not_done:
+                future.cancel()
+            check(cancel, "search")
+        if not_done:
+            self._count("multi_timeouts")
+            for future in not_done:
+                future.cancel()  # 已开始的检索无法中断，结果被丢弃
+        self._record_ms("search_ms", (time.perf_counter() - t_embed) * 1000)
+
+        # 按问题顺序融合，保证结果稳定（原问题优先）
+        ranked_lists = [f.result() for f in futures if f in done and f.exception() is None]
+        fused = self.fuse_results(ranked_lists, top_k)
+        self._record("multi_calls", "multi_ms", t0)
+        return fused
+
+    @staticmethod
+    def _wait(
+        futures: List[Future], deadline: float, cancel: Optional[CancelToken]
+    ) -> Tuple[Set[Future], Set[Future]]:
+        """等待任务完成，直到截止时间；请求被取消时提前返回（每50ms检查一次）"""
+        while True:
+            remaining = deadline - time.perf_counter()
+            step = remaining if cancel is None else min(remaining, 0.05)
+            done, not_done = wait(futures, timeout=max(0.0, step))
+            if not not_done or remaining <= step or (cancel is not None and cancel.cancelled):
+                return done, not_done
+
+    @staticmethod
+    def fuse_results(ranked_lists: List[List[Dict]], top_k: int, rrf_k: int = MULTI_QUERY_RRF_K) -> List[Dict]:
+        """倒数排名融合（RRF）：同一文档块在多个结果列表中排名越靠前，得分越高"""
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Dict] = {}
+        for results in ranked_lists:
+            for rank, doc in enumerate(results):
+                key = doc.get("id") or doc.get("content", "")
+                scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+                docs.setdefault(key, doc)
+        ordered = sorted(scores, key=lambda key: scores[key], reverse=True)
+        return [docs[key] for key in ordered[:top_k]]
+
+    def retrieve_documents(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        query_embedding: Optional[List[float]] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> List[Dict]:
+        """检索相关文档块（不格式化）
+
+        先解析问题中的讲次/页码引用（如 "lec2 第5页讲了什么"）：
+        - 指明了文件和单个页码：直接按页读取，不调用embedding
+        - 指明了文件（及页码范围）：在该范围内做向量检索
+        范围内没有内容时退回全库检索。
+        query_embedding 为预先（批量）计算好的问题向量，传入时不再单独计算；
+        否则以 cancel 的剩余时间作为embedding调用的超时，超时后抛出 cancellation.Cancelled。
+        """
+        scope = parse_query_scope(query, self.vector_store.list_filenames())
+        if scope.filename and scope.single_page is not None:
+            page_docs = self.vector_store.get_page(scope.filename, scope.single_page)
+            if page_docs:
+                return page_docs
+
+        filters: Dict = {}
+        if scope.filename:
+            filters["filename"] = scope.filename
+            if scope.page_start is not None:
+                filters["page_range"] = (scope.page_start, scope.page_end)
+
+        try:
+            results = self._ranked_search(query, top_k, filters, query_embedding, remaining(cancel))
+            if not results and filters:
+                check(cancel, "retrieve")
+                results = self._ranked_search(query, top_k, {}, query_embedding, remaining(cancel))
+        except Exception:
+            check(cancel, "embed")  # 因截止时间而超时的调用按取消处理
+            raise
+        return results
+
+    def _ranked_search(
+        self,
+        query: str,
+        top_k: int,
+        filters: Dict,
+        query_embedding: Optional[List[float]] = None,
+        timeout: Optional[float] = None,
+    ) -> List[Dict]:
+        """向量检索 + MMR，启用重排序时再用交叉编码器精排"""
+        if self.reranker is not None:
+            n_candidates = max(RERANK_CANDIDATES, top_k)
+            candidates = self.vector_store.search(
+                query,
+                top_k=n_candidates,
+                fetch_k=max(MMR_FETCH_K, n_candidates * 2),
+                query_embedding=query_embedding,
+                timeout=timeout,
+                **filters,
+            )
+            # 超出延迟预算或模型未就绪时返回None，退回MMR排序
+            results = self.reranker.rerank(query, candidates, top_k)
+            if results is None:
+                results = candidates[:top_k]
+            return results
+        return self.vector_store.search(
+            query, top_k=top_k, fetch_k=MMR_FETCH_K, query_embedding=query_embedding, timeout=timeout, **filters
+        )
+
+    @staticmethod
+    def _source_order(res: Dict) -> Tuple:
+        metadata = res.get("metadata", {}) or {}
+        page = metadata.get("page_number", 0)
+        chunk = metadata.get("chunk_id", 0)
+        return (
+            str(res.get("course", "")),
+            str(metadata.get("filename", "")),
+            page if isinstance(page, int) else 0,
+            chunk if isinstance(chunk, int) else 0,
+            str(res.get("id", "")),
+        )
+
+    def format_context(self, results: List[Dict]) -> str:
+        """将检索结果格式化为带来源信息的上下文字符串
+
+        按（文件名, 页码, 块序号）排序并去掉重复块，而不是按相关度排序：同一组检索结果无论排名如何，
+        得到的上下文都逐字节相同，提示词前缀可以命中提供方的缓存。
         """
-        results = self.vector_store.search(query, top_k=top_k)
-        
         context_parts = []
-        for res in results:
+        seen: Set[Tuple] = set()
+        for res in sorted(results, key=self._source_order):
+            if res.get("id") is not None:
+                # 跨课程检索时不同collection的块ID可能相同
+                key = (res.get("course"), res["id"])
+                if key in seen:
+                    continue
+                seen.add(key)
             metadata = res.get("metadata", {})
             content = res.get("content", "")
             filename = metadata.get("filename", "未知文件")
@@ -57,11 +347,51 @@ class RAGAgent:
             source_info = f"{filename}"
             if page != 0 and page != "N/A":
                 source_info += f" (第 {page} 页)"
+            # 入库时合并的重复内容，列出其他出现位置
+            duplicates = parse_duplicate_sources(metadata)
+            if len(duplicates) > 1:
+                source_info += f"，同样内容还出现在：{'、'.join(duplicates[1:])}"
             
             context_parts.append(f"【来源：{source_info}】{content}")
             
-        context = "\n".join(context_parts)
-        return context, results
+        return "\n".join(context_parts)
+
+    def build_messages(
+        self, query: str, context: str, chat_history: Optional[List[Dict]] = None
+    ) -> List[Dict[str, Any]]:
+        """组装生成回答的消息，稳定的部分在前、每轮都变的部分在后
+
+        顺序为：系统提示词 → 【课程内容】 → 对话历史 → 【学生问题】。提供方的提示词缓存按前缀匹配：
+        系统提示词对所有请求相同，检索到相同资料时课程内容也相同（见 format_context），
+        只有历史和问题不同，缓存可以覆盖到课程内容为止。
+        课程内容放在系统消息中，使消息仍保持 user / assistant 交替。
+        """
+        messages: List[Dict[str, Any]] = [
+            {"role": "system", "content": f"{self.system_prompt}\n【课程内容】\n{context}"}
+        ]
+        # history 为 [{"role": "user|assistant", "content": "..."}]，其他字段和非法条目丢弃
+        for item in chat_history or []:
+            role = item.get("role")
+            content = item.get("content")
+            if role in ("user", "assistant") and isinstance(content, str):
+                messages.append({"role": role, "content": content})
+        messages.append({"role": "user", "content": f"请根据【课程内容】回答【学生问题】。\n【学生问题】\n{query}"})
+        return messages
+
+    def chat_stream_options(self) -> Optional[Dict[str, Any]]:
+        """流式调用的 stream_options：请求在最后一个分块中返回token用量"""
+        return {"include_usage": True} if STREAM_INCLUDE_USAGE else None
+
+    def record_usage(self, usage: Any) -> None:
+        """记录一次生成的提示词token数和其中命中缓存的部分（接口未返回用量时只计数）"""
+        details = getattr(usage, "prompt_tokens_details", None)
+        with self._stats_lock:
+            self.prompt_stats["calls"] += 1
+            if usage is None:
+                self.prompt_stats["no_usage"] += 1
+                return
+            self.prompt_stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            self.prompt_stats["cached_tokens"] += getattr(details, "cached_tokens", 0) or 0
 
     def generate_response(
         self,
@@ -76,26 +406,7 @@ class RAGAgent:
             context: 检索到的上下文
             chat_history: 对话历史
         """
-        messages = [{"role": "system", "content": self.system_prompt}]
-
-        if chat_history:
-            messages.extend(chat_history)
-
-        """
-        TODO: 实现用户提示词
-        要求：
-        1. 包含相关的课程内容
-        2. 包含学生问题
-        3. 包含来源信息（文件名和页码）
-        4. 返回用户提示词
-        """
-        user_text = f"""请根据以下【课程内容】回答【学生问题】。
-【课程内容】
-{context}
-【学生问题】
-{query}"""
-
-        messages.append({"role": "user", "content": user_text})
+        messages = self.build_messages(query, context, chat_history)
         
         # 多模态接口示意（如需添加图片支持，可参考以下格式）：
         # content_parts = [{"type": "text", "text": user_text}]
@@ -109,6 +420,7 @@ class RAGAgent:
             response = self.client.chat.completions.create(
                 model=self.model, messages=messages, temperature=0.7, max_tokens=1500
             )
+            self.record_usage(response.usage)
 
             return response.choices[0].message.content
         except Exception as e:
@@ -0,0 +1,136 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config import (
+    RERANK_MODEL,
+    RERANK_BUDGET_MS,
+    RERANK_CACHE_SIZE,
+)
+
+
+class CrossEncoderReranker:
+    """基于本地CPU交叉编码器（sentence-transformers CrossEncoder）的重排序
+
+    - 所有 (问题, 文档块) 对在一次 predict 调用中批量打分
+    - 分数按 (问题, 文档块内容) 的哈希缓存，重复问题不再重复推理；按内容而非块ID缓存，
+      重建或增量更新后同一ID指向新内容、不同课程的块ID相同时都不会用到旧分数
+    - 按历史单对耗时估算本次推理时间，超过延迟预算时跳过重排序
+    - 模型在后台线程中加载，加载完成前直接跳过重排序，不阻塞请求
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        budget_ms: float = RERANK_BUDGET_MS,
+        cache_size: int = RERANK_CACHE_SIZE,
+    ):
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+
+        self._model = None
+        self._load_error: Optional[str] = None
+        self._load_lock = threading.Lock()
+        self._loading = False
+
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # 单个 (问题, 文档块) 对的平均推理耗时（毫秒），指数滑动平均
+        self._ms_per_pair: Optional[float] = None
+
+        self.stats: Dict[str, int] = {
+            "applied": 0,
+            "skipped_loading": 0,
+            "skipped_budget": 0,
+            "skipped_error": 0,
+            "cache_hits": 0,
+            "pairs_scored": 0,
+        }
+
+    def _load(self) -> None:
+        try:
+            # sentence-transformers（及torch）导入很慢，仅在需要时导入
+            from sentence_transformers import CrossEncoder
+
+            self._model = CrossEncoder(self.model_name, device="cpu")
+        except Exception as e:
+            self._load_error = str(e)
+            print(f"加载重排序模型失败: {e}")
+        finally:
+            with self._load_lock:
+                self._loading = False
+
+    def ensure_loading(self) -> bool:
+        """模型已就绪返回True；否则在后台开始加载并返回False"""
+        if self._model is not None:
+            return True
+        with self._load_lock:
+            if self._model is None and not self._loading and self._load_error is None:
+                self._loading = True
+                threading.Thread(target=self._load, daemon=True).start()
+        return False
+
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return hashlib.sha1(query.strip().encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _pair_key(qkey: str, content: str) -> str:
+        return qkey + hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def rerank(self, query: str, candidates: List[Dict], top_k: int) -> Optional[List[Dict]]:
+        """对候选文档重排序，返回前top_k个（附带 rerank_score）
+
+        无法在预算内完成（模型未加载、预计耗时超出预算、推理出错）时返回None，
+        由调用方退回原始排序。
+        """
+        if not candidates:
+            return []
+        if not self.ensure_loading():
+            self.stats["skipped_loading"] += 1
+            return None
+
+        qkey = self._query_key(query)
+        scores: List[Optional[float]] = []
+        missing: List[int] = []
+        with self._cache_lock:
+            for i, cand in enumerate(candidates):
+                key = self._pair_key(qkey, cand.get("content", ""))
+                score = self._cache.get(key)
+                if score is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    self.stats["cache_hits"] += 1
+                scores.append(score)
+
+        if missing:
+            if self._ms_per_pair is not None and self._ms_per_pair * len(missing) > self.budget_ms:
+                self.stats["skipped_budget"] += 1
+                return None
+            pairs = [(query, candidates[i].get("content", "")) for i in missing]
+            t0 = time.perf_counter()
+            try:
+                predicted = self._model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+            except Exception as e:
+                print(f"重排序失败: {e}")
+                self.stats["skipped_error"] += 1
+                return None
+            per_pair = (time.perf_counter() - t0) * 1000 / len(pairs)
+            self._ms_per_pair = per_pair if self._ms_per_pair is None else 0.8 * self._ms_per_pair + 0.2 * per_pair
+            self.stats["pairs_scored"] += len(pairs)
+
+            with self._cache_lock:
+                for i, score in zip(missing, predicted):
+                    scores[i] = float(score)
+                    key = self._pair_key(qkey, candidates[i].get("content", ""))
+                    self._cache[key] = float(score)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        ranked = sorted(zip(scores, candidates), key=lambda x: x[0], reverse=True)
+        self.stats["applied"] += 1
+        return [dict(cand, rerank_score=score) for score, cand in ranked[:top_k]]
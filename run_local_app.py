@@ -7,15 +7,39 @@ def main() -> None:
     parser.add_argument("--host", default="127.0.0.1")
     parser.add_argument("--port", type=int, default=8848)
     parser.add_argument("--no-browser", action="store_true", help="Do not auto-open browser")
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        help="Do not preload the agent/index in the background at startup",
+    )
+    parser.add_argument(
+        "--no-watch",
+        action="store_true",
+        help="Do not watch data/ for changes (auto incremental indexing)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: SERVE_WORKERS in config.py); >1 serves from shared memory-mapped index snapshots",
+    )
     args = parser.parse_args()
 
     # Ensure relative paths in config.py work as expected
     project_root = os.path.dirname(os.path.abspath(__file__))
     os.chdir(project_root)
 
+    from config import SERVE_WORKERS
     from local_app.server import serve
 
-    serve(host=args.host, port=args.port, open_browser=not args.no_browser)
+    serve(
+        host=args.host,
+        port=args.port,
+        open_browser=not args.no_browser,
+        warmup=not args.no_warmup,
+        watch=not args.no_watch,
+        workers=args.workers or SERVE_WORKERS,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from config import (
+    VECTOR_DB_PATH,
+    COLLECTION_NAME,
+    TOP_K,
+    MMR_FETCH_K,
+    HNSW_SPACE,
+    HNSW_M,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_SEARCH_EF,
+)
+
+
+def _int_list(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def _load_vectors(db_path: str, collection_name: str) -> Tuple[List[str], np.ndarray, Dict[str, Any]]:
+    """取出向量库中的全部向量（不修改collection的参数和数据）"""
+    import chromadb
+    from chromadb.config import Settings
+
+    client = chromadb.PersistentClient(path=db_path, settings=Settings(anonymized_telemetry=False))
+    collection = client.get_collection(collection_name)
+    ids: List[str] = []
+    vectors = []
+    total = collection.count()
+    for offset in range(0, total, 1000):
+        batch = collection.get(offset=offset, limit=1000, include=["embeddings"])
+        ids.extend(batch["ids"])
+        vectors.extend(batch["embeddings"])
+    hnsw = (collection.configuration or {}).get("hnsw") or {}
+    return ids, np.asarray(vectors, dtype=np.float32), hnsw
+
+
+def _exact_neighbors(base: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """暴力计算的精确近邻（与HNSW使用相同的距离度量），作为召回率的基准"""
+    if space == "cosine":
+        base = base / np.maximum(np.linalg.norm(base, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        distances = -(queries @ base.T)
+    elif space == "ip":
+        distances = -(queries @ base.T)
+    else:
+        distances = (queries**2).sum(axis=1, keepdims=True) - 2 * queries @ base.T + (base**2).sum(axis=1)
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def _sweep_index(
+    base_ids: List[str],
+    base: np.ndarray,
+    queries: np.ndarray,
+    exact: np.ndarray,
+    ks: List[int],
+    *,
+    space: str,
+    m: int,
+    construction_ef: int,
+    search_efs: List[int],
+) -> List[Dict[str, Any]]:
+    """在临时目录中用给定参数建索引，依次测量各 search_ef 下的召回率和单次查询延迟
+
+    Chroma在加载索引时才读取 ef_search，修改后需要重新打开collection才生效。
+    """
+    import chromadb
+    from chromadb.api.client import SharedSystemClient
+    from chromadb.config import Settings
+
+    tmp_dir = tempfile.mkdtemp(prefix="hnsw_sweep_")
+    try:
+        client = chromadb.PersistentClient(path=tmp_dir, settings=Settings(anonymized_telemetry=False))
+        collection = client.create_collection(
+            name="sweep",
+            configuration={
+                "hnsw": {
+                    "space": space,
+                    "max_neighbors": m,
+                    "ef_construction": construction_ef,
+                    "ef_search": search_efs[0],
+                }
+            },
+        )
+        t0 = time.perf_counter()
+        batch_size = client.get_max_batch_size()
+        for start in range(0, len(base_ids), batch_size):
+            collection.add(
+                ids=base_ids[start : start + batch_size], embeddings=base[start : start + batch_size].tolist()
+            )
+        build_s = time.perf_counter() - t0
+
+        position = {doc_id: i for i, doc_id in enumerate(base_ids)}
+        top = max(ks)
+        rows = []
+        for ef in search_efs:
+            collection.modify(configuration={"hnsw": {"ef_search": ef}})
+            SharedSystemClient.clear_system_cache()
+            client = chromadb.PersistentClient(path=tmp_dir, settings=Settings(anonymized_telemetry=False))
+            collection = client.get_collection("sweep")
+            # 首次查询加载索引，不计入延迟
+            collection.query(query_embeddings=[queries[0].tolist()], n_results=top)
+            timings = []
+            hits = {k: 0 for k in ks}
+            for qi, query in enumerate(queries):
+                t0 = time.perf_counter()
+                result = collection.query(query_embeddings=[query.tolist()], n_results=top, include=[])
+                timings.append((time.perf_counter() - t0) * 1000)
+                found = [position[doc_id] for doc_id in result["ids"][0]]
+                for k in ks:
+                    hits[k] += len(set(found[:k]) & set(exact[qi, :k].tolist()))
+            timings.sort()
+            rows.append(
+                {
+                    "M": m,
+                    "construction_ef": construction_ef,
+                    "search_ef": ef,
+                    "build_s": build_s,
+                    "recall": {k: hits[k] / (k * len(queries)) for k in ks},
+                    "p50": statistics.median(timings),
+                    "p95": _percentile(timings, 0.95),
+                    "p99": _percentile(timings, 0.99),
+                }
+            )
+        return rows
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="在现有向量库上比较不同HNSW参数的召回率（相对暴力精确检索）和查询延迟分布"
+    )
+    parser.add_argument("--db-path", default=VECTOR_DB_PATH, help="向量库目录")
+    parser.add_argument("--collection", default=COLLECTION_NAME, help="collection名称")
+    parser.add_argument("--queries", type=int, default=200, help="作为查询的向量数（从库中抽出，不参与建索引）")
+    parser.add_argument("--k", default=f"{TOP_K},{MMR_FETCH_K}", help="计算 recall@k 的k值，逗号分隔")
+    parser.add_argument("--space", default=None, help="距离度量，默认与现有collection相同")
+    parser.add_argument("--M", default=f"8,{HNSW_M},32", help="M取值，逗号分隔")
+    parser.add_argument("--construction-ef", default=f"{HNSW_CONSTRUCTION_EF},200", help="construction_ef取值，逗号分隔")
+    parser.add_argument("--search-ef", default=f"10,20,50,{HNSW_SEARCH_EF},200", help="search_ef取值，逗号分隔")
+    parser.add_argument("--seed", type=int, default=0, help="抽取查询向量的随机种子")
+    args = parser.parse_args()
+
+    ids, vectors, current = _load_vectors(args.db_path, args.collection)
+    space = args.space or current.get("space") or HNSW_SPACE
+    ks = sorted(set(_int_list(args.k)))
+    if len(ids) <= args.queries + max(ks):
+        print(f"向量库只有 {len(ids)} 个向量，不足以进行测试")
+        return
+
+    rng = np.random.default_rng(args.seed)
+    held_out = np.zeros(len(ids), dtype=bool)
+    held_out[rng.choice(len(ids), size=args.queries, replace=False)] = True
+    base = vectors[~held_out]
+    base_ids = [doc_id for doc_id, q in zip(ids, held_out) if not q]
+    queries = vectors[held_out]
+    exact = _exact_neighbors(base, queries, max(ks), space)
+
+    print(f"向量数 {len(base_ids)}，查询数 {len(queries)}，维度 {vectors.shape[1]}，距离 {space}")
+    print(
+        f"当前collection参数: M={current.get('max_neighbors')} construction_ef={current.get('ef_construction')} "
+        f"search_ef={current.get('ef_search')}"
+    )
+    recall_cols = "".join(f"{f'recall@{k}':>11}" for k in ks)
+    print(f"\n{'M':>4}{'c_ef':>6}{'s_ef':>6}{'建索引(s)':>10}{recall_cols}{'p50(ms)':>9}{'p95(ms)':>9}{'p99(ms)':>9}")
+    for m in _int_list(args.M):
+        for construction_ef in _int_list(args.construction_ef):
+            rows = _sweep_index(
+                base_ids,
+                base,
+                queries,
+                exact,
+                ks,
+                space=space,
+                m=m,
+                construction_ef=construction_ef,
+                search_efs=_int_list(args.search_ef),
+            )
+            for row in rows:
+                recalls = "".join(f"{row['recall'][k]:>11.3f}" for k in ks)
+                print(
+                    f"{row['M']:>4}{row['construction_ef']:>6}{row['search_ef']:>6}{row['build_s']:>10.2f}"
+                    f"{recalls}{row['p50']:>9.2f}{row['p95']:>9.2f}{row['p99']:>9.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
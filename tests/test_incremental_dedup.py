@@ -0,0 +1,93 @@
+import hashlib
+from typing import List, Optional
+
+import pytest
+
+import vector_store as vector_store_module
+from document_loader import DocumentLoader
+from embeddings import EmbeddingProvider
+from text_splitter import TextSplitter
+from vector_store import VectorStore
+
+
+SHARED = "第一讲 课程介绍\n本课程介绍数据结构与算法的基本概念，包括线性表、树、图以及常见的排序和查找算法。"
+OTHER = "第二讲 链表\n单链表的每个结点保存数据和指向下一个结点的指针，插入和删除只需要修改指针。"
+
+
+class _HashEmbedder(EmbeddingProvider):
+    model_id = "test:hash"
+
+    def embed(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        return [[b / 255.0 for b in hashlib.sha256(t.encode("utf-8")).digest()] for t in texts]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store_module, "get_embedding_provider", lambda **_: _HashEmbedder())
+    return VectorStore(db_path=str(tmp_path / "db"), collection_name="dedup_test", api_key="test")
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data = tmp_path / "data"
+    (data / "week1").mkdir(parents=True)
+    (data / "week1" / "intro.txt").write_text(SHARED, encoding="utf-8")
+    (data / "copy.txt").write_text(SHARED, encoding="utf-8")
+    (data / "list.txt").write_text(OTHER, encoding="utf-8")
+    return data
+
+
+def _chunks(data_dir, *names):
+    loader = DocumentLoader(data_dir=str(data_dir))
+    splitter = TextSplitter(chunk_size=500, chunk_overlap=50)
+    documents = []
+    for name in names:
+        documents.extend(loader.load_document(str(data_dir / name)))
+    return splitter.split_documents(documents)
+
+
+def _contents(store, filename):
+    results = store.collection.get(where=store.build_where(filename=filename), include=["documents"])
+    return results["documents"]
+
+
+def test_incremental_add_merges_into_existing_chunk(store, data_dir):
+    store.add_documents(_chunks(data_dir, "week1/intro.txt"))
+    store.add_documents(_chunks(data_dir, "copy.txt"))
+
+    stored = store.search(SHARED, top_k=5)
+    assert len(stored) == 1
+    assert stored[0]["metadata"]["filepath"] == "week1/intro.txt"
+    sources = stored[0]["metadata"]["duplicate_sources"]
+    assert "week1/intro.txt#0" in sources and "copy.txt#0" in sources
+
+
+def test_deleting_stored_copy_reports_files_to_reindex(store, data_dir):
+    store.add_documents(_chunks(data_dir, "week1/intro.txt", "copy.txt", "list.txt"))
+    assert _contents(store, "copy.txt") == []  # only the first copy is stored
+
+    orphaned = store.delete_documents_by_path("week1/intro.txt")
+    assert orphaned == ["copy.txt"]
+
+    for path in orphaned:
+        store.delete_documents_by_path(path)
+    store.add_documents(_chunks(data_dir, *orphaned))
+
+    assert _contents(store, "copy.txt") == [SHARED]
+    assert _contents(store, "intro.txt") == []
+    [result] = [r for r in store.search(SHARED, top_k=5) if r["content"] == SHARED]
+    assert result["metadata"]["filepath"] == "copy.txt"
+    assert "week1/intro.txt#0" not in result["metadata"].get("duplicate_sources", "")
+
+
+def test_deleting_secondary_copy_drops_it_from_sources(store, data_dir):
+    store.add_documents(_chunks(data_dir, "week1/intro.txt", "copy.txt"))
+
+    assert store.delete_documents_by_path("copy.txt") == []
+    [result] = store.search(SHARED, top_k=5)
+    assert "copy.txt#0" not in result["metadata"]["duplicate_sources"]
+
+    # Re-adding the file registers it again instead of storing a second copy.
+    store.add_documents(_chunks(data_dir, "copy.txt"))
+    [result] = store.search(SHARED, top_k=5)
+    assert result["metadata"]["duplicate_sources"].count("copy.txt#0") == 1
@@ -1,9 +1,8 @@
 import os
-from typing import List, Dict
+import time
+from typing import Any, List, Dict, Optional, Tuple
 
-import chromadb
-from chromadb.config import Settings
-from openai import OpenAI
+import numpy as np
 from tqdm import tqdm
 
 from config import (
@@ -13,7 +12,55 @@ from config import (
     OPENAI_API_BASE,
     OPENAI_EMBEDDING_MODEL,
     TOP_K,
+    MMR_LAMBDA,
+    EMBEDDING_BATCH_SIZE,
+    HNSW_SPACE,
+    HNSW_M,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_SEARCH_EF,
 )
+from chunk_schema import DocumentTable
+from dedup import (
+    NearDuplicateIndex,
+    chunk_fingerprint,
+    chunk_sources,
+    merge_near_duplicates,
+    parse_duplicate_sources,
+    source_path,
+)
+from embeddings import get_embedding_provider
+
+
+def mmr_select(
+    query_embedding: List[float],
+    candidate_embeddings: List[List[float]],
+    k: int,
+    mmr_lambda: float = MMR_LAMBDA,
+) -> List[int]:
+    """最大边际相关性（MMR）选择，返回被选中候选的下标（按选择顺序）
+
+    每一步选择 `lambda * sim(query, d) - (1 - lambda) * max sim(d, 已选)` 最大的候选，
+    使结果既与问题相关，又彼此不重复。相似度使用余弦相似度。
+    """
+    if candidate_embeddings is None or len(candidate_embeddings) == 0 or k <= 0:
+        return []
+    cands = np.asarray(candidate_embeddings, dtype=np.float32)
+    cands = cands / np.maximum(np.linalg.norm(cands, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = cands @ query
+    pairwise = cands @ cands.T
+    selected = [int(np.argmax(relevance))]
+    # 每个候选与已选集合的最大相似度，增量维护
+    max_sim = pairwise[selected[0]].copy()
+    while len(selected) < min(k, len(cands)):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * max_sim
+        scores[selected] = -np.inf
+        nxt = int(np.argmax(scores))
+        selected.append(nxt)
+        max_sim = np.maximum(max_sim, pairwise[nxt])
+    return selected
 
 
 class VectorStore:
@@ -24,12 +71,18 @@ class VectorStore:
         collection_name: str = COLLECTION_NAME,
         api_key: str = OPENAI_API_KEY,
         api_base: str = OPENAI_API_BASE,
+        verify_embedding_model: bool = True,
     ):
+        """verify_embedding_model=False 用于即将整体重建collection的场景（重建知识库）"""
         self.db_path = db_path
         self.collection_name = collection_name
 
-        # 初始化OpenAI客户端
-        self.client = OpenAI(api_key=api_key, base_url=api_base)
+        # chromadb 导入较慢，延迟到实例化时再导入，保持模块导入轻量
+        import chromadb
+        from chromadb.config import Settings
+
+        # 初始化embedding提供方（OpenAI兼容接口或本地模型，按config选择，进程内共享）
+        self.embedder = get_embedding_provider(api_key=api_key, api_base=api_base)
 
         # 初始化ChromaDB
         os.makedirs(db_path, exist_ok=True)
@@ -37,64 +90,107 @@ class VectorStore:
             path=db_path, settings=Settings(anonymized_telemetry=False)
         )
 
+        self._filenames: Optional[List[str]] = None
+        # 已入库块的近重复索引（增量写入时去重用），首次写入时从collection构建
+        self._dup_index: Optional[NearDuplicateIndex] = None
+        self._dup_ids: List[str] = []
+
         # 获取或创建collection
         self.collection = self.chroma_client.get_or_create_collection(
-            name=collection_name, metadata={"description": "课程材料向量数据库"}
+            name=collection_name,
+            metadata=self._collection_metadata(),
+            configuration=self._collection_configuration(),
         )
+        if verify_embedding_model:
+            self._check_embedding_model()
+        self._apply_index_settings()
+        # 文件表（紧凑元数据格式）；旧版collection以legacy模式读写
+        self.doc_table = DocumentTable.from_collection(self.collection)
 
-    def get_embedding(self, text: str) -> List[float]:
-        """获取文本的向量表示
+    def _collection_metadata(self) -> Dict[str, Any]:
+        metadata = {"description": "课程向量数据库", "embedding_model": self.embedder.model_id}
+        # 新建的collection一律使用紧凑格式
+        metadata.update(DocumentTable().collection_metadata())
+        return metadata
 
-        TODO: 使用OpenAI API获取文本的embedding向量
-        """
-        text = text.replace("\n", " ")
-        response = self.client.embeddings.create(
-            input=text,
-            model=OPENAI_EMBEDDING_MODEL
-        )
-        return response.data[0].embedding
+    @staticmethod
+    def _collection_configuration() -> Dict[str, Any]:
+        """新建collection时使用的HNSW索引参数（由Chroma随collection持久化）"""
+        return {
+            "hnsw": {
+                "space": HNSW_SPACE,
+                "max_neighbors": HNSW_M,
+                "ef_construction": HNSW_CONSTRUCTION_EF,
+                "ef_search": HNSW_SEARCH_EF,
+            }
+        }
+
+    def index_settings(self) -> Dict[str, Any]:
+        """当前collection实际使用的HNSW参数"""
+        hnsw = (self.collection.configuration or {}).get("hnsw") or {}
+        return {
+            "space": hnsw.get("space"),
+            "M": hnsw.get("max_neighbors"),
+            "construction_ef": hnsw.get("ef_construction"),
+            "search_ef": hnsw.get("ef_search"),
+        }
+
+    def _apply_index_settings(self) -> None:
+        """search_ef 可直接修改已有collection；其余参数只能在建索引时确定，不一致时提示重建"""
+        current = self.index_settings()
+        if current["search_ef"] is not None and current["search_ef"] != HNSW_SEARCH_EF:
+            self.collection.modify(configuration={"hnsw": {"ef_search": HNSW_SEARCH_EF}})
+        wanted = {"space": HNSW_SPACE, "M": HNSW_M, "construction_ef": HNSW_CONSTRUCTION_EF}
+        stale = [f"{k}={current[k]}→{v}" for k, v in wanted.items() if current[k] is not None and current[k] != v]
+        if stale and self.collection.count() > 0:
+            print(f"向量索引参数与配置不一致（{', '.join(stale)}），重建知识库后生效")
+
+    def _check_embedding_model(self) -> None:
+        """校验collection记录的embedding模型与当前配置一致，避免用不同模型的向量检索"""
+        stored = (self.collection.metadata or {}).get("embedding_model")
+        if stored is None:
+            if self.collection.count() == 0:
+                metadata = dict(self.collection.metadata or {})
+                metadata.update(self._collection_metadata())
+                self.collection.modify(metadata=metadata)
+                return
+            # 旧版本建立的collection没有记录模型，均由OpenAI兼容接口生成
+            stored = f"openai:{OPENAI_EMBEDDING_MODEL}"
+        if stored != self.embedder.model_id:
+            raise ValueError(
+                f"向量库 {self.collection_name} 由embedding模型 {stored} 生成，"
+                f"与当前配置的 {self.embedder.model_id} 不一致，请重建知识库"
+            )
+
+    def get_embedding(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        """获取文本的向量表示（timeout 为超时秒数，见 EmbeddingProvider.embed）"""
+        return self.embedder.embed_one(text, timeout=timeout)
+
+    def get_embeddings(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """批量获取文本的向量表示（按EMBEDDING_BATCH_SIZE分批请求/推理）"""
+        if not texts:
+            return []
+        return self.embedder.embed(texts, timeout=timeout)
 
     def add_documents(self, chunks: List[Dict[str, str]]) -> None:
         """添加文档块到向量数据库
-        TODO: 实现文档块添加到向量数据库
-        要求：
-        1. 遍历文档块
-        2. 获取文档块内容
-        3. 获取文档块元数据
-        5. 打印添加进度
+
+        近重复的块只存一次（如多份讲义中相同的标题页）：先在这批块内部合并，再与库中已有的块比较，
+        与已有块重复的不再写入，其来源追加到已有块的 `duplicate_sources` 中。
+        其余块登记到文件表后批量计算embedding（使用含页眉的完整原文）并写入。
         """
-        ids = []
-        documents = []
-        metadatas = []
         embeddings = []
 
-        for i, chunk in enumerate(tqdm(chunks, desc="添加文档到向量库", unit="chunk")):
-            content = chunk.get("content", "")
-            if not content:
-                continue
-                
-            # 准备metadata (移除content字段，处理不支持的类型)
-            metadata = chunk.copy()
-            if "content" in metadata:
-                del metadata["content"]
-            
-            # 处理images列表，转换为字符串，因为Chroma不支持列表类型的metadata
-            if "images" in metadata and isinstance(metadata["images"], list):
-                metadata["images"] = str(metadata["images"])
-                
-            # 生成唯一ID
-            # 使用文件名_chunkID_索引作为ID，确保唯一性
-            filename = metadata.get("filename", "unknown")
-            chunk_id = metadata.get("chunk_id", i)
-            doc_id = f"{filename}_{chunk_id}_{i}"
-            
-            # 获取embedding
-            embedding = self.get_embedding(content)
-            
-            ids.append(doc_id)
-            documents.append(content)
-            metadatas.append(metadata)
-            embeddings.append(embedding)
+        chunks = merge_near_duplicates(chunks)
+        chunks = self._merge_into_existing(chunks)
+
+        # 生成ID和元数据：文件信息登记到文件表，块元数据只存文件ID/页码/块序号
+        ids, documents, metadatas, texts = self.doc_table.encode_chunks(chunks)
+
+        # 批量获取embedding（使用含页眉的完整原文）
+        batch_size = EMBEDDING_BATCH_SIZE
+        for start in tqdm(range(0, len(texts), batch_size), desc="添加文档到向量库", unit="batch"):
+            embeddings.extend(self.get_embeddings(texts[start : start + batch_size]))
 
         # 批量添加到ChromaDB
         if ids:
@@ -104,28 +200,95 @@ class VectorStore:
                 metadatas=metadatas,
                 embeddings=embeddings
             )
+            self.doc_table.save(self.collection)
+            self._filenames = None
+            for chunk_id, text in zip(ids, texts):
+                self._index_fingerprint(chunk_id, chunk_fingerprint(text))
             print(f"成功添加 {len(ids)} 个文档块到向量数据库")
 
-    def search(self, query: str, top_k: int = TOP_K) -> List[Dict]:
+    def _near_duplicate_index(self) -> NearDuplicateIndex:
+        if self._dup_index is None:
+            self._dup_index, self._dup_ids = NearDuplicateIndex(), []
+            existing = self.collection.get(include=["documents", "metadatas"])
+            for chunk_id, doc, meta in zip(existing["ids"], existing["documents"], existing["metadatas"]):
+                content, _meta = self.doc_table.decode(doc, meta)
+                self._index_fingerprint(chunk_id, chunk_fingerprint(content or ""))
+        return self._dup_index
+
+    def _index_fingerprint(self, chunk_id: str, fingerprint: Optional[int]) -> None:
+        if self._dup_index is not None and fingerprint is not None:
+            self._dup_index.add(fingerprint)
+            self._dup_ids.append(chunk_id)
+
+    def _merge_into_existing(self, chunks: List[Dict]) -> List[Dict]:
+        """去掉与库中已有块近重复的块（来源并入已有块），返回需要写入的块"""
+        if not chunks or self.collection.count() == 0:
+            return chunks
+        index = self._near_duplicate_index()
+        fresh: List[Dict] = []
+        merged: Dict[str, List[str]] = {}
+        for chunk in chunks:
+            fingerprint = chunk_fingerprint(chunk.get("content", ""))
+            match = index.find(fingerprint) if fingerprint is not None else None
+            if match is None:
+                fresh.append(chunk)
+            else:
+                merged.setdefault(self._dup_ids[match], []).extend(chunk_sources(chunk))
+        if merged:
+            existing = self.collection.get(ids=list(merged), include=["documents", "metadatas"])
+            ids, metadatas = [], []
+            for chunk_id, doc, meta in zip(existing["ids"], existing["documents"], existing["metadatas"]):
+                sources = chunk_sources(self.doc_table.decode(doc, meta)[1])
+                sources += [s for s in merged[chunk_id] if s not in sources]
+                ids.append(chunk_id)
+                metadatas.append(self.doc_table.with_duplicate_sources(meta, sources))
+            self.collection.update(ids=ids, metadatas=metadatas)
+            print(f"{sum(len(v) for v in merged.values())} 个来源与已入库的块重复，已合并")
+        return fresh
+
+    def search(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        fetch_k: Optional[int] = None,
+        mmr_lambda: float = MMR_LAMBDA,
+        filename: Optional[str] = None,
+        filetype: Optional[str] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        query_embedding: Optional[List[float]] = None,
+        timeout: Optional[float] = None,
+    ) -> List[Dict]:
         """搜索相关文档
 
-        TODO: 实现向量相似度搜索
-        要求：
-        1. 首先获取查询文本的embedding向量（调用self.get_embedding）
-        2. 使用self.collection进行向量搜索, 得到top_k个结果
-        3. 格式化返回结果，每个结果包含：
-           - content: 文档内容
-           - metadata: 元数据（文件名、页码等）
-        4. 返回格式化的结果列表
+        fetch_k 大于 top_k 时，先取 fetch_k 个候选及其向量，再用MMR选出 top_k 个，
+        避免结果被几乎相同的块（重复的标题页、页眉等）占满。
+        filename / filetype / page_range（闭区间）用于限定检索范围，作为Chroma的where条件下推。
+        query_embedding 为预先计算好的问题向量（如批量计算），传入时跳过embedding调用；
+        否则计算问题向量，timeout 为该embedding调用的超时秒数。
+
+        返回按相关性排序的结果列表，每项包含 id、content（带页眉的原文）、
+        metadata（文件名、页码等完整元数据）和 distance（向量距离）。
         """
         # 1. 获取查询向量
-        query_embedding = self.get_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.get_embedding(query, timeout=timeout)
         
         # 2. 搜索
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
-        )
+        where = self.build_where(filename=filename, filetype=filetype, page_range=page_range)
+        use_mmr = fetch_k is not None and fetch_k > top_k
+        if use_mmr:
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=fetch_k,
+                where=where,
+                include=["documents", "metadatas", "embeddings", "distances"],
+            )
+        else:
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=top_k,
+                where=where,
+            )
         
         # 3. 格式化结果
         formatted_results = []
@@ -134,11 +297,23 @@ class VectorStore:
         if results and results['documents']:
             documents = results['documents'][0]
             metadatas = results['metadatas'][0] if results['metadatas'] else [{}] * len(documents)
+            ids = results['ids'][0]
+            distances = results['distances'][0] if results.get('distances') else [None] * len(documents)
+
+            if use_mmr and results.get('embeddings') is not None:
+                order = mmr_select(query_embedding, results['embeddings'][0], top_k, mmr_lambda)
+                documents = [documents[i] for i in order]
+                metadatas = [metadatas[i] for i in order]
+                ids = [ids[i] for i in order]
+                distances = [distances[i] for i in order]
             
-            for doc, meta in zip(documents, metadatas):
+            for doc_id, doc, meta, distance in zip(ids, documents, metadatas, distances):
+                doc, meta = self.doc_table.decode(doc, meta)
                 formatted_results.append({
+                    "id": doc_id,
                     "content": doc,
-                    "metadata": meta
+                    "metadata": meta,
+                    "distance": distance,  # 跨collection（多课程）合并结果时使用
                 })
 
         return formatted_results
@@ -147,10 +322,174 @@ class VectorStore:
         """清空collection"""
         self.chroma_client.delete_collection(name=self.collection_name)
         self.collection = self.chroma_client.create_collection(
-            name=self.collection_name, metadata={"description": "课程向量数据库"}
+            name=self.collection_name,
+            metadata=self._collection_metadata(),
+            configuration=self._collection_configuration(),
         )
+        self.doc_table = DocumentTable()
+        self._filenames = None
+        self._dup_index = None
         print("向量数据库已清空")
 
+    def build_where(
+        self,
+        filename: Optional[str] = None,
+        filetype: Optional[str] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """根据过滤条件构造Chroma的where子句，无条件时返回None（文件名经文件表映射为文件ID）"""
+        return self.doc_table.where(filename=filename, filetype=filetype, page_range=page_range)
+
+    def get_page(self, filename: str, page_number: int) -> List[Dict]:
+        """直接按文件名和页码取文档块，不需要embedding调用"""
+        results = self.collection.get(
+            where=self.build_where(filename=filename, page_range=(page_number, page_number)),
+            include=["documents", "metadatas"],
+        )
+        pages = []
+        for doc_id, doc, meta in zip(results["ids"], results["documents"], results["metadatas"]):
+            doc, meta = self.doc_table.decode(doc, meta)
+            pages.append({"id": doc_id, "content": doc, "metadata": meta})
+        return pages
+
+    def list_filenames(self) -> List[str]:
+        """已入库的文件名列表（缓存，写入/删除/切换collection时失效）"""
+        if self._filenames is None:
+            if self.doc_table.legacy:
+                self._filenames = sorted(self.get_file_chunk_counts())
+            else:
+                self._filenames = self.doc_table.filenames()
+        return self._filenames
+
+    def delete_documents_by_path(self, filepath: str) -> List[str]:
+        """删除某个文件的全部文档块（用于增量更新），filepath 为相对数据目录的路径
+
+        近重复内容只存在第一个出现的文件中；删除这些块后，其他文件的这部分内容也随之消失。
+        返回这些文件的路径，调用方应重新索引它们。其他块来源中的该文件同时移除。
+        """
+        where = self.doc_table.where(filepath=filepath)
+        owned = self.collection.get(where=where, include=["metadatas"])
+        orphaned: List[str] = []
+        for meta in owned["metadatas"]:
+            for source in parse_duplicate_sources(self.doc_table.decode("", meta)[1]):
+                path = source_path(source)
+                if path != filepath and path not in orphaned:
+                    orphaned.append(path)
+        self.collection.delete(where=where)
+        self._forget_duplicate_source(filepath)
+        if not self.doc_table.legacy:
+            self.doc_table.remove(filepath)
+            self.doc_table.save(self.collection)
+        self._filenames = None
+        self._dup_index = None
+        return orphaned
+
+    def _forget_duplicate_source(self, filepath: str) -> None:
+        """从其他块的近重复来源中移除已删除的文件（文件修改后重新写入时会重新登记）"""
+        existing = self.collection.get(include=["metadatas"])
+        ids, metadatas = [], []
+        for chunk_id, meta in zip(existing["ids"], existing["metadatas"]):
+            sources = parse_duplicate_sources(self.doc_table.decode("", meta)[1])
+            kept = [s for s in sources if source_path(s) != filepath]
+            if len(kept) < len(sources):
+                ids.append(chunk_id)
+                metadatas.append(self.doc_table.with_duplicate_sources(meta, kept))
+        if ids:
+            self.collection.update(ids=ids, metadatas=metadatas)
+
+    def create_shadow_collection(self, resume: bool = False) -> Any:
+        """创建影子collection：重建时写入影子collection，线上collection继续提供检索
+
+        resume=True 时沿用已存在的影子collection（中断的重建从断点继续，已写入的向量不必重算）；
+        已有的影子collection由其他embedding模型生成时不能沿用，删除后新建（调用方据此从头写入）。
+        """
+        shadow_name = f"{self.collection_name}__shadow"
+        if resume:
+            shadow = self.chroma_client.get_or_create_collection(
+                name=shadow_name,
+                metadata=self._collection_metadata(),
+                configuration=self._collection_configuration(),
+            )
+            if (shadow.metadata or {}).get("embedding_model") == self.embedder.model_id:
+                return shadow
+            print(f"影子collection由embedding模型 {(shadow.metadata or {}).get('embedding_model')} 生成，重新创建")
+        self.drop_collection(shadow_name)
+        return self.chroma_client.create_collection(
+            name=shadow_name,
+            metadata=self._collection_metadata(),
+            configuration=self._collection_configuration(),
+        )
+
+    def swap_in(self, shadow: Any) -> Optional[str]:
+        """将影子collection切换为线上collection
+
+        旧collection被重命名为 `<name>__retired_<ms>` 而不是立即删除，
+        以免正在进行的检索失败；返回其名称，由调用方稍后删除。
+        """
+        retired_name = None
+        try:
+            live = self.chroma_client.get_collection(name=self.collection_name)
+        except Exception:
+            live = None
+        if live is not None:
+            retired_name = f"{self.collection_name}__retired_{int(time.time() * 1000)}"
+            live.modify(name=retired_name)
+        shadow.modify(name=self.collection_name)
+        self.collection = shadow
+        self.doc_table = DocumentTable.from_collection(shadow)
+        self._filenames = None
+        self._dup_index = None
+        return retired_name
+
+    def drop_collection(self, name: str) -> None:
+        """删除指定collection（不存在时忽略）"""
+        try:
+            self.chroma_client.delete_collection(name=name)
+        except Exception:
+            pass
+
+    def drop_retired_collections(self) -> None:
+        """清理此前切换遗留的旧collection（例如进程在后台删除前退出）"""
+        prefix = f"{self.collection_name}__retired_"
+        for collection in self.chroma_client.list_collections():
+            name = getattr(collection, "name", collection)
+            if name.startswith(prefix):
+                self.drop_collection(name)
+
     def get_collection_count(self) -> int:
         """获取collection中的文档数量"""
         return self.collection.count()
+
+    def warm_up(self) -> None:
+        """预热：加载HNSW索引段，并完成一次查询embedding（建立到embedding服务的连接）"""
+        sample = self.collection.get(limit=1, include=["embeddings"])
+        embeddings = sample.get("embeddings")
+        if embeddings is None or len(embeddings) == 0:
+            return
+        # 用库中已有的向量查询一次，触发HNSW索引加载，不依赖网络
+        self.collection.query(query_embeddings=[list(embeddings[0])], n_results=1)
+        self.get_embedding("warm up")
+
+    def get_file_chunk_counts(self) -> Dict[str, int]:
+        """统计每个文件在collection中的文档块数量"""
+        result = self.collection.get(include=["metadatas"])
+        counts: Dict[str, int] = {}
+        for meta in result.get("metadatas") or []:
+            meta = meta or {}
+            if "doc" in meta:
+                filename = self.doc_table.entries.get(meta["doc"], ["unknown"])[0]
+            else:
+                filename = meta.get("filename", "unknown")
+            counts[filename] = counts.get(filename, 0) + 1
+        return counts
+
+    def get_disk_usage(self) -> int:
+        """获取向量数据库目录占用的磁盘空间（字节）"""
+        total = 0
+        for root, _dirs, files in os.walk(self.db_path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+        return total